@@ -0,0 +1,230 @@
+from typing import Dict, Any, Optional, List, Iterator
+
+import numpy as np
+
+from app.db.database import ArangoDBConnection
+from app.db.bulk_writer import bulk_import
+from app.db.repositories import (
+    Storage, VideoRepository, FrameRepository, ExerciseRepository, ModelRepository, SessionRepository, key_of
+)
+from app.services import frame_blocks, embedding_store, aggregates, score_sketch
+from app.services.replication import append_change
+
+# ArangoDB implementation of the repositories (see repositories.py).
+# Every write of a replicated collection also appends to the replication outbox.
+
+# Page size of streamed history exports
+HISTORY_EXPORT_BATCH_SIZE = 1000
+
+# Newest first; (timestamp, _key) is a total order, so keyset pages never skip or repeat rows.
+# Served by the [_from, timestamp, _key] index on Session: every FOR below is an equality on
+# _from (and timestamp) plus one range, read in reverse index order, so a page reads at most
+# `limit` rows per branch however long the user's history is. The hint keeps the optimizer
+# from picking the edge index on _from, which cannot serve the sort.
+HISTORY_ROW_AQL = """
+    LET exercise = DOCUMENT(s._to)
+    RETURN {
+        "session_id": s._key,
+        "timestamp": s.timestamp,
+        "score": s.score,
+        "exercise_name": exercise.name,
+        "exercise_id": exercise._key,
+        "video_id": s.user_video_id,
+        "model_type": s.model_type
+    }
+"""
+# First page, and the unbounded streamed export
+HISTORY_FIRST_PAGE_AQL = """
+FOR s IN Session OPTIONS { indexHint: "session_history" }
+    FILTER s._from == @user_id
+    SORT s.timestamp DESC, s._key DESC
+    LIMIT @limit
+""" + HISTORY_ROW_AQL
+HISTORY_EXPORT_AQL = """
+FOR s IN Session OPTIONS { indexHint: "session_history" }
+    FILTER s._from == @user_id
+    SORT s.timestamp DESC, s._key DESC
+""" + HISTORY_ROW_AQL
+# Next pages: "older than the cursor" is split into the cursor's timestamp with smaller keys,
+# then strictly older timestamps. Both branches are already in page order, so they are
+# concatenated rather than merged.
+HISTORY_NEXT_PAGE_AQL = """
+LET tied = (
+    FOR s IN Session OPTIONS { indexHint: "session_history" }
+        FILTER s._from == @user_id AND s.timestamp == @cursor_ts AND s._key < @cursor_key
+        SORT s.timestamp DESC, s._key DESC
+        LIMIT @limit
+        RETURN s
+)
+LET older = (
+    FOR s IN Session OPTIONS { indexHint: "session_history" }
+        FILTER s._from == @user_id AND s.timestamp < @cursor_ts
+        SORT s.timestamp DESC, s._key DESC
+        LIMIT @limit
+        RETURN s
+)
+FOR s IN APPEND(tied, older)
+    LIMIT @limit
+""" + HISTORY_ROW_AQL
+
+class _ArangoRepository:
+    def __init__(self, db=None):
+        self._db = db
+
+    @property
+    def db(self):
+        return self._db or ArangoDBConnection().get_db()
+
+    def _get(self, collection: str, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            return self.db.collection(collection).get(key)
+        except Exception:
+            return None
+
+class ArangoVideoRepository(_ArangoRepository, VideoRepository):
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("Video", video_id)
+
+    def save(self, doc: Dict[str, Any]):
+        self.db.collection("Video").insert(doc, overwrite=True)
+        append_change(self.db, "Video", [doc["_key"]])
+
+    def update(self, video_id: str, fields: Dict[str, Any], replicate: bool = True):
+        self.db.collection("Video").update(dict(fields, _key=video_id))
+        if replicate:
+            append_change(self.db, "Video", [video_id])
+
+    def find_reference(self, exercise_id: str) -> Optional[str]:
+        aql = """
+        FOR v IN Video
+            FILTER v.exercise_id == @ex_id AND v.is_reference == true
+            LIMIT 1
+            RETURN v.video_id
+        """
+        for video_id in self.db.aql.execute(aql, bind_vars={"ex_id": exercise_id}):
+            return video_id
+        return None
+
+    def list_references(self, exercise_id: str) -> List[Dict[str, Any]]:
+        aql = """
+        FOR v IN Video
+            FILTER v.exercise_id == @eid AND v.is_reference == true
+            RETURN v
+        """
+        return list(self.db.aql.execute(aql, bind_vars={"eid": exercise_id}))
+
+class ArangoFrameRepository(_ArangoRepository, FrameRepository):
+    def write_chunk(self, video_id: str, chunk: List[tuple], storage_format: str, fps: float, block_size: int):
+        frames = [frame for frame, _ in chunk]
+        if storage_format == "block":
+            # One FrameBlock per chunk; edges are not stored, frame order is implied by block_index/start_frame
+            start_frame = frames[0]["frame_number"]
+            has_embeddings = any(f["embeded_vector"] is not None for f in frames)
+            block_doc = frame_blocks.build_frame_block(
+                video_id, start_frame // block_size, start_frame, fps,
+                [f["pose_landmark"] for f in frames],
+                [f["embeded_vector"] for f in frames] if has_embeddings else None
+            )
+            self.db.collection("FrameBlock").insert(block_doc, overwrite=True)
+            # Mirrored to OrientDB by the outbox replicator
+            append_change(self.db, "FrameBlock", [block_doc["_key"]])
+            return
+
+        edges = [edge for _, edge in chunk if edge is not None]
+        bulk_import(self.db.collection("Frame"), frames, on_duplicate="update")
+        if edges:
+            bulk_import(self.db.collection("FrameEdge"), edges, on_duplicate="update")
+        # Mirrored to OrientDB (frames and their incoming edges) by the outbox replicator
+        append_change(self.db, "Frame", [f["_key"] for f in frames])
+
+    def load_embeddings(self, video_id: str) -> np.ndarray:
+        return frame_blocks.load_embeddings(self.db, video_id)
+
+    def load_landmarks(self, video_id: str) -> np.ndarray:
+        return frame_blocks.load_landmark_array(self.db, video_id)
+
+    def update_embeddings(self, video_id: str, embeddings: List[Optional[List[float]]]) -> int:
+        return frame_blocks.update_embeddings(self.db, video_id, embeddings)
+
+    def save_embedding_matrix(self, video_id: str, model_path: str, matrix: np.ndarray):
+        embedding_store.save_video_embeddings(self.db, video_id, model_path, matrix)
+
+    def get_embedding_matrix(self, video_id: str, model_path: str) -> Optional[np.ndarray]:
+        return embedding_store.get_embedding_matrix(self.db, video_id, model_path)
+
+class ArangoExerciseRepository(_ArangoRepository, ExerciseRepository):
+    def get(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("Exercise", key_of(exercise_id))
+
+    def save(self, doc: Dict[str, Any]):
+        self.db.collection("Exercise").insert(doc, overwrite=True)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return list(self.db.collection("Exercise").all())
+
+class ArangoModelRepository(_ArangoRepository, ModelRepository):
+    def save(self, doc: Dict[str, Any]):
+        if not self.db.has_collection("Model"):
+            self.db.create_collection("Model")
+        self.db.collection("Model").insert(doc)
+
+    def latest_for_exercise(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        aql = """
+        FOR m IN Model
+            FILTER m.exercise_id == @eid
+            SORT m.created_at DESC
+            LIMIT 1
+            RETURN m
+        """
+        cursor = self.db.aql.execute(aql, bind_vars={"eid": exercise_id})
+        return None if cursor.empty() else cursor.next()
+
+class ArangoSessionRepository(_ArangoRepository, SessionRepository):
+    def record(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        # Session edge + ExerciseUserStats / ExerciseRank / ScoreSketch aggregates in one transaction
+        return aggregates.record_session(self.db, session_data)
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return self._get("Session", session_id)
+
+    def history_page(self, user_id: str, cursor_ts: Optional[str], cursor_key: Optional[str],
+                     limit: int) -> List[Dict[str, Any]]:
+        if cursor_ts is None:
+            return list(self.db.aql.execute(HISTORY_FIRST_PAGE_AQL, bind_vars={"user_id": user_id, "limit": limit}))
+        return list(self.db.aql.execute(HISTORY_NEXT_PAGE_AQL, bind_vars={
+            "user_id": user_id, "cursor_ts": cursor_ts, "cursor_key": cursor_key, "limit": limit
+        }))
+
+    def iter_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        # Streaming server-side cursor (constant memory)
+        cursor = self.db.aql.execute(
+            HISTORY_EXPORT_AQL,
+            bind_vars={"user_id": user_id},
+            batch_size=HISTORY_EXPORT_BATCH_SIZE,
+            stream=True
+        )
+        try:
+            for row in cursor:
+                yield row
+        finally:
+            cursor.close(ignore_missing=True)
+
+    def user_exercise_stats(self, exercise_id: str, user_id: str) -> Dict[str, Any]:
+        return aggregates.get_user_exercise_stats(self.db, exercise_id, user_id)
+
+    def leaderboard(self, exercise_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        return aggregates.get_leaderboard(self.db, exercise_id, limit)
+
+    def score_sketch(self, exercise_id: str, model_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        return score_sketch.get_sketch(self.db, exercise_id, model_version)
+
+class ArangoStorage(Storage):
+    def __init__(self, db=None):
+        super().__init__(
+            "arango",
+            videos=ArangoVideoRepository(db),
+            frames=ArangoFrameRepository(db),
+            exercises=ArangoExerciseRepository(db),
+            models=ArangoModelRepository(db),
+            sessions=ArangoSessionRepository(db)
+        )
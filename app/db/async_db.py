@@ -0,0 +1,61 @@
+import functools
+from typing import Any, Callable, Dict, List, Optional
+
+import anyio
+import anyio.to_thread
+
+from app.db.database import DB_POOL_SIZE
+
+# python-arango (and requests) block the calling thread. Async route handlers must not call
+# them directly or one slow query stalls the event loop for every concurrent request.
+# These helpers run blocking DB work on worker threads. DB work is capped at DB_POOL_SIZE
+# threads, the size of the ArangoDB HTTP connection pool, so offloaded calls never queue
+# inside the HTTP client waiting for a connection; excess calls wait here, without blocking the loop.
+
+_db_limiter: Optional[anyio.CapacityLimiter] = None
+
+def _limiter() -> anyio.CapacityLimiter:
+    # Created lazily: a CapacityLimiter must be created inside the running event loop
+    global _db_limiter
+    if _db_limiter is None:
+        _db_limiter = anyio.CapacityLimiter(DB_POOL_SIZE)
+    return _db_limiter
+
+async def run_db(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Awaits a blocking database call (python-arango, OrientDB REST) on the DB thread pool.
+    """
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_limiter())
+
+async def run_blocking(func: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Awaits other blocking work (password hashing, outbound HTTP) on anyio's default thread pool.
+    """
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs))
+
+async def aql_all(db, query: str, bind_vars: Optional[Dict[str, Any]] = None, **kwargs) -> List[Any]:
+    """
+    Runs an AQL query off the event loop and returns all results (cursor batches included).
+    """
+    return await run_db(lambda: list(db.aql.execute(query, bind_vars=bind_vars, **kwargs)))
+
+async def aql_first(db, query: str, bind_vars: Optional[Dict[str, Any]] = None, **kwargs) -> Any:
+    """
+    Runs an AQL query off the event loop and returns its first result, or None.
+    """
+    def first():
+        for doc in db.aql.execute(query, bind_vars=bind_vars, **kwargs):
+            return doc
+        return None
+    return await run_db(first)
+
+async def get_document(db, collection: str, key: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetches a document by key off the event loop. Invalid keys and missing documents give None.
+    """
+    def get():
+        try:
+            return db.collection(collection).get(key)
+        except Exception:
+            return None
+    return await run_db(get)
@@ -0,0 +1,144 @@
+import os
+import json
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Iterator
+
+from arango.exceptions import ArangoError
+
+from app.db.database import DB_POOL_SIZE
+
+# Shared bulk writer: every import_bulk in the code base goes through bulk_import.
+#
+# Documents are split into chunks bounded by count (BULK_CHUNK_SIZE) and by approximate JSON
+# size (BULK_CHUNK_BYTES), so no request body or server-side transaction grows with the input.
+# Chunks are sent in parallel on the pooled HTTP connections of the ArangoDB client (at most
+# BULK_WORKERS at a time, never more than DB_POOL_SIZE), and their counters are summed.
+#
+# A chunk that raises (connection error, timeout, halt_on_error abort) is retried with
+# exponential backoff when replaying it is harmless, i.e. for on_duplicate update / replace /
+# ignore. With on_duplicate="error" a replay would report the first attempt's inserts as
+# conflicts, so such chunks fail after one attempt. Chunks are not ordered relative to each
+# other: a key should appear at most once per call.
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", os.getenv("IMPORT_BATCH_SIZE", "500")))
+BULK_CHUNK_BYTES = int(os.getenv("BULK_CHUNK_BYTES", str(4 * 1024 * 1024)))
+BULK_WORKERS = max(1, min(int(os.getenv("BULK_WORKERS", "4")), DB_POOL_SIZE))
+BULK_MAX_RETRIES = int(os.getenv("BULK_MAX_RETRIES", "3"))
+BULK_RETRY_BACKOFF = float(os.getenv("BULK_RETRY_BACKOFF", "0.5"))  # Seconds, doubled per attempt (+ jitter)
+
+ON_DUPLICATE_STRATEGIES = ("error", "update", "replace", "ignore")
+_IDEMPOTENT_STRATEGIES = ("update", "replace", "ignore")
+_COUNTERS = ("created", "updated", "ignored", "empty", "errors")
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+class BulkWriteError(Exception):
+    """
+    Raised by bulk_import when chunks still failed after their retries.
+    `result` holds the aggregated counters, including what was written.
+    """
+    def __init__(self, message: str, result: Dict[str, Any]):
+        super().__init__(message)
+        self.result = result
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="bulk-writer")
+        return _executor
+
+def _json_size(doc: Dict[str, Any]) -> int:
+    return len(json.dumps(doc, default=str))
+
+def chunk_documents(docs: List[Dict[str, Any]], max_docs: int = None, max_bytes: int = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Yields consecutive slices of `docs` with at most `max_docs` documents and roughly at most
+    `max_bytes` of JSON (a single larger document still forms its own chunk).
+    """
+    max_docs = max_docs or BULK_CHUNK_SIZE
+    max_bytes = max_bytes or BULK_CHUNK_BYTES
+    chunk, size = [], 0
+    for doc in docs:
+        doc_size = _json_size(doc)
+        if chunk and (len(chunk) >= max_docs or size + doc_size > max_bytes):
+            yield chunk
+            chunk, size = [], 0
+        chunk.append(doc)
+        size += doc_size
+    if chunk:
+        yield chunk
+
+def _import_chunk(collection, chunk: List[Dict[str, Any]], options: Dict[str, Any], retries: int) -> Dict[str, Any]:
+    attempt = 0
+    while True:
+        try:
+            return collection.import_bulk(chunk, **options)
+        except (ArangoError, ConnectionError, OSError) as e:
+            if attempt >= retries:
+                raise
+            delay = BULK_RETRY_BACKOFF * (2 ** attempt)
+            print(f"[BulkWriter] {collection.name}: chunk of {len(chunk)} failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay + random.uniform(0, delay))
+            attempt += 1
+
+def bulk_import(collection, docs: List[Dict[str, Any]], on_duplicate: str = "error", chunk_size: int = None,
+                max_bytes: int = None, parallel: bool = True, retries: int = None, halt_on_error: bool = True,
+                raise_on_error: bool = True, **options) -> Dict[str, Any]:
+    """
+    Imports `docs` into `collection` (a python-arango collection) in parallel, size-bounded chunks.
+    Returns {"created", "updated", "ignored", "empty", "errors", "chunks", "failed_chunks"};
+    with raise_on_error, chunks that failed after their retries raise BulkWriteError.
+    `parallel=False` writes the chunks one after another in the caller's thread.
+    Extra keyword arguments are passed to import_bulk (e.g. details, overwrite, sync).
+    """
+    if on_duplicate not in ON_DUPLICATE_STRATEGIES:
+        raise ValueError(f"on_duplicate must be one of {ON_DUPLICATE_STRATEGIES}")
+    result = {name: 0 for name in _COUNTERS}
+    result.update({"chunks": 0, "failed_chunks": 0})
+    if not docs:
+        return result
+
+    if retries is None:
+        retries = BULK_MAX_RETRIES if on_duplicate in _IDEMPOTENT_STRATEGIES else 0
+    options = dict(options, on_duplicate=on_duplicate, halt_on_error=halt_on_error)
+    chunks = list(chunk_documents(docs, chunk_size, max_bytes))
+    result["chunks"] = len(chunks)
+
+    if len(chunks) == 1 or not parallel:
+        outcomes = []
+        for chunk in chunks:
+            try:
+                outcomes.append(_import_chunk(collection, chunk, options, retries))
+            except Exception as e:
+                outcomes.append(e)
+    else:
+        # The shared executor bounds concurrency across all callers to BULK_WORKERS connections
+        futures = [_get_executor().submit(_import_chunk, collection, chunk, options, retries) for chunk in chunks]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append(e)
+
+    error = None
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            result["failed_chunks"] += 1
+            error = error or outcome
+            continue
+        for name in _COUNTERS:
+            result[name] += outcome.get(name, 0)
+        if outcome.get("details"):
+            result.setdefault("details", []).extend(outcome["details"])
+
+    if error is not None and raise_on_error:
+        raise BulkWriteError(
+            f"{result['failed_chunks']} of {result['chunks']} chunks failed importing into {collection.name}: {error}",
+            result
+        ) from error
+    return result
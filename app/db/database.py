@@ -12,6 +12,10 @@ ARANGODB_USERNAME = os.getenv("ARANGODB_USERNAME", "root")
 ARANGODB_PASSWORD = os.getenv("ARANGODB_PASSWORD", "3946") # Updated Password
 DB_NAME = os.getenv("DB_NAME", "DB_DB") # Updated Database Name
 
+# HTTP connections kept per process. Also caps concurrent offloaded DB calls in async
+# handlers (app/db/async_db.py), so size it to the expected per-worker concurrency.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+
 class ArangoDBConnection:
     """
     A Singleton class to handle ArangoDB connections with robust retry logic
@@ -37,8 +41,8 @@ class ArangoDBConnection:
         http_client = DefaultHTTPClient(
             retry_attempts=3,
             backoff_factor=1,
-            pool_connections=10,
-            pool_maxsize=10
+            pool_connections=DB_POOL_SIZE,
+            pool_maxsize=DB_POOL_SIZE
         )
         
         print(f"[Database] Connecting to ArangoDB at {ARANGODB_HOST}...")
@@ -67,7 +67,8 @@ def init_db():
 
     # 3. Video
     # Fields: video_id (PK), uploader_user_id, exercise_id, upload_time, 
-    #         fps, frame_count, embedding_dimension
+    #         fps, frame_count, embedding_dimension, status, frame_storage, frame_edges,
+    #         storage_tier, hot_rows_purged (retention: frames moved to FrameArchive)
     video_schema = {
         "rule": {
             "type": "object",
@@ -77,7 +78,12 @@ def init_db():
                 "upload_time": {"type": "string"},
                 "fps": {"type": "number"},
                 "frame_count": {"type": "integer"},
-                "embedding_dimension": {"type": "integer"}
+                "embedding_dimension": {"type": "integer"},
+                "status": {"enum": ["processing", "embedded", "complete", "failed"]},
+                "frame_storage": {"enum": ["frame", "block"]},
+                "frame_edges": {"enum": ["materialized", "derived"]},
+                "storage_tier": {"enum": ["hot", "cold"]},
+                "hot_rows_purged": {"type": "boolean"}
             },
             "required": ["uploader_user_id", "upload_time"]
         },
@@ -109,6 +115,77 @@ def init_db():
         "message": "Start validation for Frame collection"
     }
     
+    # 4b. FrameBlock
+    # Fields: video_id, block_index, start_frame, frame_count, fps, dtype,
+    #         landmarks (base64 (N, 33, 4)), embeddings (base64 (N, 128)), embedding_mask (base64 (N,))
+    frame_block_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "video_id": {"type": "string"},
+                "block_index": {"type": "integer"},
+                "start_frame": {"type": "integer"},
+                "frame_count": {"type": "integer"},
+                "fps": {"type": "number"},
+                "dtype": {"enum": ["float16", "float32"]},
+                "landmarks": {"type": "string"},
+                "embeddings": {"type": ["string", "null"]},
+                "embedding_mask": {"type": ["string", "null"]}
+            },
+            "required": ["video_id", "block_index", "start_frame", "frame_count", "dtype", "landmarks"]
+        },
+        "level": "moderate",
+        "message": "Start validation for FrameBlock collection"
+    }
+    
+    # 4c. FrameArchive (cold tier)
+    # Key: video_id. Fields: video_id, frame_count, fps, dtype, codec, level, raw_bytes, compressed_bytes,
+    #      archived_at, landmarks (base64 zstd (T, 33, 4)), embeddings (base64 zstd (T, 128)),
+    #      embedding_mask (base64 zstd (T,))
+    frame_archive_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "video_id": {"type": "string"},
+                "frame_count": {"type": "integer"},
+                "fps": {"type": "number"},
+                "dtype": {"enum": ["float16", "float32"]},
+                "codec": {"enum": ["zstd"]},
+                "level": {"type": "integer"},
+                "raw_bytes": {"type": "integer"},
+                "compressed_bytes": {"type": "integer"},
+                "archived_at": {"type": "string"},
+                "landmarks": {"type": "string"},
+                "embeddings": {"type": ["string", "null"]},
+                "embedding_mask": {"type": ["string", "null"]}
+            },
+            "required": ["video_id", "frame_count", "dtype", "codec", "landmarks"]
+        },
+        "level": "moderate",
+        "message": "Start validation for FrameArchive collection"
+    }
+    
+    # 4d. VideoEmbedding
+    # Key: <video_id>_<model_version>. Fields: video_id, model_version, model_path, count, dim, dtype,
+    #      data (base64 little-endian (count, dim) float32 matrix of the non-null embeddings)
+    video_embedding_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "video_id": {"type": "string"},
+                "model_version": {"type": "string"},
+                "model_path": {"type": "string"},
+                "count": {"type": "integer", "minimum": 0},
+                "dim": {"type": "integer"},
+                "dtype": {"enum": ["float32"]},
+                "data": {"type": "string"}
+            },
+            "required": ["video_id", "model_version", "count", "dim", "dtype", "data"]
+        },
+        "level": "moderate",
+        "message": "Start validation for VideoEmbedding collection"
+    }
+    
     # 5. Model
     # Fields: model_id (PK), model_type, description, model_version, created_at, model_path, exercise_id
     model_schema = {
@@ -142,6 +219,98 @@ def init_db():
         "message": "Start validation for Session collection"
     }
 
+    # 6b. ExerciseUserStats / ExerciseRank (aggregates maintained with each Session insert)
+    # ExerciseUserStats key: <exercise_key>_<user_key>. Fields: exercise_id, user_id, sum, count, best, last, last_at, avg
+    exercise_user_stats_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "exercise_id": {"type": "string"},
+                "user_id": {"type": "string"},
+                "sum": {"type": "number"},
+                "count": {"type": "integer", "minimum": 0},
+                "best": {"type": "number"},
+                "last": {"type": "number"},
+                "avg": {"type": "number"}
+            },
+            "required": ["exercise_id", "user_id", "sum", "count", "avg"]
+        },
+        "level": "moderate",
+        "message": "Start validation for ExerciseUserStats collection"
+    }
+    # ExerciseRank key: <exercise_key>. Fields: users, avg_sum, buckets ({"<floor(avg * 10)>": users})
+    exercise_rank_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "exercise_id": {"type": "string"},
+                "users": {"type": "integer", "minimum": 0},
+                "avg_sum": {"type": "number"},
+                "buckets": {"type": "object"}
+            },
+            "required": ["exercise_id", "users", "buckets"]
+        },
+        "level": "moderate",
+        "message": "Start validation for ExerciseRank collection"
+    }
+
+    # 6c. DailyActivity (rollup maintained with each Session insert)
+    # Key: <YYYY-MM-DD>_<user_key>_<exercise_key>. Fields: date, user_id, exercise_id, username, exercise_name, count
+    daily_activity_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "date": {"type": "string"},
+                "user_id": {"type": "string"},
+                "exercise_id": {"type": "string"},
+                "username": {"type": ["string", "null"]},
+                "exercise_name": {"type": ["string", "null"]},
+                "count": {"type": "integer", "minimum": 0}
+            },
+            "required": ["date", "user_id", "exercise_id", "count"]
+        },
+        "level": "moderate",
+        "message": "Start validation for DailyActivity collection"
+    }
+
+    # 6d. ScoreSketch (score histogram per exercise / model version, maintained with each Session insert)
+    # Key: <exercise_key>_<model_version|all>. Fields: exercise_id, model_version, count, sum, buckets ({"<floor(score * 10)>": n})
+    score_sketch_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "exercise_id": {"type": "string"},
+                "model_version": {"type": "string"},
+                "count": {"type": "integer", "minimum": 0},
+                "sum": {"type": "number"},
+                "buckets": {"type": "object"}
+            },
+            "required": ["exercise_id", "model_version", "count", "buckets"]
+        },
+        "level": "moderate",
+        "message": "Start validation for ScoreSketch collection"
+    }
+
+    # 6e. ReplicationOutbox (change records drained into OrientDB by app.services.replication)
+    # Fields: collection, keys, status (pending|dead), attempts, error, seq, created_at, next_attempt_at, claimed_by
+    replication_outbox_schema = {
+        "rule": {
+            "type": "object",
+            "properties": {
+                "collection": {"type": "string"},
+                "keys": {"type": "array", "items": {"type": "string"}},
+                "status": {"enum": ["pending", "dead"]},
+                "attempts": {"type": "integer", "minimum": 0},
+                "seq": {"type": "integer"},
+                "created_at": {"type": "number"},
+                "next_attempt_at": {"type": "number"}
+            },
+            "required": ["collection", "keys", "status", "created_at", "next_attempt_at"]
+        },
+        "level": "moderate",
+        "message": "Start validation for ReplicationOutbox collection"
+    }
+
     # 7. FrameEdge (Edge)
     # Fields: _from, _to, edge_type
     frame_edge_schema = {
@@ -161,8 +330,16 @@ def init_db():
         {"name": "Exercise", "type": "document", "schema": exercise_schema},
         {"name": "Video", "type": "document", "schema": video_schema},
         {"name": "Frame", "type": "document", "schema": frame_schema},
+        {"name": "FrameBlock", "type": "document", "schema": frame_block_schema},
+        {"name": "FrameArchive", "type": "document", "schema": frame_archive_schema},
+        {"name": "VideoEmbedding", "type": "document", "schema": video_embedding_schema},
         {"name": "Model", "type": "document", "schema": model_schema},
         {"name": "Session", "type": "edge", "schema": session_schema},
+        {"name": "ExerciseUserStats", "type": "document", "schema": exercise_user_stats_schema},
+        {"name": "ExerciseRank", "type": "document", "schema": exercise_rank_schema},
+        {"name": "DailyActivity", "type": "document", "schema": daily_activity_schema},
+        {"name": "ScoreSketch", "type": "document", "schema": score_sketch_schema},
+        {"name": "ReplicationOutbox", "type": "document", "schema": replication_outbox_schema},
         {"name": "FrameEdge", "type": "edge", "schema": frame_edge_schema}
     ]
 
@@ -206,6 +383,9 @@ def init_db():
     video_col = db.collection("Video")
     ensure_index(video_col, ["uploader_user_id"])
     ensure_index(video_col, ["exercise_id"])
+    ensure_index(video_col, ["status"])
+    # Retention: complete hot videos by age
+    ensure_index(video_col, ["storage_tier", "upload_time"])
 
     # --- Frame Collection ---
     frame_col = db.collection("Frame")
@@ -213,6 +393,15 @@ def init_db():
     ensure_index(frame_col, ["video_id", "frame_number"])
     ensure_index(frame_col, ["video_id", "timestamp"])
 
+    # --- FrameBlock Collection ---
+    frame_block_col = db.collection("FrameBlock")
+    ensure_index(frame_block_col, ["video_id", "block_index"], unique=True)
+
+    # --- VideoEmbedding Collection ---
+    # Scoring reads by _key; this index serves per-video listing / cleanup
+    video_embedding_col = db.collection("VideoEmbedding")
+    ensure_index(video_embedding_col, ["video_id"])
+
     # --- Model Collection ---
     model_col = db.collection("Model")
     ensure_index(model_col, ["exercise_id"])
@@ -220,15 +409,33 @@ def init_db():
     # --- Edge Indexes ---
     session_col = db.collection("Session")
     ensure_index(session_col, ["score"])
+    # User history: keyset pages ordered by (timestamp, _key) per user. _key is part of the
+    # index so the tie-break and the cursor range are served by it as well; the older
+    # [_from, timestamp] index is a prefix of this one and is dropped.
+    ensure_index(session_col, ["_from", "timestamp", "_key"], name="session_history")
+    drop_index(session_col, ["_from", "timestamp"])
+
+    # --- Aggregate Collections ---
+    # Leaderboard: index-ordered scan of one exercise's users by average
+    stats_col = db.collection("ExerciseUserStats")
+    ensure_index(stats_col, ["exercise_id", "avg"])
+    ensure_index(stats_col, ["user_id"])
+    
+    # Activity report: date range scan
+    ensure_index(db.collection("DailyActivity"), ["date"])
+    
+    # --- Replication Outbox ---
+    # Replicator claim: due pending records in order
+    ensure_index(db.collection("ReplicationOutbox"), ["status", "next_attempt_at"])
     
     frame_edge_col = db.collection("FrameEdge")
     ensure_index(frame_edge_col, ["edge_type"])
 
     print("Database initialization complete.")
 
-def ensure_index(collection, fields, unique=False, sparse=False):
+def ensure_index(collection, fields, unique=False, sparse=False, name=None):
     """
-    Helper to ensure a persistent index exists.
+    Helper to ensure a persistent index exists. `name` lets queries refer to it in an indexHint.
     """
     try:
         # add_index expects a dictionary configuration
@@ -238,10 +445,24 @@ def ensure_index(collection, fields, unique=False, sparse=False):
             "unique": unique,
             "sparse": sparse
         }
+        if name:
+            index_config["name"] = name
         collection.add_index(index_config)
         print(f" -> Index ensured on {collection.name}: {fields} (Unique={unique}, Sparse={sparse})")
     except Exception as e:
         print(f" -> Error ensuring index on {collection.name} for {fields}: {e}")
 
+def drop_index(collection, fields):
+    """
+    Drops the persistent index on exactly `fields` if there is one (superseded indexes).
+    """
+    try:
+        for index in collection.indexes():
+            if index.get("type") == "persistent" and list(index.get("fields", [])) == list(fields):
+                collection.delete_index(index["id"].split("/")[-1])
+                print(f" -> Dropped superseded index on {collection.name}: {fields}")
+    except Exception as e:
+        print(f" -> Error dropping index on {collection.name} for {fields}: {e}")
+
 if __name__ == "__main__":
     init_db()
@@ -0,0 +1,264 @@
+import copy
+import uuid
+import threading
+from typing import Dict, Any, Optional, List, Iterator
+
+import numpy as np
+
+from app.db.repositories import (
+    Storage, VideoRepository, FrameRepository, ExerciseRepository, ModelRepository, SessionRepository, key_of
+)
+from app.services.frame_blocks import NUM_LANDMARKS, LANDMARK_FIELDS, EMBEDDING_DIM, landmarks_to_array
+from app.services.embedding_store import model_version_for
+from app.services.aggregates import stats_key, rank_bucket, user_exercise_stats_from
+from app.services.score_sketch import sketch_key, score_bucket
+
+# In-memory implementation of the repositories (see repositories.py), for profiling runs and
+# performance tests on a machine without ArangoDB. State lives in this process only.
+#
+# Frames are kept as decoded arrays, so reads cost what the compute pipeline would pay after
+# decoding; score aggregates are maintained incrementally on record(), like the AQL version.
+# Documents are copied on the way in and out, so callers cannot alias stored state.
+
+def _merge(target: Dict[str, Any], fields: Dict[str, Any]):
+    # ArangoDB update semantics: nested objects are merged
+    for name, value in fields.items():
+        if isinstance(value, dict) and isinstance(target.get(name), dict):
+            _merge(target[name], value)
+        else:
+            target[name] = copy.deepcopy(value)
+
+class _MemoryRepository:
+    def __init__(self):
+        self._lock = threading.RLock()
+
+class MemoryVideoRepository(_MemoryRepository, VideoRepository):
+    def __init__(self):
+        super().__init__()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self.docs.get(video_id)
+            return copy.deepcopy(doc) if doc else None
+
+    def save(self, doc: Dict[str, Any]):
+        with self._lock:
+            self.docs[doc["_key"]] = dict(copy.deepcopy(doc), _id=f"Video/{doc['_key']}")
+
+    def update(self, video_id: str, fields: Dict[str, Any], replicate: bool = True):
+        with self._lock:
+            if video_id not in self.docs:
+                raise KeyError(f"Video {video_id} not found")
+            _merge(self.docs[video_id], fields)
+
+    def find_reference(self, exercise_id: str) -> Optional[str]:
+        with self._lock:
+            for doc in self.docs.values():
+                if doc.get("exercise_id") == exercise_id and doc.get("is_reference"):
+                    return doc.get("video_id", doc["_key"])
+        return None
+
+    def list_references(self, exercise_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [copy.deepcopy(d) for d in self.docs.values() if d.get("exercise_id") == exercise_id and d.get("is_reference")]
+
+class MemoryFrameRepository(_MemoryRepository, FrameRepository):
+    def __init__(self):
+        super().__init__()
+        # video_id -> frame_number -> (33, 4) landmarks / (128,) embedding or None
+        self.landmarks: Dict[str, Dict[int, np.ndarray]] = {}
+        self.embeddings: Dict[str, Dict[int, Optional[np.ndarray]]] = {}
+        self.matrices: Dict[tuple, np.ndarray] = {}
+
+    def write_chunk(self, video_id: str, chunk: List[tuple], storage_format: str, fps: float, block_size: int):
+        frames = [frame for frame, _ in chunk]
+        arr = landmarks_to_array([f["pose_landmark"] for f in frames])
+        with self._lock:
+            landmarks = self.landmarks.setdefault(video_id, {})
+            embeddings = self.embeddings.setdefault(video_id, {})
+            for t, frame in enumerate(frames):
+                landmarks[frame["frame_number"]] = arr[t]
+                emb = frame["embeded_vector"]
+                embeddings[frame["frame_number"]] = None if emb is None else np.asarray(emb, dtype=np.float32)
+
+    def load_embeddings(self, video_id: str) -> np.ndarray:
+        with self._lock:
+            embeddings = self.embeddings.get(video_id, {})
+            rows = [embeddings[n] for n in sorted(embeddings) if embeddings[n] is not None]
+        return np.stack(rows) if rows else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def load_landmarks(self, video_id: str) -> np.ndarray:
+        with self._lock:
+            landmarks = self.landmarks.get(video_id, {})
+            rows = [landmarks[n] for n in sorted(landmarks)]
+        return np.stack(rows) if rows else np.zeros((0, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+
+    def update_embeddings(self, video_id: str, embeddings: List[Optional[List[float]]]) -> int:
+        with self._lock:
+            stored = self.embeddings.get(video_id, {})
+            numbers = sorted(stored)
+            for n, emb in zip(numbers, embeddings):
+                stored[n] = None if emb is None else np.asarray(emb, dtype=np.float32)
+            return min(len(numbers), len(embeddings))
+
+    def save_embedding_matrix(self, video_id: str, model_path: str, matrix: np.ndarray):
+        matrix = np.array(matrix, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        matrix.flags.writeable = False
+        with self._lock:
+            self.matrices[(video_id, model_version_for(model_path))] = matrix
+
+    def get_embedding_matrix(self, video_id: str, model_path: str) -> Optional[np.ndarray]:
+        with self._lock:
+            matrix = self.matrices.get((video_id, model_version_for(model_path)))
+        return matrix if matrix is not None and len(matrix) else None
+
+class MemoryExerciseRepository(_MemoryRepository, ExerciseRepository):
+    def __init__(self):
+        super().__init__()
+        self.docs: Dict[str, Dict[str, Any]] = {}
+
+    def get(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self.docs.get(key_of(exercise_id))
+            return copy.deepcopy(doc) if doc else None
+
+    def save(self, doc: Dict[str, Any]):
+        with self._lock:
+            self.docs[doc["_key"]] = dict(copy.deepcopy(doc), _id=f"Exercise/{doc['_key']}")
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [copy.deepcopy(d) for d in self.docs.values()]
+
+class MemoryModelRepository(_MemoryRepository, ModelRepository):
+    def __init__(self):
+        super().__init__()
+        self.docs: List[Dict[str, Any]] = []
+
+    def save(self, doc: Dict[str, Any]):
+        with self._lock:
+            self.docs.append(copy.deepcopy(doc))
+
+    def latest_for_exercise(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            models = [m for m in self.docs if m.get("exercise_id") == exercise_id]
+            return copy.deepcopy(max(models, key=lambda m: m.get("created_at", ""))) if models else None
+
+class MemorySessionRepository(_MemoryRepository, SessionRepository):
+    """
+    Leaderboard usernames are the user keys (there is no User repository).
+    """
+    def __init__(self, exercises: MemoryExerciseRepository):
+        super().__init__()
+        self.exercises = exercises
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.user_stats: Dict[str, Dict[str, Any]] = {}
+        self.ranks: Dict[str, Dict[str, Any]] = {}
+        self.sketches: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        key = session_data.get("_key") or uuid.uuid4().hex
+        session = dict(copy.deepcopy(session_data), _key=key, _id=f"Session/{key}")
+        score = session["score"]
+        exercise_key = key_of(session["_to"])
+        with self._lock:
+            if key in self.docs:
+                # Already recorded (same semantics as the ArangoDB backend)
+                return {"_id": session["_id"], "_key": key}
+            self.docs[key] = session
+
+            stats = self.user_stats.get(stats_key(session["_to"], session["_from"]))
+            old_avg = stats["avg"] if stats else None
+            if stats is None:
+                stats = self.user_stats[stats_key(session["_to"], session["_from"])] = {
+                    "exercise_id": exercise_key, "user_id": session["_from"], "sum": 0.0, "count": 0, "best": score
+                }
+            stats.update(sum=stats["sum"] + score, count=stats["count"] + 1, best=max(stats["best"], score),
+                         last=score, last_at=session["timestamp"])
+            stats["avg"] = stats["sum"] / stats["count"]
+
+            rank = self.ranks.setdefault(exercise_key, {"exercise_id": exercise_key, "users": 0, "avg_sum": 0.0, "buckets": {}})
+            if old_avg is None:
+                rank["users"] += 1
+            else:
+                rank["avg_sum"] -= old_avg
+                rank["buckets"][str(rank_bucket(old_avg))] -= 1
+            rank["avg_sum"] += stats["avg"]
+            new_bucket = str(rank_bucket(stats["avg"]))
+            rank["buckets"][new_bucket] = rank["buckets"].get(new_bucket, 0) + 1
+
+            for version in {None, session.get("model_version")}:
+                sketch = self.sketches.setdefault(sketch_key(session["_to"], version), {"count": 0, "sum": 0.0, "buckets": {}})
+                bucket = str(score_bucket(score))
+                sketch["count"] += 1
+                sketch["sum"] += score
+                sketch["buckets"][bucket] = sketch["buckets"].get(bucket, 0) + 1
+        return {"_id": session["_id"], "_key": key}
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            doc = self.docs.get(key_of(session_id))
+            return copy.deepcopy(doc) if doc else None
+
+    def _history(self, user_id: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            sessions = [s for s in self.docs.values() if s["_from"] == user_id]
+        sessions.sort(key=lambda s: (s["timestamp"], s["_key"]), reverse=True)
+        rows = []
+        for s in sessions:
+            exercise = self.exercises.get(s["_to"]) or {}
+            rows.append({
+                "session_id": s["_key"],
+                "timestamp": s["timestamp"],
+                "score": s["score"],
+                "exercise_name": exercise.get("name"),
+                "exercise_id": exercise.get("_key"),
+                "video_id": s.get("user_video_id"),
+                "model_type": s.get("model_type")
+            })
+        return rows
+
+    def history_page(self, user_id: str, cursor_ts: Optional[str], cursor_key: Optional[str],
+                     limit: int) -> List[Dict[str, Any]]:
+        rows = self._history(user_id)
+        if cursor_ts is not None:
+            rows = [r for r in rows if (r["timestamp"], r["session_id"]) < (cursor_ts, cursor_key)]
+        return rows[:limit]
+
+    def iter_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        return iter(self._history(user_id))
+
+    def user_exercise_stats(self, exercise_id: str, user_id: str) -> Dict[str, Any]:
+        with self._lock:
+            user_stats = copy.deepcopy(self.user_stats.get(stats_key(exercise_id, user_id)))
+            rank_doc = copy.deepcopy(self.ranks.get(key_of(exercise_id)))
+        return user_exercise_stats_from(key_of(exercise_id), user_stats, rank_doc)
+
+    def leaderboard(self, exercise_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        with self._lock:
+            stats = [s for s in self.user_stats.values() if s["exercise_id"] == key_of(exercise_id)]
+        stats.sort(key=lambda s: s["avg"], reverse=True)
+        return [{
+            "username": key_of(s["user_id"]),
+            "avg_score": s["avg"],
+            "best_score": s["best"],
+            "session_count": s["count"],
+            "rank": position
+        } for position, s in enumerate(stats[:limit], start=1)]
+
+    def score_sketch(self, exercise_id: str, model_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(self.sketches.get(sketch_key(exercise_id, model_version)))
+
+class MemoryStorage(Storage):
+    def __init__(self):
+        exercises = MemoryExerciseRepository()
+        super().__init__(
+            "memory",
+            videos=MemoryVideoRepository(),
+            frames=MemoryFrameRepository(),
+            exercises=exercises,
+            models=MemoryModelRepository(),
+            sessions=MemorySessionRepository(exercises)
+        )
@@ -0,0 +1,94 @@
+import sys
+import os
+import argparse
+
+# Ensure the app directory is in the python path to import the database module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import ArangoDBConnection
+from app.services.frame_blocks import FRAME_BLOCK_SIZE, FRAME_BLOCK_DTYPE, build_frame_block
+
+def migrate_video(db, video: dict, block_size: int, dtype: str, delete_frames: bool) -> int:
+    """
+    Converts one frame-format video to FrameBlock documents. Returns the number of blocks written.
+    """
+    video_id = video["_key"]
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @vid
+        SORT f.frame_number ASC
+        RETURN { frame_number: f.frame_number, pose_landmark: f.pose_landmark, embeded_vector: f.embeded_vector }
+    """
+    # Stream frames in batches so long videos are not materialised at once
+    cursor = db.aql.execute(aql, bind_vars={"vid": video_id}, batch_size=block_size, stream=True)
+
+    blocks_written = 0
+    chunk = []
+
+    def write_block():
+        nonlocal blocks_written
+        start_frame = chunk[0]["frame_number"]
+        has_embeddings = any(f.get("embeded_vector") is not None for f in chunk)
+        block = build_frame_block(
+            video_id, start_frame // block_size, start_frame, video.get("fps", 0.0),
+            [f.get("pose_landmark") or [] for f in chunk],
+            [f.get("embeded_vector") for f in chunk] if has_embeddings else None,
+            dtype=dtype
+        )
+        db.collection("FrameBlock").insert(block, overwrite=True)
+        blocks_written += 1
+
+    for frame in cursor:
+        chunk.append(frame)
+        if len(chunk) == block_size:
+            write_block()
+            chunk = []
+    if chunk:
+        write_block()
+
+    db.collection("Video").update({"_key": video_id, "frame_storage": "block", "frame_block_size": block_size})
+
+    if delete_frames:
+        # Every first/next edge points at one of the video's frames, so the _to edge index finds them all
+        db.aql.execute(
+            "FOR f IN Frame FILTER f.video_id == @vid FOR e IN FrameEdge FILTER e._to == f._id REMOVE e IN FrameEdge",
+            bind_vars={"vid": video_id}
+        )
+        db.aql.execute("FOR f IN Frame FILTER f.video_id == @vid REMOVE f IN Frame", bind_vars={"vid": video_id})
+    return blocks_written
+
+def migrate(block_size: int = FRAME_BLOCK_SIZE, dtype: str = FRAME_BLOCK_DTYPE, delete_frames: bool = False, video_id: str = None):
+    """
+    Migrates frame-format videos (one Frame document per frame) to packed FrameBlock documents.
+    """
+    db = ArangoDBConnection().get_db()
+    if not db.has_collection("FrameBlock"):
+        print("FrameBlock collection missing. Run init_db.py first.")
+        return
+
+    aql = """
+    FOR v IN Video
+        FILTER v.frame_storage != "block"
+        FILTER @vid == null OR v._key == @vid
+        RETURN v
+    """
+    videos = list(db.aql.execute(aql, bind_vars={"vid": video_id}))
+    print(f"Migrating {len(videos)} videos to FrameBlock (block_size={block_size}, dtype={dtype})...")
+
+    for video in videos:
+        try:
+            blocks = migrate_video(db, video, block_size, dtype, delete_frames)
+            print(f" -> {video['_key']}: {blocks} blocks{' (frames deleted)' if delete_frames else ''}")
+        except Exception as e:
+            print(f" -> Failed to migrate {video['_key']}: {e}")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate Frame documents to packed FrameBlock documents.")
+    parser.add_argument("--block-size", type=int, default=FRAME_BLOCK_SIZE)
+    parser.add_argument("--dtype", choices=["float16", "float32"], default=FRAME_BLOCK_DTYPE)
+    parser.add_argument("--delete-frames", action="store_true", help="Remove the migrated Frame documents and FrameEdges")
+    parser.add_argument("--video-id", default=None, help="Only migrate this video")
+    args = parser.parse_args()
+    migrate(args.block_size, args.dtype, args.delete_frames, args.video_id)
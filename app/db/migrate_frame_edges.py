@@ -0,0 +1,79 @@
+import sys
+import os
+import argparse
+
+# Ensure the app directory is in the python path to import the database module
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import ArangoDBConnection
+from app.db.orientdb_client import OrientDBClient
+
+# Frames removed per AQL query, so one long video is not dropped in a single huge transaction
+DROP_BATCH_FRAMES = 5000
+
+def drop_video_edges(db, orient: OrientDBClient, video: dict, include_orient: bool = True) -> int:
+    """
+    Removes the FrameEdge chain of one frame-format video and marks it as derived.
+    Returns the number of ArangoDB edges removed.
+    """
+    video_id = video["_key"]
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @vid AND f.frame_number >= @lo AND f.frame_number < @hi
+        FOR e IN FrameEdge
+            FILTER e._to == f._id
+            REMOVE e IN FrameEdge
+            COLLECT WITH COUNT INTO n
+            RETURN n
+    """
+    last = next(iter(db.aql.execute(
+        "FOR f IN Frame FILTER f.video_id == @vid SORT f.frame_number DESC LIMIT 1 RETURN f.frame_number",
+        bind_vars={"vid": video_id}
+    )), None)
+
+    removed = 0
+    if last is not None:
+        # Every first/next edge points at one of the video's frames, so the _to edge index finds them all
+        for lo in range(0, last + 1, DROP_BATCH_FRAMES):
+            removed += next(iter(db.aql.execute(aql, bind_vars={"vid": video_id, "lo": lo, "hi": lo + DROP_BATCH_FRAMES})), 0)
+
+    if include_orient:
+        # Same for the mirror: every edge of the chain ends in one of the video's frames
+        if orient.command("DELETE EDGE FrameEdge WHERE in.video_id = :vid", {"vid": video_id}, idempotent=True) is None:
+            print(f" -> {video_id}: OrientDB edges not removed (run again or reconcile later)")
+
+    db.collection("Video").update({"_key": video_id, "frame_edges": "derived"})
+    return removed
+
+def migrate(video_id: str = None, include_orient: bool = True):
+    """
+    Drops materialized FrameEdge chains of frame-format videos. Successors are then derived
+    from the (video_id, frame_number) index (app.services.frame_chain).
+    """
+    db = ArangoDBConnection().get_db()
+    orient = OrientDBClient()
+
+    aql = """
+    FOR v IN Video
+        FILTER v.frame_storage != "block" AND v.frame_edges != "derived"
+        FILTER @vid == null OR v._key == @vid
+        RETURN v
+    """
+    videos = list(db.aql.execute(aql, bind_vars={"vid": video_id}))
+    print(f"Dropping frame edges of {len(videos)} videos...")
+
+    for video in videos:
+        try:
+            removed = drop_video_edges(db, orient, video, include_orient)
+            print(f" -> {video['_key']}: {removed} edges removed")
+        except Exception as e:
+            print(f" -> Failed to drop edges of {video['_key']}: {e}")
+
+    print("Migration complete.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Drop FrameEdge chains; frame successors are derived from the frame index instead.")
+    parser.add_argument("--video-id", default=None, help="Only migrate this video")
+    parser.add_argument("--skip-orient", action="store_true", help="Leave the OrientDB mirror untouched")
+    args = parser.parse_args()
+    migrate(args.video_id, not args.skip_orient)
@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import base64
+import random
+import asyncio
+from datetime import datetime, date
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+# Connection settings (defaults match setup_orient.py)
+ORIENT_URL = os.getenv("ORIENT_URL", "http://localhost:2480")
+ORIENT_DB = os.getenv("ORIENT_DB", "OrientDB")
+ORIENT_USER = os.getenv("ORIENT_USER", "root")
+ORIENT_PASSWORD = os.getenv("ORIENT_PASSWORD", "3946")
+
+# Pool: at most ORIENT_POOL_SIZE concurrent HTTP connections, idle ones kept alive for reuse
+ORIENT_POOL_SIZE = int(os.getenv("ORIENT_POOL_SIZE", "10"))
+ORIENT_KEEPALIVE_EXPIRY = float(os.getenv("ORIENT_KEEPALIVE_EXPIRY", "30"))
+ORIENT_TIMEOUT = float(os.getenv("ORIENT_TIMEOUT", "30"))          # Seconds per call (overridable per call)
+ORIENT_MAX_RETRIES = int(os.getenv("ORIENT_MAX_RETRIES", "3"))
+ORIENT_RETRY_BACKOFF = float(os.getenv("ORIENT_RETRY_BACKOFF", "0.2"))  # Seconds, doubled per attempt (+ jitter)
+
+# Class names and RIDs cannot be bound as parameters; they are checked against these before being put into SQL
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_RID = re.compile(r"^#-?\d+:-?\d+$")
+
+class OrientDBError(Exception):
+    """
+    An OrientDB request failed. `status` is the HTTP status, or None if no response was received.
+    """
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+def _json_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('utf-8')
+    raise TypeError(f"Type {type(obj)} not serializable")
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_json_default)
+
+def identifier(name: str) -> str:
+    if not _IDENTIFIER.match(name):
+        raise ValueError(f"Invalid OrientDB identifier: {name!r}")
+    return name
+
+def rid_literal(rid: str) -> str:
+    if not _RID.match(rid):
+        raise ValueError(f"Invalid OrientDB RID: {rid!r}")
+    return rid
+
+def _retryable(exc: Exception, idempotent: bool) -> bool:
+    # Connection errors mean the request never reached the server, so any command may be resent.
+    # Timeouts and 5xx after sending may have been applied; only idempotent commands are resent.
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if isinstance(exc, OrientDBError):
+        return exc.status == 503 or (idempotent and exc.status is not None and exc.status >= 500)
+    return idempotent and isinstance(exc, (httpx.ReadTimeout, httpx.WriteTimeout, httpx.RemoteProtocolError))
+
+class AsyncOrientDBClient:
+    """
+    Async OrientDB REST client on a pooled httpx.AsyncClient.
+
+    Commands take named parameters (":name" in SQL, sent in the /command JSON body),
+    so values are never spliced into SQL strings. Each call has a timeout and failed calls
+    are retried with exponential backoff (see _retryable for what is safe to resend).
+
+    The underlying httpx client belongs to the event loop it is first used in; call
+    aclose() from that loop on shutdown.
+    """
+    def __init__(self, base_url: str = ORIENT_URL, db_name: str = ORIENT_DB, user: str = ORIENT_USER,
+                 password: str = ORIENT_PASSWORD, pool_size: int = ORIENT_POOL_SIZE, timeout: float = ORIENT_TIMEOUT,
+                 max_retries: int = ORIENT_MAX_RETRIES):
+        self.base_url = base_url
+        self.db_name = db_name
+        self.auth = (user, password)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=self.auth,
+                headers={"Content-Type": "application/json;charset=UTF-8"},
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=ORIENT_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(self.timeout)
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def _post(self, path: str, payload: Dict[str, Any], timeout: Optional[float], idempotent: bool) -> Any:
+        body = dumps(payload).encode("utf-8")
+        attempt = 0
+        while True:
+            try:
+                response = await self._http().post(path, content=body, timeout=timeout or self.timeout)
+                if response.status_code != 200:
+                    raise OrientDBError(f"OrientDB error {response.status_code}: {response.text[:500]}", response.status_code)
+                try:
+                    return response.json()
+                except ValueError:
+                    # Some commands do not return JSON (e.g. simple OK)
+                    return {}
+            except (httpx.HTTPError, OrientDBError) as e:
+                if attempt >= self.max_retries or not _retryable(e, idempotent):
+                    if isinstance(e, OrientDBError):
+                        raise
+                    raise OrientDBError(f"OrientDB request failed: {type(e).__name__}: {e}") from e
+                delay = ORIENT_RETRY_BACKOFF * (2 ** attempt)
+                await asyncio.sleep(delay + random.uniform(0, delay))
+                attempt += 1
+
+    async def command(self, sql: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                      idempotent: bool = False) -> Any:
+        """
+        Runs one SQL command. Bind values as ":name" and pass them in `params`.
+        Set `idempotent` for reads and upserts so they are also retried after timeouts.
+        """
+        payload = {"command": sql}
+        if params:
+            payload["parameters"] = params
+        return await self._post(f"/command/{self.db_name}/sql", payload, timeout, idempotent)
+
+    async def query(self, sql: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Runs a read-only command and returns its result rows.
+        """
+        result = await self.command(sql, params, timeout, idempotent=True)
+        return result.get("result", []) if isinstance(result, dict) else []
+
+    async def batch(self, operations: List[Dict[str, Any]], timeout: Optional[float] = None, idempotent: bool = False) -> Any:
+        """
+        Executes a list of /batch operations in one transaction.
+        """
+        payload = {"transaction": True, "operations": operations}
+        return await self._post(f"/batch/{self.db_name}", payload, timeout, idempotent)
+
+    async def create_vertex(self, class_name: str, properties: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        return await self.command(
+            f"INSERT INTO {identifier(class_name)} CONTENT :content",
+            {"content": properties}, timeout
+        )
+
+    async def upsert_vertex(self, class_name: str, properties: Dict[str, Any], timeout: Optional[float] = None) -> Any:
+        """
+        Creates or replaces the vertex with properties["_key"].
+        """
+        return await self.command(
+            f"UPDATE {identifier(class_name)} CONTENT :content UPSERT RETURN AFTER @rid WHERE _key = :key",
+            {"content": properties, "key": properties["_key"]}, timeout, idempotent=True
+        )
+
+    async def create_edge(self, edge_class: str, from_ref: str, to_ref: str, properties: Optional[Dict[str, Any]] = None,
+                          timeout: Optional[float] = None) -> Any:
+        """
+        Creates an edge between two vertices given as RIDs ("#12:3") or ("Class", "_key") handles
+        joined as "Class/key".
+        """
+        params = {}
+        def ref(handle: str, name: str) -> str:
+            if handle.startswith("#"):
+                return rid_literal(handle)
+            cls, key = handle.split("/", 1)
+            params[name] = key
+            return f"(SELECT FROM {identifier(cls)} WHERE _key = :{name})"
+
+        sql = f"CREATE EDGE {identifier(edge_class)} FROM {ref(from_ref, 'from_ref')} TO {ref(to_ref, 'to_ref')}"
+        if properties:
+            sql += " CONTENT :content"
+            params["content"] = properties
+        return await self.command(sql, params, timeout)
+
+    async def delete_vertices(self, class_name: str, keys: List[str], timeout: Optional[float] = None) -> Any:
+        return await self.command(
+            f"DELETE VERTEX {identifier(class_name)} WHERE _key IN :keys",
+            {"keys": list(keys)}, timeout, idempotent=True
+        )
@@ -1,10 +1,72 @@
-import requests
 import json
-import base64
 import os
-from datetime import datetime, date
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional
+
+from app.utils.cache import LRUCache
+from app.db.orientdb_async import AsyncOrientDBClient, OrientDBError, dumps, identifier, rid_literal
+
+# Maximum vertices per /batch transaction in sync_graph (edges ride along with their target vertex)
+ORIENT_BATCH_SIZE = int(os.getenv("ORIENT_BATCH_SIZE", "500"))
+# (class, _key) -> RID entries kept so edges can address vertices by RID instead of a _key lookup
+ORIENT_RID_CACHE_SIZE = int(os.getenv("ORIENT_RID_CACHE_SIZE", "100000"))
+
+# Classes mirrored from ArangoDB; each gets a unique index on _key (see ensure_key_indexes)
+SYNCED_CLASSES = {
+    "User": "V",
+    "Video": "V",
+    "Frame": "V",
+    "FrameBlock": "V",
+    "FrameEdge": "E",
+}
+
+def extract_rids(result) -> List[str]:
+    """
+    Pulls record IDs ("#cluster:position") out of a /command or /batch response.
+    """
+    rids = []
+    if isinstance(result, dict):
+        result = result.get("result", result.get("@rid", []))
+    if not isinstance(result, list):
+        result = [result]
+    for item in result:
+        if isinstance(item, str) and item.startswith("#"):
+            rids.append(item)
+        elif isinstance(item, dict):
+            rid = item.get("@rid") or item.get("rid") or item.get("value")
+            if isinstance(rid, str) and rid.startswith("#"):
+                rids.append(rid)
+        elif isinstance(item, list):
+            rids.extend(extract_rids(item))
+    return rids
+
+class _LoopThread:
+    """
+    A private event loop on a daemon thread. Sync callers submit coroutines to it and wait,
+    so every thread of the process shares one async client and connection pool.
+    """
+    def __init__(self):
+        self._loop = None
+        self._lock = threading.Lock()
+
+    @property
+    def started(self) -> bool:
+        return self._loop is not None
+
+    def run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="orientdb-loop", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
 
 class OrientDBClient:
+    """
+    Blocking OrientDB client for threads and scripts.
+    A thin wrapper over AsyncOrientDBClient (pooled, parameterized, with timeouts and retries).
+    As before, failed calls are logged and return None instead of raising.
+    """
     _instance = None
     
     def __new__(cls):
@@ -14,70 +76,35 @@ class OrientDBClient:
         return cls._instance
 
     def _initialize(self):
-        # Default config or from Environment
-        self.host = "localhost"
-        self.port = 2480
-        self.user = "root"
-        self.password = "3946"
-        self.db_name = "OrientDB"
-        self.base_url = f"http://{self.host}:{self.port}"
-        
-        # Use a Session for connection pooling
-        self.session = requests.Session()
-        # Initialize connection/auth header if needed, or just set headers
-        # Note: requests.Session() persists cookies, but we use Basic Auth header.
-        # We can pre-set the auth header.
+        self.client = AsyncOrientDBClient()
+        self._runner = _LoopThread()
         
-        credentials = f"{self.user}:{self.password}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        self.session.headers.update({
-            "Authorization": f"Basic {encoded_credentials}",
-            "Content-Type": "application/json;charset=UTF-8"
-        })
-    
-    # Remove _get_headers as we set it in session
-    
-    def command(self, sql: str):
-        """Executes a SQL command against the configured database."""
-        url = f"{self.base_url}/command/{self.db_name}/sql"
+        # RIDs are stable for the life of a record; entries are dropped when we delete vertices
+        self.rid_cache = LRUCache("orient_rids", max_entries=ORIENT_RID_CACHE_SIZE)
+
+    def _call(self, coro, what: str):
         try:
-            # Use self.session
-            response = self.session.post(url, data=sql.encode('utf-8'))
-            if response.status_code == 200:
-                try:
-                    return response.json()
-                except:
-                    # Some commands might not return JSON (e.g. simple OK)
-                    return {} 
-            else:
-                print(f"[OrientDB] Error {response.status_code}: {response.text}")
-                return None
-        except Exception as e:
-            print(f"[OrientDB] Connection failed: {e}")
+            return self._runner.run(coro)
+        except (OrientDBError, ValueError) as e:
+            print(f"[OrientDB] {what} failed: {e}")
             return None
+    
+    def close(self):
+        """Closes the connection pool on the loop thread that owns it (API shutdown)."""
+        if self._runner.started:
+            self._call(self.client.aclose(), "Close")
+
+    def command(self, sql: str, params: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None,
+                idempotent: bool = False):
+        """Executes a SQL command against the configured database. Bind values as ":name" in `params`."""
+        return self._call(self.client.command(sql, params, timeout, idempotent), "Command")
 
-    def batch(self, operations: list):
+    def batch(self, operations: list, timeout: Optional[float] = None, idempotent: bool = False):
         """
         Executes a batch of operations in a transaction.
         operations: list of dicts defining operations (type: 'c', record: {...})
         """
-        url = f"{self.base_url}/batch/{self.db_name}"
-        payload = {
-            "transaction": True,
-            "operations": operations
-        }
-        
-        try:
-            response = self.session.post(url, json=payload)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                 print(f"[OrientDB] Batch Error {response.status_code}: {response.text}")
-                 return None
-        except Exception as e:
-            print(f"[OrientDB] Batch Connection failed: {e}")
-            return None
-
+        return self._call(self.client.batch(operations, timeout, idempotent), "Batch")
 
     def insert_user(self, user_doc: dict):
         # Wrapper for create_vertex specialized for User if needed, or just alias
@@ -86,42 +113,137 @@ class OrientDBClient:
     def create_vertex(self, class_name: str, properties: dict):
         """
         Generic method to create a vertex of a specific class.
+        The new RID is remembered for the vertex's _key.
         """
-        # Serialize properties to JSON
-        # Handle datetime objects
-        def json_serial(obj):
-            if isinstance(obj, (datetime, date)):
-                return obj.isoformat()
-            if isinstance(obj, bytes):
-                 return base64.b64encode(obj).decode('utf-8')
-            raise TypeError (f"Type {type(obj)} not serializable")
-            
-        json_data = json.dumps(properties, default=json_serial)
-        
-        # Syntax: INSERT INTO Class CONTENT { ... }
-        sql = f"INSERT INTO {class_name} CONTENT {json_data}"
-        return self.command(sql)
+        result = self._call(self.client.create_vertex(class_name, properties), "Create vertex")
+        if result and properties.get("_key") is not None:
+            rids = extract_rids(result)
+            if rids:
+                self.rid_cache.put((class_name, properties["_key"]), rids[0])
+        return result
+
+    def vertex_ref(self, class_name: str, key: str) -> str:
+        """
+        SQL expression addressing a vertex inside a /batch script (which cannot take parameters):
+        its cached RID, or a lookup on the _key index.
+        """
+        rid = self.rid_cache.get((class_name, key))
+        if rid:
+            return rid_literal(rid)
+        return f"(SELECT FROM {identifier(class_name)} WHERE _key = {json.dumps(key)})"
+
+    def forget_rids(self, class_name: str, keys: List[str]):
+        for key in keys:
+            self.rid_cache.invalidate((class_name, key))
 
     def create_edge(self, edge_class: str, from_class: str, from_key: str, to_class: str, to_key: str, properties: dict = None):
         """
         Creates an edge between two vertices.
-        Assumes vertices identify themselves via a property named '_key' (matching Arango),
-        OR we can search by another unique field.
+        Vertices are identified by their Arango '_key', stored as a property called '_key';
+        RIDs of vertices created through this client are used directly.
         """
-        # We assume the vertices were inserted with their Arango '_key' preserved as a property called '_key'.
-        
-        from_query = f"(SELECT FROM {from_class} WHERE _key = '{from_key}')"
-        to_query = f"(SELECT FROM {to_class} WHERE _key = '{to_key}')"
-        
-        sql = f"CREATE EDGE {edge_class} FROM {from_query} TO {to_query}"
-        
-        if properties:
-            def json_serial(obj):
-                if isinstance(obj, (datetime, datetime.date)):
-                    return obj.isoformat()
-                raise TypeError (f"Type {type(obj)} not serializable")
-            
-            json_data = json.dumps(properties, default=json_serial)
-            sql += f" CONTENT {json_data}"
-            
-        return self.command(sql)
+        from_ref = self.rid_cache.get((from_class, from_key)) or f"{from_class}/{from_key}"
+        to_ref = self.rid_cache.get((to_class, to_key)) or f"{to_class}/{to_key}"
+        result = self._call(self.client.create_edge(edge_class, from_ref, to_ref, properties), "Create edge")
+        if result is None:
+            # A cached RID may point at a vertex deleted behind our back
+            self.forget_rids(from_class, [from_key])
+            self.forget_rids(to_class, [to_key])
+        return result
+
+    def ensure_key_indexes(self, classes: Optional[Dict[str, str]] = None):
+        """
+        Creates the _key property and a unique hash index on it for each class (idempotent).
+        Without it every _key lookup in edge creation scans the class.
+        Records without a _key (e.g. the admin user from setup_orient) are not indexed.
+        """
+        for class_name in map(identifier, classes or SYNCED_CLASSES):
+            self.command(f"CREATE PROPERTY {class_name}._key IF NOT EXISTS STRING", idempotent=True)
+            self.command(
+                f"CREATE INDEX {class_name}._key IF NOT EXISTS ON {class_name} (_key) UNIQUE_HASH_INDEX "
+                f'METADATA {{"ignoreNullValues": true}}',
+                idempotent=True
+            )
+
+    def sync_graph(self, vertex_class: str, vertices: List[dict], edge_class: Optional[str] = None,
+                   edges: Optional[List[dict]] = None, known_rids: Optional[Dict[str, str]] = None,
+                   batch_size: Optional[int] = None) -> Dict[str, str]:
+        """
+        Upserts vertices (by _key) and the edges pointing at them in chunked, transactional /batch calls.
+        Each chunk is one SQL script: the vertices are bound to variables and edges reference
+        them (or RIDs from `known_rids` / earlier chunks) directly, so no per-edge lookups are needed.
+        Edges are Arango-style dicts with "_from"/"_to" = "Class/key"; an edge with a _key is only
+        created if no edge with that _key exists, so replaying a chunk is harmless.
+        Returns {vertex _key: RID}. Raises RuntimeError if a chunk fails.
+        """
+        batch_size = batch_size or ORIENT_BATCH_SIZE
+        vertex_class = identifier(vertex_class)
+        edge_class = identifier(edge_class) if edge_class else None
+        rids = dict(known_rids or {})
+        created = {}
+        edges_by_target = {}
+        for edge in edges or []:
+            edges_by_target.setdefault(edge["_to"].split("/", 1)[1], []).append(edge)
+
+        def endpoint(handle: str, local: Dict[str, int]) -> str:
+            cls, key = handle.split("/", 1)
+            if key in local:
+                return f"$v{local[key]}"
+            if key in rids:
+                return rid_literal(rids[key])
+            return self.vertex_ref(cls, key)
+
+        for start in range(0, len(vertices), batch_size):
+            chunk = vertices[start:start + batch_size]
+            local = {}
+            script = ["begin"]
+            for i, vertex in enumerate(chunk):
+                local[vertex["_key"]] = i
+                script.append(
+                    f"let v{i} = UPDATE {vertex_class} CONTENT {dumps(vertex)} "
+                    f"UPSERT RETURN AFTER @rid WHERE _key = {json.dumps(vertex['_key'])}"
+                )
+            n_edges = 0
+            for vertex in chunk:
+                for edge in edges_by_target.get(vertex["_key"], []):
+                    props = {k: v for k, v in edge.items() if k not in ("_from", "_to")}
+                    sql = f"CREATE EDGE {edge_class} FROM {endpoint(edge['_from'], local)} TO {endpoint(edge['_to'], local)}"
+                    if props:
+                        sql += f" CONTENT {dumps(props)}"
+                    if "_key" in edge:
+                        script.append(f"let e{n_edges} = SELECT @rid FROM {edge_class} WHERE _key = {json.dumps(edge['_key'])}")
+                        sql = f"if ($e{n_edges}.size() == 0) {{ {sql} }}"
+                        n_edges += 1
+                    script.append(sql)
+            script.append("commit retry 3")
+            script.append("return [" + ", ".join(f"$v{i}" for i in range(len(chunk))) + "]")
+
+            # Upserts and guarded edge creation make the script safe to resend after a timeout
+            result = self.batch([{"type": "script", "language": "sql", "script": script}], idempotent=True)
+            if result is None:
+                # Retry with _key lookups in case a cached edge endpoint RID went stale
+                self.forget_rids(vertex_class, list(local))
+                for vertex in chunk:
+                    for edge in edges_by_target.get(vertex["_key"], []):
+                        from_class, from_key = edge["_from"].split("/", 1)
+                        self.forget_rids(from_class, [from_key])
+                raise RuntimeError(f"OrientDB sync of {len(chunk)} {vertex_class} vertices failed")
+            chunk_rids = extract_rids(result)
+            if len(chunk_rids) == len(chunk):
+                for vertex, rid in zip(chunk, chunk_rids):
+                    rids[vertex["_key"]] = rid
+                    created[vertex["_key"]] = rid
+                    self.rid_cache.put((vertex_class, vertex["_key"]), rid)
+        return created
+
+    def delete_vertices(self, vertex_class: str, keys: List[str]):
+        """
+        Deletes vertices (and their edges) by mirrored _key. Missing keys are ignored.
+        """
+        if not keys:
+            return
+        self.forget_rids(vertex_class, keys)
+        result = self._call(self.client.delete_vertices(vertex_class, keys), "Delete vertices")
+        if result is None:
+            raise RuntimeError(f"OrientDB delete of {len(keys)} {vertex_class} vertices failed")
+        return result
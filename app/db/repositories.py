@@ -0,0 +1,176 @@
+import os
+import threading
+from typing import Dict, Any, Optional, List, Iterator
+
+import numpy as np
+
+# Storage backend for the processing pipeline (ingestion, scoring, training, dashboard).
+#
+# Services talk to one repository per aggregate instead of to ArangoDB directly:
+#   videos     Video documents (status, progress, reference lookup)
+#   frames     per-frame pose landmarks / embeddings and packed per-model embedding matrices
+#   exercises  Exercise documents
+#   models     trained Model metadata
+#   sessions   scored Session edges and the statistics read from them
+#
+# STORAGE_BACKEND selects the implementation:
+#   "arango" - ArangoDB (arango_repositories.py), the production backend
+#   "memory" - process-local dicts (memory_repositories.py) for profiling runs and
+#              performance tests without a database; nothing is persisted
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "arango")
+STORAGE_BACKENDS = ("arango", "memory")
+
+class VideoRepository:
+    def get(self, video_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def save(self, doc: Dict[str, Any]):
+        """
+        Inserts or replaces a Video document (doc["_key"] is the video id).
+        """
+        raise NotImplementedError
+
+    def update(self, video_id: str, fields: Dict[str, Any], replicate: bool = True):
+        """
+        Merges `fields` into the Video document (nested objects are merged, not replaced).
+        `replicate=False` for frequent bookkeeping writes (progress) the OrientDB mirror does not need.
+        """
+        raise NotImplementedError
+
+    def find_reference(self, exercise_id: str) -> Optional[str]:
+        """
+        ID of any reference video of an exercise, or None.
+        """
+        raise NotImplementedError
+
+    def list_references(self, exercise_id: str) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+class FrameRepository:
+    def write_chunk(self, video_id: str, chunk: List[tuple], storage_format: str, fps: float, block_size: int):
+        """
+        Writes consecutive (frame_doc, edge_doc) pairs of a video produced by ingestion.
+        """
+        raise NotImplementedError
+
+    def load_embeddings(self, video_id: str) -> np.ndarray:
+        """
+        Non-null frame embeddings in frame order as an (M, 128) float32 matrix.
+        """
+        raise NotImplementedError
+
+    def load_landmarks(self, video_id: str) -> np.ndarray:
+        """
+        All frames' landmarks as a (T, 33, 4) float32 array.
+        """
+        raise NotImplementedError
+
+    def update_embeddings(self, video_id: str, embeddings: List[Optional[List[float]]]) -> int:
+        """
+        Replaces the per-frame embeddings (one entry per frame, None for frames without one).
+        """
+        raise NotImplementedError
+
+    def save_embedding_matrix(self, video_id: str, model_path: str, matrix: np.ndarray):
+        raise NotImplementedError
+
+    def get_embedding_matrix(self, video_id: str, model_path: str) -> Optional[np.ndarray]:
+        raise NotImplementedError
+
+class ExerciseRepository:
+    def get(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Exercise by key or "Exercise/<key>" handle.
+        """
+        raise NotImplementedError
+
+    def save(self, doc: Dict[str, Any]):
+        raise NotImplementedError
+
+    def list(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+class ModelRepository:
+    def save(self, doc: Dict[str, Any]):
+        raise NotImplementedError
+
+    def latest_for_exercise(self, exercise_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+class SessionRepository:
+    def record(self, session_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stores a Session (User -> Exercise) and updates the score statistics. Returns {_id, _key}.
+        A session whose `_key` is already stored is not recorded again.
+        """
+        raise NotImplementedError
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def history_page(self, user_id: str, cursor_ts: Optional[str], cursor_key: Optional[str],
+                     limit: int) -> List[Dict[str, Any]]:
+        """
+        A user's sessions newest first, strictly after the (timestamp, key) cursor.
+        """
+        raise NotImplementedError
+
+    def iter_history(self, user_id: str) -> Iterator[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def user_exercise_stats(self, exercise_id: str, user_id: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def leaderboard(self, exercise_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def score_sketch(self, exercise_id: str, model_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+class Storage:
+    """
+    The repositories of one backend.
+    """
+    def __init__(self, name: str, videos: VideoRepository, frames: FrameRepository, exercises: ExerciseRepository,
+                 models: ModelRepository, sessions: SessionRepository):
+        self.name = name
+        self.videos = videos
+        self.frames = frames
+        self.exercises = exercises
+        self.models = models
+        self.sessions = sessions
+
+def key_of(handle: str) -> str:
+    # "Collection/key" -> "key"
+    return handle.split("/")[-1]
+
+_storage: Optional[Storage] = None
+_storage_lock = threading.Lock()
+
+def create_storage(backend: str = None) -> Storage:
+    backend = backend or STORAGE_BACKEND
+    if backend == "arango":
+        from app.db.arango_repositories import ArangoStorage
+        return ArangoStorage()
+    if backend == "memory":
+        from app.db.memory_repositories import MemoryStorage
+        return MemoryStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND '{backend}' (expected one of {STORAGE_BACKENDS})")
+
+def get_storage() -> Storage:
+    """
+    The process-wide storage backend (created on first use from STORAGE_BACKEND).
+    """
+    global _storage
+    with _storage_lock:
+        if _storage is None:
+            _storage = create_storage()
+        return _storage
+
+def set_storage(storage: Optional[Storage]):
+    """
+    Replaces the process-wide backend (benchmarks, tests). None resets to STORAGE_BACKEND.
+    """
+    global _storage
+    with _storage_lock:
+        _storage = storage
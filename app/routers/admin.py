@@ -1,15 +1,25 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Form
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Form, Query
 from typing import List, Optional
 import uuid
 import os
 
-from app.routers.auth import get_current_active_developer, get_current_user
+from app.routers.auth import get_current_active_developer, get_current_user, user_cache
 from app.db.database import ArangoDBConnection
+from app.db.async_db import run_db, run_blocking, aql_all, aql_first
+from app.db.orientdb_client import OrientDBClient
 from app.ml.train import train as run_training_pipeline
-from app.services.inference import generate_embeddings_for_video_data, inference_service, map_mp_to_25
+from app.services.inference import generate_embeddings_for_video_data, inference_service, map_array_to_25
+from app.services.frame_blocks import array_to_landmarks
+from app.db.repositories import get_storage
+from app.services.scoring import invalidate_reference_cache
 from app.services.ingestion import process_video
-from app.utils.benchmark import run_arangodb_benchmark
+from app.services import aggregates, jobs
+from app.services.replication import replicator, retry_dead_records
+from app.services.reconcile import RECONCILE_COLLECTIONS
+from app.routers.jobs import enqueue_job
+from app.services.metadata_cache import get_exercise_by_name, invalidate_exercises, invalidate_models, get_metadata_cache_stats
+from app.utils.benchmark import run_arangodb_benchmark, run_frame_edge_benchmark
 import numpy as np
 
 router = APIRouter()
@@ -17,14 +27,93 @@ router = APIRouter()
 @router.get("/benchmark")
 async def benchmark(current_user: dict = Depends(get_current_active_developer)):
     """
-    Runs ArangoDB benchmarks.
+    Runs ArangoDB benchmarks (off the event loop; other requests keep being served).
     """
-    metrics = run_arangodb_benchmark()
+    metrics = await run_db(run_arangodb_benchmark)
     return metrics
 
+@router.get("/benchmark/frame-edges")
+async def benchmark_frame_edges(
+    frames: int = Query(5000, ge=100, le=100000),
+    current_user: dict = Depends(get_current_active_developer)
+):
+    """
+    Write throughput with and without materialized frame edges (FRAME_EDGE_MODE).
+    """
+    return await run_db(run_frame_edge_benchmark, frames)
+
 def get_db():
     return ArangoDBConnection().get_db()
 
+@router.get("/cache/stats")
+async def cache_stats(current_user: dict = Depends(get_current_active_developer)):
+    """
+    Returns hit rates and savings of the caches.
+    landmark_cache and reference_embeddings are used by ingestion and scoring in the job
+    workers; their counters are summed over the workers' snapshots in the job queue DB.
+    The other caches are this API process's.
+    """
+    worker_stats = await run_blocking(jobs.worker_cache_stats)
+    return {
+        "landmark_cache": worker_stats["landmark_cache"],
+        "reference_embeddings": worker_stats["reference_embeddings"],
+        "metadata": get_metadata_cache_stats(),
+        "users": user_cache.get_stats(),
+        "orient_rids": OrientDBClient().rid_cache.get_stats()
+    }
+
+@router.get("/replication/stats")
+async def replication_stats(current_user: dict = Depends(get_current_active_developer)):
+    """
+    Returns the OrientDB replication backlog, lag (age of the oldest pending outbox record),
+    dead records and this process's replicator counters.
+    """
+    return await run_db(replicator.get_stats, get_db())
+
+@router.post("/replication/retry-dead")
+async def replication_retry_dead(current_user: dict = Depends(get_current_active_developer)):
+    """
+    Requeues outbox records that exhausted their retries.
+    """
+    requeued = await run_db(retry_dead_records, get_db())
+    return {"requeued": requeued}
+
+@router.post("/replication/reconcile", status_code=status.HTTP_202_ACCEPTED)
+async def replication_reconcile(
+    collection: Optional[str] = Form(None),
+    bucket: Optional[str] = Form(None),
+    deep: bool = Form(False),
+    dry_run: bool = Form(False),
+    current_user: dict = Depends(get_current_active_developer)
+):
+    """
+    Compares OrientDB with ArangoDB (bucket digests, then key by key in differing buckets)
+    as a background job and queues repairs through the replication outbox.
+    """
+    if collection is not None and collection not in RECONCILE_COLLECTIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown collection '{collection}'")
+    payload = {"collections": [collection] if collection else None, "bucket": bucket, "deep": deep, "dry_run": dry_run}
+    job_id = await enqueue_job("reconcile_orientdb", payload, owner=current_user["_key"])
+    return {"job_id": job_id, "status": "queued"}
+
+@router.post("/retention/run", status_code=status.HTTP_202_ACCEPTED)
+async def retention_run(
+    days: Optional[int] = Form(None),
+    limit: Optional[int] = Form(None),
+    video_id: Optional[str] = Form(None),
+    dry_run: bool = Form(False),
+    current_user: dict = Depends(get_current_active_developer)
+):
+    """
+    Moves the raw frames of videos older than `days` (default RETENTION_DAYS) into compressed
+    FrameArchive documents and deletes their hot rows, as a background job.
+    """
+    if days is not None and days < 0:
+        raise HTTPException(status_code=400, detail="days must be >= 0")
+    payload = {"days": days, "limit": limit, "video_id": video_id, "dry_run": dry_run}
+    job_id = await enqueue_job("apply_retention", payload, owner=current_user["_key"])
+    return {"job_id": job_id, "status": "queued"}
+
 @router.post("/exercise", status_code=status.HTTP_201_CREATED)
 async def create_exercise(
     name: str = Form(...),
@@ -39,7 +128,7 @@ async def create_exercise(
     
     # Check for duplicates
     aql = "FOR e IN Exercise FILTER e.name == @name RETURN e"
-    if not db.aql.execute(aql, bind_vars={"name": name}).empty():
+    if await aql_first(db, aql, bind_vars={"name": name}) is not None:
         raise HTTPException(status_code=400, detail="Exercise already exists")
         
     exercise_doc = {
@@ -49,7 +138,8 @@ async def create_exercise(
         "ref_video_id": ref_video_id 
     }
     
-    db.collection("Exercise").insert(exercise_doc)
+    await run_db(db.collection("Exercise").insert, exercise_doc)
+    invalidate_exercises()
     return {"message": "Exercise created", "exercise_id": exercise_doc["_key"]}
 
 # Global Status Store
@@ -88,46 +178,26 @@ def train_and_update_reference(exercise_id: str, exercise_name: str):
     final_loss = 0.0
     final_epoch = 0
     
-    db = get_db()
+    storage = get_storage()
     
     # --- 1. Fetch Real Training Data ---
     training_data = []
     
     # Find all reference videos for this exercise
-    aql_videos = """
-    FOR v IN Video 
-        FILTER v.exercise_id == @eid AND v.is_reference == true
-        RETURN v
-    """
-    ref_videos = [v for v in db.aql.execute(aql_videos, bind_vars={"eid": exercise_id})]
+    ref_videos = storage.videos.list_references(exercise_id)
     print(f"[Admin] Found {len(ref_videos)} reference videos for training.")
     
     for vid in ref_videos:
         vid_id = vid["video_id"] # or _key depending on schema, usually video_id field
         
-        # Fetch Frames
-        aql_frames = """
-        FOR f IN Frame
-            FILTER f.video_id == @vid
-            SORT f.frame_number ASC
-            RETURN f.pose_landmark
-        """
-        landmarks_list = [f for f in db.aql.execute(aql_frames, bind_vars={"vid": vid_id})]
+        # Fetch Landmarks (Frame or FrameBlock storage) as (T, 33, 4)
+        landmarks = storage.frames.load_landmarks(vid_id)
         
-        if not landmarks_list:
+        if len(landmarks) == 0:
             continue
             
         # Convert to Numpy (3, T, 25)
-        # map_mp_to_25 returns (3, 25)
-        
-        # Optimized stack
-        T = len(landmarks_list)
-        video_tensor = np.zeros((3, T, 25), dtype=np.float32)
-        
-        for t, lms in enumerate(landmarks_list):
-            video_tensor[:, t, :] = map_mp_to_25(lms)
-            
-        training_data.append(video_tensor)
+        training_data.append(map_array_to_25(landmarks))
         
     print(f"[Admin] Prepared {len(training_data)} samples for training.")
     
@@ -162,16 +232,13 @@ def train_and_update_reference(exercise_id: str, exercise_name: str):
     try:
         run_training_pipeline(training_data=training_data, progress_callback=progress_callback, save_path=model_save_path) 
         
-        # Reload inference service model with this specific model
-        # Note: If ingestion happens concurrently for other exercises, this global reload is risky.
-        # But for this user flow, it ensures the newly trained model is active for the subsequent embedding update.
-        inference_service.model.cpu() 
-        import torch
-        if os.path.exists(model_save_path):
-             inference_service.model.load_state_dict(torch.load(model_save_path))
-             inference_service.model.eval()
-             print(f"[Admin] Inference model reloaded with new weights from {model_save_path}")
-             
+        # Activate the new weights through the service's load path so current_model_path
+        # matches them; later calls with another model_path reload as usual.
+        inference_service.load_model(model_save_path)
+        if inference_service.current_model_path != model_save_path:
+            raise RuntimeError(f"Could not load trained model from {model_save_path}")
+        print(f"[Admin] Inference model reloaded with new weights from {model_save_path}")
+
         training_status[exercise_name]["message"] = "Model trained. Updating embeddings..."
              
     except Exception as e:
@@ -179,13 +246,8 @@ def train_and_update_reference(exercise_id: str, exercise_name: str):
         training_status[exercise_name] = {"status": "failed", "message": str(e), "progress": 0}
         return
 
-    db = get_db()
-
     # 1.5 Save Model Metadata
     try:
-        if not db.has_collection("Model"):
-            db.create_collection("Model")
-            
         model_doc = {
             "_key": str(uuid.uuid4()),
             "name": f"STGCN_SimCLR_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}",
@@ -198,26 +260,20 @@ def train_and_update_reference(exercise_id: str, exercise_name: str):
             "created_at": datetime.datetime.now().isoformat(),
             "description": f"Trained on {exercise_name} until epoch {final_epoch} with loss {final_loss:.4f}"
         }
-        db.collection("Model").insert(model_doc)
+        storage.models.save(model_doc)
+        invalidate_models()
         print(f"[Admin] Saved Model metadata: {model_doc['_key']}")
     except Exception as e:
         print(f"[Admin] Failed to save model metadata: {e}")
 
     # 2. Update Reference Video
-    try:
-        key = exercise_id.split("/")[-1] if "/" in exercise_id else exercise_id
-        exercise = db.collection("Exercise").get(key)
-    except:
+    exercise = storage.exercises.get(exercise_id)
+    if not exercise:
         print(f"[Admin] Exercise {exercise_id} not found.")
         training_status[exercise_name] = {"status": "failed", "message": "Exercise not found during update", "progress": 0}
         return
         
-    ref_video_id = exercise.get("ref_video_id")
-    if not ref_video_id:
-        aql = "FOR v IN Video FILTER v.exercise_id == @eid AND v.is_reference == true LIMIT 1 RETURN v.video_id"
-        cursor = db.aql.execute(aql, bind_vars={"eid": exercise_id})
-        for vid in cursor:
-            ref_video_id = vid
+    ref_video_id = exercise.get("ref_video_id") or storage.videos.find_reference(exercise_id)
             
     if not ref_video_id:
         print(f"[Admin] No reference video found for exercise {exercise_id}. Skipping embedding update.")
@@ -227,35 +283,22 @@ def train_and_update_reference(exercise_id: str, exercise_name: str):
     print(f"[Admin] Updating embeddings for reference video: {ref_video_id}")
     training_status[exercise_name]["message"] = f"Updating embeddings for Ref: {ref_video_id}..."
     
-    # Fetch all frames/landmarks for this video
-    aql_frames = """
-    FOR f IN Frame
-        FILTER f.video_id == @vid
-        SORT f.frame_number ASC
-        RETURN f
-    """
-    frames = [f for f in db.aql.execute(aql_frames, bind_vars={"vid": ref_video_id})]
+    # Fetch all landmarks for this video (Frame or FrameBlock storage)
+    landmarks = storage.frames.load_landmarks(ref_video_id)
     
-    if not frames:
+    if len(landmarks) == 0:
         print("[Admin] No frames found for reference video.")
     else:
-        # Extract landmarks
-        landmarks_list = [f.get("pose_landmark", []) for f in frames]
-        
         # Generate Embeddings
-        embeddings = generate_embeddings_for_video_data(landmarks_list)
+        embeddings = generate_embeddings_for_video_data(array_to_landmarks(landmarks), model_path=model_save_path)
         
-        # Update Frames
-        update_docs = []
+        # Update Frames / FrameBlocks
+        updated = storage.frames.update_embeddings(ref_video_id, embeddings)
+        print(f"[Admin] Updated {updated} frame documents for reference video {ref_video_id}")
         
-        for i, emb in enumerate(embeddings):
-            if emb is not None:
-                doc = {"_key": frames[i]["_key"], "embeded_vector": emb}
-                update_docs.append(doc)
-                
-        if update_docs:
-            db.collection("Frame").import_bulk(update_docs, on_duplicate="update")
-            print(f"[Admin] Updated {len(update_docs)} frames for reference video {ref_video_id}")
+        # Packed matrix for score-time key lookups under the new model version
+        storage.frames.save_embedding_matrix(ref_video_id, model_save_path, [e for e in embeddings if e is not None])
+        invalidate_reference_cache(exercise_id)
     
     print("[Admin] Training and Reference Update Complete.")
     training_status[exercise_name] = {
@@ -273,8 +316,8 @@ async def list_exercises(current_user: dict = Depends(get_current_user)):
     List all exercises.
     """
     db = get_db()
-    cursor = db.collection("Exercise").all()
-    exercises = [{"id": ex["_key"], "name": ex["name"]} for ex in cursor]
+    docs = await run_db(lambda: list(db.collection("Exercise").all()))
+    exercises = [{"id": ex["_key"], "name": ex["name"]} for ex in docs]
     return exercises
 
 @router.post("/train", status_code=status.HTTP_202_ACCEPTED)
@@ -289,49 +332,45 @@ async def trigger_training(
     """
     db = get_db()
     # Lookup ID
-    aql = "FOR e IN Exercise FILTER e.name == @name RETURN e"
-    cursor = db.aql.execute(aql, bind_vars={"name": exercise_name})
-    if cursor.empty():
+    exercise = await run_db(get_exercise_by_name, db, exercise_name)
+    if exercise is None:
          raise HTTPException(status_code=404, detail=f"Exercise '{exercise_name}' not found")
     
-    exercise = cursor.next()
     exercise_id = exercise["_key"]
 
     background_tasks.add_task(train_and_update_reference, exercise_id, exercise_name)
     return {"message": f"Training started for {exercise_name} in background.", "status": "training"}
 
 @router.get("/user-activity")
-async def get_user_activity(current_user: dict = Depends(get_current_active_developer)):
+async def get_user_activity(
+    start: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="First day (YYYY-MM-DD)"),
+    end: Optional[str] = Query(None, pattern=r"^\d{4}-\d{2}-\d{2}$", description="Last day (YYYY-MM-DD)"),
+    current_user: dict = Depends(get_current_active_developer)
+):
     """
     Returns a report of daily activity per user per exercise.
     Grouped by: User, Exercise, Date.
+    Reads the DailyActivity rollups (maintained on each session insert) for the date range.
     """
     db = get_db()
-    aql = """
-    FOR s IN Session
-        LET session_date = SUBSTRING(s.timestamp, 0, 10)
-        // s._from is 'User/key', s._to is 'Exercise/key'
-        COLLECT user_id = s._from, exercise_id = s._to, day = session_date WITH COUNT INTO count
-        
-        LET user = DOCUMENT(user_id)
-        LET exercise = DOCUMENT(exercise_id)
-        
-        SORT day DESC, user.username ASC
-        
-        RETURN {
-            "username": user.username,
-            "exercise": exercise.name,
-            "date": day,
-            "count": count
-        }
-    """
     try:
-        cursor = db.aql.execute(aql)
-        return [doc for doc in cursor]
+        return await run_db(aggregates.get_daily_activity, db, start, end)
     except Exception as e:
         print(f"[Activity Report Error] {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/user-activity/backfill", status_code=status.HTTP_202_ACCEPTED)
+async def backfill_user_activity(
+    start: Optional[str] = Form(None),
+    end: Optional[str] = Form(None),
+    current_user: dict = Depends(get_current_active_developer)
+):
+    """
+    Rebuilds the DailyActivity rollups from Session edges as a background job.
+    """
+    job_id = await enqueue_job("backfill_daily_activity", {"start": start, "end": end}, owner=current_user["_key"])
+    return {"job_id": job_id, "status": "queued"}
+
 @router.get("/developers")
 async def list_developers(current_user: dict = Depends(get_current_active_developer)):
     """
@@ -351,8 +390,7 @@ async def list_developers(current_user: dict = Depends(get_current_active_develo
         }
     """
     try:
-        cursor = db.aql.execute(aql)
-        return [doc for doc in cursor]
+        return await aql_all(db, aql)
     except Exception as e:
         print(f"[List Developers Error] {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -363,7 +401,7 @@ async def get_audit_logs(current_user: dict = Depends(get_current_active_develop
     Fetches the latest system audit logs (Foxx Triggers).
     """
     db = get_db()
-    if not db.has_collection("AuditLog"):
+    if not await run_db(db.has_collection, "AuditLog"):
         return []
         
     aql = """
@@ -373,8 +411,7 @@ async def get_audit_logs(current_user: dict = Depends(get_current_active_develop
         RETURN a
     """
     try:
-        cursor = db.aql.execute(aql)
-        return [doc for doc in cursor]
+        return await aql_all(db, aql)
     except Exception as e:
         print(f"[Audit Log Error] {e}")
         raise HTTPException(status_code=500, detail=str(e))
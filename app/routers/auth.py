@@ -17,8 +17,10 @@ import random
 import string
 
 from app.db.database import ArangoDBConnection
-from app.db.orientdb_client import OrientDBClient
+from app.services.replication import append_change
 from app.services.email import send_verification_email
+from app.db.async_db import run_db, run_blocking, aql_first
+from app.utils.cache import LRUCache, InvalidationEpoch
 
 # Configuration
 SECRET_KEY = "CHANGE_THIS_IN_PRODUCTION_SECRET"
@@ -29,6 +31,13 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30
 GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "mock-client-id")
 GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "mock-client-secret")
 
+# Authenticated users are cached by token subject for a short time so that polling
+# endpoints do not hit the DB on every request. Profile / verification / role changes
+# invalidate the cache in every API process.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "4096"))
+user_cache = LRUCache("users", max_entries=USER_CACHE_MAX_ENTRIES, ttl=USER_CACHE_TTL, epoch=InvalidationEpoch("users"))
+
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/v1/auth/login")
 
@@ -65,6 +74,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
 def get_db():
     return ArangoDBConnection().get_db()
 
+def invalidate_user_cache():
+    """
+    Call after any change to a User document (profile, verification, user_type, linked accounts).
+    """
+    user_cache.invalidate_everywhere()
+
+def load_user(db, username: str) -> Optional[dict]:
+    """
+    Looks a user up by username, then by email (Google users may log in with their email).
+    """
+    aql = "FOR u IN User FILTER u.username == @username RETURN u"
+    cursor = db.aql.execute(aql, bind_vars={"username": username})
+    if cursor.empty():
+         aql = "FOR u IN User FILTER u.email == @username RETURN u"
+         cursor = db.aql.execute(aql, bind_vars={"username": username})
+    
+    for u in cursor:
+        return u
+    return None
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -80,24 +109,19 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
         
-    db = get_db()
-    
-    aql = "FOR u IN User FILTER u.username == @username RETURN u"
-    cursor = db.aql.execute(aql, bind_vars={"username": username})
-    user = None
-    if cursor.empty():
-         aql = "FOR u IN User FILTER u.email == @username RETURN u"
-         cursor = db.aql.execute(aql, bind_vars={"username": username})
-         if cursor.empty():
-             raise credentials_exception
-    
-    for u in cursor:
-        user = u
-        break
-        
+    user = user_cache.get(username)
+    if user is not None and user_type is not None and user.get("user_type") != user_type:
+        # Role changed since the entry was cached (e.g. outside this API); re-read it
+        user_cache.invalidate(username)
+        user = None
+    if user is None:
+        user = await run_db(lambda: load_user(get_db(), username))
+        if user is not None:
+            user_cache.put(username, user)
     if user is None:
         raise credentials_exception
-    return user
+    # Copy so handlers cannot modify the cached document
+    return dict(user)
 
 async def get_current_active_developer(current_user: dict = Depends(get_current_user)):
     if current_user.get("user_type") != "developer":
@@ -128,11 +152,10 @@ async def signup_patient(
     
     # Check if exists
     aql = "FOR u IN User FILTER u.username == @username OR u.email == @email RETURN u"
-    cursor = db.aql.execute(aql, bind_vars={"username": username, "email": email})
-    if not cursor.empty():
+    if await aql_first(db, aql, bind_vars={"username": username, "email": email}) is not None:
         raise HTTPException(status_code=400, detail="Username or Email already registered")
         
-    hashed_pw = get_password_hash(password)
+    hashed_pw = await run_blocking(get_password_hash, password)
     
     # Generate 6-digit code
     verification_code = ''.join(random.choices(string.digits, k=6))
@@ -153,15 +176,9 @@ async def signup_patient(
         "is_verified": False
     }
     
-    db.collection("User").insert(user_doc)
-    
-    # --- Dual Write to OrientDB ---
-    try:
-        orient_client = OrientDBClient()
-        orient_client.insert_user(user_doc)
-        print(f"[Info] User synced to OrientDB: {username}")
-    except Exception as e:
-        print(f"[Warning] Failed to sync to OrientDB: {e}")
+    await run_db(db.collection("User").insert, user_doc)
+    # Mirrored to OrientDB by the outbox replicator
+    await run_db(append_change, db, "User", [user_doc["_key"]])
 
     # --- Send Email ---
     await send_verification_email(email, verification_code)
@@ -180,12 +197,7 @@ async def verify_email(
     
     # Find user
     aql = "FOR u IN User FILTER u.email == @email RETURN u"
-    cursor = db.aql.execute(aql, bind_vars={"email": email})
-    
-    user = None
-    for u in cursor:
-        user = u
-        break
+    user = await aql_first(db, aql, bind_vars={"email": email})
         
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
@@ -201,18 +213,9 @@ async def verify_email(
     user["is_verified"] = True
     user["verification_code"] = None # Clear code
     
-    db.collection("User").update(user)
-    
-    # Sync status to OrientDB
-    try:
-        orient_client = OrientDBClient()
-        # Find user and update
-        # Assuming username is unique, we can use it to lookup for specific update or generic update query
-        # Using a direct UPDATE command on fields is efficient
-        sql = f"UPDATE User SET is_verified = true, verification_code = null WHERE email = '{email}'"
-        orient_client.command(sql)
-    except Exception as e:
-        print(f"[Warning] Failed to update OrientDB verification status: {e}")
+    await run_db(db.collection("User").update, user)
+    await run_db(append_change, db, "User", [user["_key"]])
+    invalidate_user_cache()
         
     return {"message": "Email verified successfully"}
 
@@ -226,17 +229,12 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     # 1. Fetch User
     aql = "FOR u IN User FILTER u.username == @username RETURN u"
-    cursor = db.aql.execute(aql, bind_vars={"username": form_data.username})
-    user = None
-    if cursor.empty():
+    user = await aql_first(db, aql, bind_vars={"username": form_data.username})
+    if user is None:
         raise HTTPException(status_code=400, detail="Incorrect username or password")
-    
-    for u in cursor:
-        user = u
-        break
         
-    # 2. Verify Password
-    if not verify_password(form_data.password, user.get("hashed_password")):
+    # 2. Verify Password (bcrypt is deliberately slow; keep it off the event loop)
+    if not await run_blocking(verify_password, form_data.password, user.get("hashed_password")):
         raise HTTPException(status_code=400, detail="Incorrect username or password")
         
     # 3. Check Verification
@@ -288,18 +286,16 @@ async def auth_google_callback(request: Request):
     
     # Check if user exists by email or google_id
     aql = "FOR u IN User FILTER u.email == @email OR u.google_id == @gid RETURN u"
-    cursor = db.aql.execute(aql, bind_vars={"email": email, "gid": google_id})
+    user = await aql_first(db, aql, bind_vars={"email": email, "gid": google_id})
     
-    user = None
-    if not cursor.empty():
+    if user is not None:
         # User exists, link account if needed
-        for u in cursor:
-            user = u
-            if not user.get("google_id"):
-                # Link
-                user["google_id"] = google_id
-                db.collection("User").update(user)
-            break
+        if not user.get("google_id"):
+            # Link
+            user["google_id"] = google_id
+            await run_db(db.collection("User").update, user)
+            await run_db(append_change, db, "User", [user["_key"]])
+            invalidate_user_cache()
     else:
         # Create new Patient User
         # Username defaults to email for google users
@@ -317,16 +313,10 @@ async def auth_google_callback(request: Request):
             # Google verified implies verified usually, or force?
             "is_verified": True # Trust Google
         }
-        meta = db.collection("User").insert(user_doc)
+        meta = await run_db(db.collection("User").insert, user_doc)
         user = user_doc
         user["_key"] = meta["_key"] # Update key
-        
-        # Sync to OrientDB
-        try:
-            orient_client = OrientDBClient()
-            orient_client.insert_user(user_doc)
-        except:
-            pass
+        await run_db(append_change, db, "User", [user["_key"]])
         
     # Issue JWT
     access_token = create_access_token(
@@ -353,7 +343,7 @@ async def create_developer(
     import requests
     from app.db.database import ARANGODB_HOST, DB_NAME, ARANGODB_USERNAME, ARANGODB_PASSWORD
     
-    hashed_pw = get_password_hash(password)
+    hashed_pw = await run_blocking(get_password_hash, password)
     
     foxx_url = f"{ARANGODB_HOST}/_db/{DB_NAME}/dev-ops/developers"
     
@@ -364,7 +354,8 @@ async def create_developer(
     }
     
     try:
-        response = requests.post(
+        response = await run_db(
+            requests.post,
             foxx_url, 
             json=payload,
             auth=(ARANGODB_USERNAME, ARANGODB_PASSWORD)
@@ -421,12 +412,11 @@ async def batch_create_developers(
             
         # Check duplicate
         aql = "FOR u IN User FILTER u.username == @username RETURN u"
-        cursor = db.aql.execute(aql, bind_vars={"username": username})
-        if not cursor.empty():
+        if await aql_first(db, aql, bind_vars={"username": username}) is not None:
             errors.append(f"Username already exists: {username}")
             continue
             
-        hashed_pw = get_password_hash(password)
+        hashed_pw = await run_blocking(get_password_hash, password)
         user_doc = {
             "_key": str(uuid.uuid4()),
             "username": username,
@@ -439,7 +429,8 @@ async def batch_create_developers(
         }
         
         try:
-            db.collection("User").insert(user_doc)
+            await run_db(db.collection("User").insert, user_doc)
+            await run_db(append_change, db, "User", [user_doc["_key"]])
             success_count += 1
         except Exception as e:
             errors.append(f"Failed to insert {username}: {str(e)}")
@@ -482,7 +473,7 @@ async def update_profile(
     if height is not None:
         updates["height"] = height
     if password is not None and password.strip():
-        updates["hashed_password"] = get_password_hash(password)
+        updates["hashed_password"] = await run_blocking(get_password_hash, password)
         
     if not updates:
         return {"message": "No changes provided"}
@@ -493,6 +484,8 @@ async def update_profile(
     # The AQL in get_current_user returns the document including _key and _id.
     
     updates["_key"] = current_user["_key"]
-    db.collection("User").update(updates)
+    await run_db(db.collection("User").update, updates)
+    await run_db(append_change, db, "User", [updates["_key"]])
+    invalidate_user_cache()
     
     return {"message": "Profile updated successfully", "updates": updates}
@@ -1,89 +1,117 @@
 
-from fastapi import APIRouter, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Depends, HTTPException, status, Response, Query
+from fastapi.responses import StreamingResponse
 from typing import List, Dict, Any, Optional
 from app.routers.auth import get_current_user
-from app.db.database import ArangoDBConnection
+from app.db.async_db import run_db
+from app.db.repositories import get_storage
+from app.services import score_sketch
 import csv
 import io
 import json
+import base64
 
 router = APIRouter()
 
-def get_db():
-    return ArangoDBConnection().get_db()
+# Page size of /user/history when no limit is given
+HISTORY_PAGE_SIZE = 100
+
+# History pages are keyset-paginated on (timestamp, session key), newest first
+# (see SessionRepository.history_page); the cursor encodes the last row of a page.
+def encode_history_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps([row["timestamp"], row["session_id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+def decode_history_cursor(cursor: Optional[str]):
+    if not cursor:
+        return None, None
+    try:
+        timestamp, key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return timestamp, key
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
 
 @router.get("/user/history")
-async def get_user_history(current_user: dict = Depends(get_current_user)):
+async def get_user_history(
+    response: Response,
+    limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=500),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
     """
-    Returns the list of sessions for the current user.
+    Returns a page of the current user's sessions, newest first.
+    If more sessions exist, the `X-Next-Cursor` response header holds the `cursor`
+    value for the next page.
     """
     user_id = current_user["_id"] # e.g., User/uuid
+    cursor_ts, cursor_key = decode_history_cursor(cursor)
     
-    db = get_db()
-    # Query Session edges where _from is user_id
-    # We also want to join with Exercise to get exercise name
-    # and maybe Video to get video details?
+    # One extra row tells whether there is a next page
+    rows = await run_db(get_storage().sessions.history_page, user_id, cursor_ts, cursor_key, limit + 1)
     
-    aql = """
-    FOR s IN Session
-        FILTER s._from == @user_id
-        SORT s.timestamp DESC
-        
-        LET exercise = DOCUMENT(s._to)
-        
-        RETURN {
-            "session_id": s._key,
-            "timestamp": s.timestamp,
-            "score": s.score,
-            "exercise_name": exercise.name,
-            "exercise_id": exercise._key,
-            "video_id": s.user_video_id,
-            "model_type": s.model_type
-        }
-    """
-    
-    cursor = db.aql.execute(aql, bind_vars={"user_id": user_id})
-    history = [doc for doc in cursor]
+    history = rows[:limit]
+    if len(rows) > limit:
+        response.headers["X-Next-Cursor"] = encode_history_cursor(history[-1])
     
     return history
 
+def _csv_line(values) -> str:
+    buf = io.StringIO()
+    csv.writer(buf).writerow(values)
+    return buf.getvalue()
+
+def stream_history_csv(rows):
+    # Header
+    yield _csv_line(["Session ID", "Timestamp", "Score", "Exercise", "Video ID", "Model"])
+    
+    # Rows
+    for item in rows:
+        yield _csv_line([
+            item["session_id"],
+            item["timestamp"],
+            f"{item['score']:.2f}",
+            item.get("exercise_name", "Unknown"),
+            item["video_id"],
+            item.get("model_type", "")
+        ])
+
+def stream_history_ndjson(rows):
+    for item in rows:
+        yield json.dumps(item) + "\n"
+
+def stream_history_json(rows):
+    yield "["
+    for i, item in enumerate(rows):
+        yield ("," if i else "") + json.dumps(item)
+    yield "]"
+
 @router.get("/user/history/export")
 async def export_user_history(
     format: str = "json",
     current_user: dict = Depends(get_current_user)
 ):
     """
-    Exports user history as CSV or JSON.
+    Exports user history as CSV, NDJSON or JSON.
+    Rows are streamed from the session repository (a batch cursor on ArangoDB),
+    so memory use does not depend on history size.
+    (The generators are synchronous; Starlette iterates them in its thread pool.)
     """
-    history = await get_user_history(current_user)
-    
-    if format.lower() == "csv":
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Header
-        writer.writerow(["Session ID", "Timestamp", "Score", "Exercise", "Video ID", "Model"])
-        
-        # Rows
-        for item in history:
-            writer.writerow([
-                item["session_id"],
-                item["timestamp"],
-                f"{item['score']:.2f}",
-                item.get("exercise_name", "Unknown"),
-                item["video_id"],
-                item.get("model_type", "")
-            ])
-            
-        return Response(
-            content=output.getvalue(),
-            media_type="text/csv",
-            headers={"Content-Disposition": "attachment; filename=history.csv"}
-        )
-        
-    else:
-        # JSON default
-        return history
+    fmt = format.lower()
+    formats = {
+        "csv": (stream_history_csv, "text/csv"),
+        "ndjson": (stream_history_ndjson, "application/x-ndjson"),
+        "json": (stream_history_json, "application/json")
+    }
+    if fmt not in formats:
+        raise HTTPException(status_code=400, detail=f"Unsupported format '{format}'. Use csv, ndjson or json.")
+    
+    streamer, media_type = formats[fmt]
+    rows = get_storage().sessions.iter_history(current_user["_id"])
+    return StreamingResponse(
+        streamer(rows),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=history.{fmt}"}
+    )
 
 @router.get("/session/{session_id}/result")
 async def get_session_result(
@@ -93,16 +121,13 @@ async def get_session_result(
     """
     Returns detailed result for a single session.
     """
-    db = get_db()
+    storage = get_storage()
     
     # 1. Get Session
     # Session ID passed here might be just the key or full ID. ArangoDB _key.
     # Note: If it's just key, we need to know Collection. Session is edge collection.
     
-    try:
-        session = db.collection("Session").get(session_id)
-    except:
-        session = None
+    session = await run_db(storage.sessions.get, session_id)
         
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -114,7 +139,7 @@ async def get_session_result(
         
     # 3. Construct Response
     # Fetch Exercise details
-    exercise = db.document(session["_to"])
+    exercise = await run_db(storage.exercises.get, session["_to"])
     
     # Generate Feedback
     score = session["score"]
@@ -128,13 +153,18 @@ async def get_session_result(
     else:
         feedback = "Needs improvement. Review the reference video and try again."
         
+    # Population comparison: same exercise, same model version when known
+    sketch = await run_db(storage.sessions.score_sketch, session["_to"], session.get("model_version"))
+    
     result = {
         "session_id": session["_key"],
         "timestamp": session["timestamp"],
         "score": session["score"],
         "exercise_name": exercise["name"] if exercise else "Unknown",
         "feedback": feedback,
-        "video_id": session["user_video_id"]
+        "video_id": session["user_video_id"],
+        "percentile": score_sketch.percentile_of(sketch, score) if sketch else None,
+        "population_median": score_sketch.quantile(sketch, 0.5) if sketch else None
     }
     
     return result
@@ -146,82 +176,44 @@ async def get_user_exercise_stats(
 ):
     """
     Returns the user's statistics for a specific exercise:
-    - Rank among all users
-    - Personal Average Score
+    - Rank among all users and percentile (share of other users with a lower average)
+    - Personal Average, Best and Last Score
     - Global Average Score
     - Total Participants
     
-    Uses COMPLEX QUERY (Aggregation, Window/Ranking Simulation, Subquery)
+    Reads the incrementally maintained ExerciseUserStats / ExerciseRank aggregates
+    (two key lookups) instead of aggregating all Session edges.
     """
-    db = get_db()
-    user_id = current_user["_id"]
-    
-    # We need to handle the ID format (Collection/Key vs Key)
-    # If exercise_id passed is just the key, we might need to prefix?
-    # Usually frontend passes ID from previous calls, let's assume raw key if not containing '/'
-    
-    # AQL:
-    # 1. Group by User, Calculate Avg Score for this Exercise
-    # 2. Sort by Avg Score DESC
-    # 3. Use `COLLECT ... INTO ...` or array scan to find Rank
-    
-    aql = """
-    LET exercise_key = @exercise_id
-    
-    // 1. Aggregate Stats Per User for this Exercise
-    LET all_stats = (
-        FOR s IN Session
-            // Check if session links to this exercise (Edge: User -> Exercise, or stored property?)
-            // Session schema: _from: User, _to: Exercise
-            FILTER s._to == CONCAT('Exercise/', exercise_key) OR s._to == exercise_key
-            
-            COLLECT user = s._from AGGREGATE 
-                avg_score = AVG(s.score),
-                session_count = COUNT(s)
-            
-            SORT avg_score DESC
-            RETURN { user, avg_score, session_count }
-    )
-    
-    // 2. Calculate Global Stats
-    LET global_avg = AVG(all_stats[*].avg_score)
-    LET total_users = LENGTH(all_stats)
-    
-    // 3. Find Current User's Stats and Rank
-    // We scan the sorted list. The index + 1 is the rank.
-    
-    LET user_stat_list = (
-        FOR item IN all_stats
-            FILTER item.user == @user_id
-            RETURN item
-    )
-    
-    LET user_stat = LENGTH(user_stat_list) > 0 ? user_stat_list[0] : null
-    
-    // Calculate Rank (Index in sorted list) - DISABLED
-    
-    RETURN {
-        "personal_avg": user_stat ? user_stat.avg_score : 0,
-        "session_count": user_stat ? user_stat.session_count : 0,
-        "global_avg": global_avg != null ? global_avg : 0,
-        "total_participants": total_users,
-        "exercise_id": exercise_key
-    }
-    
-    """
-
     try:
-        cursor = db.aql.execute(aql, bind_vars={"exercise_id": exercise_id, "user_id": user_id})
-        if cursor.empty():
-             return {
-                "personal_avg": 0,
-                "session_count": 0,
-                "global_avg": 0,
-
-                "total_participants": 0,
-                "exercise_id": exercise_id
-            }
-        return cursor.next()
+        return await run_db(get_storage().sessions.user_exercise_stats, exercise_id, current_user["_id"])
     except Exception as e:
-        print(f"[Stats Error] Failed to execute AQL: {e}")
+        print(f"[Stats Error] Failed to read aggregates: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/exercise/{exercise_id}/leaderboard")
+async def get_exercise_leaderboard(
+    exercise_id: str,
+    limit: int = Query(10, ge=1, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns the top users of an exercise by average score.
+    """
+    return await run_db(get_storage().sessions.leaderboard, exercise_id, limit)
+
+@router.get("/exercise/{exercise_id}/score-distribution")
+async def get_score_distribution(
+    exercise_id: str,
+    model_version: Optional[str] = None,
+    score: Optional[float] = Query(None, ge=0, le=100),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns p10 / p50 / p90 and the mean of all session scores of an exercise
+    (optionally for one model version), and the percentile of `score` if given.
+    Reads one ScoreSketch document.
+    """
+    sketch = await run_db(get_storage().sessions.score_sketch, exercise_id, model_version)
+    summary = score_sketch.summarize(sketch, score)
+    summary.update({"exercise_id": exercise_id.split("/")[-1], "model_version": model_version or score_sketch.ALL_MODELS})
+    return summary
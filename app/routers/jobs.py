@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from typing import Dict, Any, Optional
+
+from app.routers.auth import get_current_user, get_current_active_developer
+from app.services import jobs
+from app.db.async_db import run_blocking
+
+router = APIRouter()
+
+def _queue_full(e: jobs.QueueFullError) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail=str(e),
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+# The queue is a SQLite file with a 30s busy timeout: while the workers hold its write lock
+# a call can block, so handlers reach it through run_blocking, never on the event loop.
+
+async def ensure_queue_capacity():
+    """
+    Admission control for upload handlers: 503 + Retry-After when the queue is full.
+    Call before accepting the request body so rejected uploads are not written to disk.
+    """
+    try:
+        await run_blocking(jobs.check_capacity)
+    except jobs.QueueFullError as e:
+        raise _queue_full(e)
+
+async def enqueue_job(job_type: str, payload: Dict[str, Any], owner: Optional[str] = None, ref: Optional[str] = None) -> str:
+    """
+    Enqueues a job, translating a full queue into 503 + Retry-After.
+    """
+    try:
+        return await run_blocking(jobs.enqueue, job_type, payload, owner=owner, ref=ref)
+    except jobs.QueueFullError as e:
+        raise _queue_full(e)
+
+@router.get("/stats")
+async def get_queue_stats(current_user: dict = Depends(get_current_active_developer)):
+    """
+    Returns job counts per status and the queue limits.
+    """
+    return await run_blocking(jobs.queue_stats)
+
+@router.get("/{job_id}")
+async def get_job_status(job_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Returns the status of a background job. Users can only see their own jobs.
+    """
+    job = await run_blocking(jobs.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["owner"] != current_user["_key"] and current_user.get("user_type") != "developer":
+        raise HTTPException(status_code=403, detail="Not authorized to view this job")
+    return job
@@ -1,36 +1,48 @@
 
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, BackgroundTasks, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends
 import aiofiles
 import uuid
 import os
+import hashlib
 import magic
 from typing import Optional
 from app.routers.auth import get_current_active_developer
+from app.routers.jobs import ensure_queue_capacity, enqueue_job
+from app.services.jobs import PermanentJobError
 
 from app.services.ingestion import process_video
+from app.services.scoring import invalidate_reference_cache
+from app.services.metadata_cache import get_exercise_by_name, get_latest_model
 from app.db.database import ArangoDBConnection
+from app.db.repositories import get_storage
+from app.db.async_db import run_db
 
 router = APIRouter()
 
 UPLOAD_DIR = "uploaded_videos"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 
-# Helper wrapper
-def process_and_update_ref(video_path: str, user_id: str, exercise_id: str, model_path: Optional[str], video_id: str):
-    # 1. Ingest (and embed if model exists)
-    process_video(video_path, user_id, exercise_id, is_reference=True, model_path=model_path, video_id=video_id)
+# Job handler ("process_and_update_ref" job type, see app/services/jobs.py)
+def process_and_update_ref(video_path: str, user_id: str, exercise_id: str, model_path: Optional[str], video_id: str, content_hash: Optional[str] = None):
+    # 1. Ingest (and embed if model exists), unless an earlier attempt already did
+    video = get_storage().videos.get(video_id)
+    if video and video.get("status") == "complete":
+        print(f"[Reference] Video {video_id} already ingested.")
+    else:
+        video_status = process_video(video_path, user_id, exercise_id, is_reference=True, model_path=model_path, video_id=video_id, content_hash=content_hash)
+        if video_status == "invalid":
+            raise PermanentJobError(f"Uploaded file for reference video {video_id} is missing or not a readable video")
+        if video_status != "complete":
+            raise RuntimeError(f"Ingestion did not complete for reference video {video_id} (status: {video_status})")
     
     # 2. Update Exercise Document
-    try:
-        db = ArangoDBConnection().get_db()
-        db.collection("Exercise").update({"_key": exercise_id, "ref_video_id": video_id})
-        print(f"[Reference] Updated Exercise {exercise_id} with new ref_video_id: {video_id}")
-    except Exception as e:
-        print(f"[Reference] Failed to update Exercise ref_video_id: {e}")
+    db = ArangoDBConnection().get_db()
+    db.collection("Exercise").update({"_key": exercise_id, "ref_video_id": video_id})
+    print(f"[Reference] Updated Exercise {exercise_id} with new ref_video_id: {video_id}")
+    invalidate_reference_cache(exercise_id)
 
 @router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_reference_video(
-    background_tasks: BackgroundTasks,
     exercise_name: str = Form(...),
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_active_developer)
@@ -39,28 +51,21 @@ async def upload_reference_video(
     Uploads a reference video for a specific exercise.
     - If a model exists, generates embeddings immediately.
     - Updates the Exercise document to point to this new reference video.
+    - Processing runs as a "process_and_update_ref" job; 503 + Retry-After when the queue is full.
     """
     user_id = current_user["_key"]
+    await ensure_queue_capacity()
     db = ArangoDBConnection().get_db()
 
-    # 1.5. Resolve Exercise Name
-    aql = "FOR e IN Exercise FILTER e.name == @name RETURN e"
-    cursor = db.aql.execute(aql, bind_vars={"name": exercise_name})
-    if cursor.empty():
+    # 1.5. Resolve Exercise Name (cached)
+    exercise = await run_db(get_exercise_by_name, db, exercise_name)
+    if exercise is None:
          raise HTTPException(status_code=400, detail=f"Exercise '{exercise_name}' not found")
-    exercise = cursor.next()
     exercise_id = exercise["_key"]
 
     # Check for Model (Optional for Reference, but good to have)
-    aql_model = """
-    FOR m IN Model
-        FILTER m.exercise_id == @eid
-        SORT m.created_at DESC
-        LIMIT 1
-        RETURN m.model_path
-    """
-    model_cursor = db.aql.execute(aql_model, bind_vars={"eid": exercise_id})
-    model_path = model_cursor.next() if not model_cursor.empty() else None
+    model = await run_db(get_latest_model, db, exercise_id)
+    model_path = model["model_path"] if model else None
     
     if model_path:
         print(f"[Reference] Found existing model: {model_path}. Embeddings will be generated.")
@@ -103,19 +108,34 @@ async def upload_reference_video(
     
     file_path = os.path.join(UPLOAD_DIR, unique_filename)
     
+    # Hash while streaming to disk; re-uploads of the same clip reuse cached landmarks
+    hasher = hashlib.sha256()
     try:
         async with aiofiles.open(file_path, 'wb') as out_file:
             while content := await file.read(1024 * 1024): # 1MB chunks
+                hasher.update(content)
                 await out_file.write(content)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File upload failed: {str(e)}")
 
     # 4. Background Processing
-    # Use process_and_update_ref wrapper
-    background_tasks.add_task(process_and_update_ref, file_path, user_id, exercise_id, model_path, file_id)
+    # Enqueue the process_and_update_ref job
+    try:
+        job_id = await enqueue_job("process_and_update_ref", {
+            "video_path": file_path,
+            "user_id": user_id,
+            "exercise_id": exercise_id,
+            "model_path": model_path,
+            "video_id": file_id,
+            "content_hash": hasher.hexdigest()
+        }, owner=user_id, ref=file_id)
+    except HTTPException:
+        os.remove(file_path)
+        raise
     
     return {
         "file_id": file_id,
+        "job_id": job_id,
         "message": "Reference video accepted. Processing & Updating Exercise...",
         "status": "processing"
     }
@@ -1,47 +1,57 @@
 
+import io
 import os
 import uuid
+import hashlib
 import aiofiles
 import magic
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, BackgroundTasks, status, Depends
+import numpy as np
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse
 from typing import Optional
 
 from app.routers.auth import get_current_user
+from app.routers.jobs import ensure_queue_capacity, enqueue_job
+from app.services.jobs import get_job_by_ref, PermanentJobError
 
 from app.services.scoring import evaluate_session
 from app.services.ingestion import process_video
+from app.services.metadata_cache import get_exercise_by_name, get_latest_model
+from app.services.frame_blocks import FRAME_RANGE_FIELDS, load_frame_range
+from app.db.repositories import get_storage
 
-# Helper wrapper for background task
-def process_and_evaluate(video_path: str, user_id: str, exercise_id: str, model_path: str, video_id: str):
-    # 1. Ingest & Embed (using the specific model)
-    process_video(video_path, user_id, exercise_id, is_reference=False, model_path=model_path, video_id=video_id)
+# Job handler ("process_and_evaluate" job type, see app/services/jobs.py)
+# Raising marks the attempt as failed so the job queue can retry it (ingestion errors are
+# raised by process_video); PermanentJobError (unreadable upload) and ValueError (e.g. no
+# reference video) fail the job at once.
+def process_and_evaluate(video_path: str, user_id: str, exercise_id: str, model_path: str, video_id: str, content_hash: Optional[str] = None):
+    # 1. Ingest & Embed (using the specific model), unless an earlier attempt already did
+    video = get_storage().videos.get(video_id)
+    if video and video.get("status") == "complete":
+        print(f"[Ingestion] Video {video_id} already ingested. Scoring only.")
+    else:
+        video_status = process_video(video_path, user_id, exercise_id, is_reference=False, model_path=model_path, video_id=video_id, content_hash=content_hash)
+        if video_status == "invalid":
+            raise PermanentJobError(f"Uploaded file for video {video_id} is missing or not a readable video")
+        if video_status != "complete":
+            raise RuntimeError(f"Ingestion did not complete for video {video_id} (status: {video_status})")
     
     # 2. Score
-    try:
-        # We need the video_id that was generated inside process_video.
-        # However, process_video generates a random UUID inside.
-        # Refactor: process_video should ideally take a video_id or return it.
-        # But for now, we know the video_id is the basename of the file without extension if we force it,
-        # OR we can assume `process_video` uses a predictable ID.
-        # Looking at ingestion.py: video_uuid = str(uuid.uuid4())
-        # This is a problem. The caller doesn't know the ID.
-        #
-        # IMPROVEMENT: Let's refactor process_video to return the ID or accept it?
-        # Background tasks can't return values.
-        # FIX: We will change `process_video` signature to accept `video_id` so we can control it here.
-        print(f"[Scoring] Evaluating session for video {video_id}...")
-        result = evaluate_session(user_video_id=video_id, exercise_id=exercise_id)
-        print(f"[Scoring] Session Complete! ")
-    except Exception as e:
-        print(f"[Scoring] Error during evaluation: {e}")
+    # process_video was given our video_id, so the session can be evaluated against it directly.
+    # The Session is keyed by the video, so a retry after it was recorded does not count it twice.
+    print(f"[Scoring] Evaluating session for video {video_id}...")
+    evaluate_session(user_video_id=video_id, exercise_id=exercise_id, model_path=model_path)
+    print(f"[Scoring] Session Complete! ")
 
 
 from app.db.database import ArangoDBConnection
+from app.db.async_db import run_db, run_blocking, get_document
 
 router = APIRouter()
 
 # Configuration
 UPLOAD_DIR = "uploaded_videos"
+MAX_FRAME_RANGE = int(os.getenv("MAX_FRAME_RANGE", "10000")) # Frames per /frames request
 MAX_FILE_SIZE = 100 * 1024 * 1024 # 100 MB
 ALLOWED_MIME_TYPES = ["video/mp4", "video/quicktime", "video/x-msvideo"]
 
@@ -50,7 +60,6 @@ if not os.path.exists(UPLOAD_DIR):
 
 @router.post("/upload", status_code=status.HTTP_202_ACCEPTED)
 async def upload_video(
-    background_tasks: BackgroundTasks,
     exercise_name: str = Form(...),
     file: UploadFile = File(...),
     current_user: dict = Depends(get_current_user)
@@ -61,35 +70,29 @@ async def upload_video(
     - Validates file size and type.
     - Checks if a trained Model exists for the exercise.
     - Saves the file.
-    - Triggers background processing AND Evaluates Score.
+    - Enqueues a "process_and_evaluate" job (ingestion + scoring) and returns its job_id.
+    - Returns 503 with Retry-After when the job queue is full.
     """
     
     # Extract user_id from token
     user_id = current_user["_key"]
 
+    # Reject early if the job queue is saturated
+    await ensure_queue_capacity()
+
     db = ArangoDBConnection().get_db()
     
-    # 0. Resolve Exercise Name to ID
-    aql = "FOR e IN Exercise FILTER e.name == @name RETURN e"
-    cursor = db.aql.execute(aql, bind_vars={"name": exercise_name})
-    if cursor.empty():
+    # 0. Resolve Exercise Name to ID (cached)
+    exercise = await run_db(get_exercise_by_name, db, exercise_name)
+    if exercise is None:
          raise HTTPException(status_code=400, detail=f"Exercise '{exercise_name}' not found")
-    exercise = cursor.next()
     exercise_id = exercise["_key"]
 
-    # 0.5 Check for Trained Model
-    aql_model = """
-    FOR m IN Model
-        FILTER m.exercise_id == @eid
-        SORT m.created_at DESC
-        LIMIT 1
-        RETURN m
-    """
-    model_cursor = db.aql.execute(aql_model, bind_vars={"eid": exercise_id})
-    if model_cursor.empty():
+    # 0.5 Check for Trained Model (cached, invalidated when a model is trained)
+    model = await run_db(get_latest_model, db, exercise_id)
+    if model is None:
          raise HTTPException(status_code=400, detail=f"No trained model available for exercise '{exercise_name}'.")
     
-    model = model_cursor.next()
     model_path = model["model_path"] # e.g. "stgcn_simclr.pth"
 
     # 1. Size Validation (Check Content-Length header first as a quick reject)
@@ -129,6 +132,8 @@ async def upload_video(
     file_path = os.path.join(UPLOAD_DIR, secure_filename)
 
     # 4. Save File with Size Limit Check
+    # The file is hashed while it streams to disk; the digest keys the landmark cache.
+    hasher = hashlib.sha256()
     try:
         size = 0
         async with aiofiles.open(file_path, 'wb') as out_file:
@@ -142,6 +147,7 @@ async def upload_video(
                         status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                         detail=f"File exceeds maximum size of {MAX_FILE_SIZE} bytes."
                     )
+                hasher.update(content)
                 await out_file.write(content)
                 
     except HTTPException:
@@ -154,11 +160,137 @@ async def upload_video(
 
     
     # Pass generated file_id as the video_id for DB consistency
-    
-    background_tasks.add_task(process_and_evaluate, file_path, user_id, exercise_id, model_path, file_id)
+    try:
+        job_id = await enqueue_job("process_and_evaluate", {
+            "video_path": file_path,
+            "user_id": user_id,
+            "exercise_id": exercise_id,
+            "model_path": model_path,
+            "video_id": file_id,
+            "content_hash": hasher.hexdigest()
+        }, owner=user_id, ref=file_id)
+    except HTTPException:
+        os.remove(file_path)
+        raise
 
     return {
         "file_id": file_id,
+        "job_id": job_id,
         "message": "Video accepted. Scoring in progress...",
         "status": "processing"
     }
+
+@router.get("/{video_id}/status")
+async def get_video_status(video_id: str, current_user: dict = Depends(get_current_user)):
+    """
+    Returns live processing progress for an uploaded video:
+    - status: queued | processing | embedded | complete | failed
+    - progress: current stage and frame counters
+    - processing_stats: wall time, fps and peak memory per ingestion / scoring stage
+    - job: the background job driving the processing, if any
+    """
+    db = ArangoDBConnection().get_db()
+    video = await get_document(db, "Video", video_id)
+    job = await run_blocking(get_job_by_ref, video_id)
+    
+    owner = video["uploader_user_id"] if video else (job["owner"] if job else None)
+    if owner is None:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if owner != current_user["_key"] and current_user.get("user_type") != "developer":
+        raise HTTPException(status_code=403, detail="Not authorized to view this video")
+        
+    if job:
+        job.pop("owner", None)
+        
+    if not video:
+        # Accepted but no worker has picked it up yet
+        return {"video_id": video_id, "status": "queued", "progress": None, "processing_stats": None, "job": job}
+        
+    return {
+        "video_id": video_id,
+        "status": video.get("status", "complete"),
+        "progress": video.get("progress"),
+        "processing_stats": video.get("processing_stats"),
+        "landmark_cache": video.get("landmark_cache"),
+        "job": job
+    }
+
+def _frames_json(data: dict) -> dict:
+    # NaN rows (no pose / no embedding) become null
+    body = {"frame_number": data["frame_number"].tolist()}
+    if "landmarks" in data:
+        body["landmarks"] = [None if np.isnan(row[0, 0]) else row.tolist() for row in data["landmarks"]]
+    if "embedding" in data:
+        body["embedding"] = [None if np.isnan(row[0]) else row.tolist() for row in data["embedding"]]
+    return body
+
+@router.get("/{video_id}/frames")
+async def get_video_frames(
+    video_id: str,
+    request: Request,
+    start: int = Query(0, ge=0),
+    end: Optional[int] = Query(None, ge=1, description="Exclusive; defaults to the end of the video"),
+    fields: str = Query("landmarks", description="Comma separated: landmarks, embedding"),
+    format: str = Query("json", pattern="^(json|npy|npz)$"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Returns stored pose data for frames [start, end) of a video, read with an index range scan.
+    
+    - json: {"frame_number": [...], "landmarks": T x 33 x [x, y, z, visibility], "embedding": T x 128}
+      (null for frames without a pose / embedding)
+    - npy: one float32 array, landmarks (T, 33, 4) or embedding (T, 128), NaN rows for missing
+      frames; requires exactly one field. The frame range is in the X-Frame-Start / X-Frame-End headers.
+    - npz: all requested fields plus frame_number in one archive
+    
+    Completed videos are immutable, so their responses carry an ETag (If-None-Match gives 304).
+    """
+    requested = list(dict.fromkeys(f.strip() for f in fields.split(",") if f.strip()))
+    unknown = [f for f in requested if f not in FRAME_RANGE_FIELDS]
+    if not requested or unknown:
+        raise HTTPException(status_code=400, detail=f"fields must be a subset of {', '.join(FRAME_RANGE_FIELDS)}")
+    if format == "npy" and len(requested) != 1:
+        raise HTTPException(status_code=400, detail="format=npy returns one array; request exactly one field or use npz")
+    
+    db = ArangoDBConnection().get_db()
+    video = await get_document(db, "Video", video_id)
+    if not video:
+        raise HTTPException(status_code=404, detail="Video not found")
+    if video["uploader_user_id"] != current_user["_key"] and not video.get("is_reference") and current_user.get("user_type") != "developer":
+        raise HTTPException(status_code=403, detail="Not authorized to view this video")
+    
+    frame_count = video.get("frame_count")
+    if end is None:
+        end = frame_count if frame_count else start + MAX_FRAME_RANGE
+    elif frame_count:
+        end = min(end, frame_count)
+    if end - start > MAX_FRAME_RANGE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_FRAME_RANGE} frames per request")
+    
+    etag = None
+    headers = {"X-Frame-Start": str(start), "X-Frame-End": str(end)}
+    if video.get("status") == "complete":
+        # _rev changes whenever the video (or its stored embeddings) is updated
+        tag = f"{video_id}:{video.get('_rev')}:{start}:{end}:{','.join(requested)}:{format}"
+        etag = '"' + hashlib.sha1(tag.encode("utf-8")).hexdigest() + '"'
+        headers.update({"ETag": etag, "Cache-Control": "private, max-age=3600"})
+        if etag in [t.strip() for t in request.headers.get("if-none-match", "").split(",")]:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    
+    data = await run_db(load_frame_range, db, video_id, start, end, requested)
+    
+    if format == "json":
+        body = _frames_json(data)
+        body.update({"video_id": video_id, "start": start, "end": end})
+        return JSONResponse(body, headers=headers)
+    
+    buf = io.BytesIO()
+    if format == "npy":
+        np.save(buf, data[requested[0]], allow_pickle=False)
+    else:
+        np.savez(buf, **data)
+    return Response(
+        content=buf.getvalue(),
+        media_type="application/octet-stream",
+        headers=dict(headers, **{"Content-Disposition": f"attachment; filename={video_id}_{start}_{end}.{format}"})
+    )
@@ -0,0 +1,329 @@
+import sys
+import os
+import time
+import argparse
+from typing import Dict, Any, Optional, List
+
+from arango.exceptions import AQLQueryExecuteError
+
+# Ensure the project root is in the python path when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import ArangoDBConnection
+from app.services.score_sketch import sketch_key, score_bucket, ALL_MODELS, SCORE_SKETCH_RESOLUTION
+
+# Incrementally maintained score aggregates, updated in the same AQL query (and thus the
+# same transaction) that inserts a Session edge:
+#
+#   ExerciseUserStats  key "<exercise_key>_<user_key>"
+#       sum, count, best, last, last_at, avg of one user's scores on one exercise
+#   ExerciseRank       key "<exercise_key>"
+#       users, avg_sum (sum of the users' averages) and `buckets`: a sparse histogram
+#       {"<floor(avg * 10)>": users} of user averages at 0.1 score resolution
+#   DailyActivity      key "<YYYY-MM-DD>_<user_key>_<exercise_key>"
+#       sessions per user, exercise and day, with username / exercise name denormalized
+#   ScoreSketch        score distribution per exercise and per model version (see score_sketch.py)
+#
+# Scores are bounded (0-100), so the histogram has at most 1001 buckets and rank /
+# percentile lookups cost a bounded scan of one document regardless of user count.
+RANK_BUCKETS_PER_POINT = 10
+RECORD_SESSION_RETRIES = 5
+
+RECORD_SESSION_AQL = """
+LET session = FIRST(INSERT @session INTO Session RETURN NEW)
+
+LET stats = FIRST(
+    UPSERT { _key: @stats_key }
+    INSERT {
+        _key: @stats_key, exercise_id: @exercise_key, user_id: @session._from,
+        sum: @score, count: 1, best: @score, last: @score, last_at: @session.timestamp, avg: @score
+    }
+    UPDATE {
+        sum: OLD.sum + @score, count: OLD.count + 1, best: MAX([OLD.best, @score]),
+        last: @score, last_at: @session.timestamp, avg: (OLD.sum + @score) / (OLD.count + 1)
+    }
+    IN ExerciseUserStats
+    RETURN { old_avg: OLD ? OLD.avg : null, new_avg: NEW.avg }
+)
+
+LET old_bucket = stats.old_avg == null ? null : TO_STRING(FLOOR(stats.old_avg * @resolution))
+LET new_bucket = TO_STRING(FLOOR(stats.new_avg * @resolution))
+
+UPSERT { _key: @exercise_key }
+INSERT { _key: @exercise_key, exercise_id: @exercise_key, users: 1, avg_sum: stats.new_avg, buckets: { [new_bucket]: 1 } }
+UPDATE {
+    users: OLD.users + (old_bucket == null ? 1 : 0),
+    avg_sum: OLD.avg_sum + stats.new_avg - NOT_NULL(stats.old_avg, 0),
+    buckets: old_bucket == new_bucket ? OLD.buckets : MERGE(
+        OLD.buckets,
+        old_bucket == null ? {} : { [old_bucket]: OLD.buckets[old_bucket] - 1 },
+        { [new_bucket]: NOT_NULL(OLD.buckets[new_bucket], 0) + 1 }
+    )
+}
+IN ExerciseRank OPTIONS { mergeObjects: false }
+
+LET day = SUBSTRING(@session.timestamp, 0, 10)
+LET activity_key = CONCAT(day, "_", LAST(SPLIT(@session._from, "/")), "_", @exercise_key)
+UPSERT { _key: activity_key }
+INSERT {
+    _key: activity_key, date: day, user_id: @session._from, exercise_id: @exercise_key,
+    username: DOCUMENT(@session._from).username, exercise_name: DOCUMENT(@session._to).name, count: 1
+}
+UPDATE { count: OLD.count + 1 }
+IN DailyActivity
+
+LET sketch_updates = (
+    FOR sketch IN @sketches
+        UPSERT { _key: sketch.key }
+        INSERT {
+            _key: sketch.key, exercise_id: @exercise_key, model_version: sketch.model_version,
+            count: 1, sum: @score, buckets: { [@score_bucket]: 1 }
+        }
+        UPDATE { count: OLD.count + 1, sum: OLD.sum + @score, buckets: { [@score_bucket]: NOT_NULL(OLD.buckets[@score_bucket], 0) + 1 } }
+        IN ScoreSketch
+)
+
+RETURN { _id: session._id, _key: session._key }
+"""
+
+def _key_of(handle: str) -> str:
+    return handle.split("/")[-1]
+
+def stats_key(exercise_id: str, user_id: str) -> str:
+    return f"{_key_of(exercise_id)}_{_key_of(user_id)}"
+
+def rank_bucket(avg: float) -> int:
+    return int(avg * RANK_BUCKETS_PER_POINT)
+
+def record_session(db, session_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Inserts a Session edge and updates ExerciseUserStats / ExerciseRank / DailyActivity /
+    ScoreSketch atomically.
+    Returns the new edge's {_id, _key}. Write-write conflicts on the aggregates are retried;
+    the whole query is one transaction, so a retry never duplicates the Session.
+    If session_data has a `_key` that is already stored, nothing is written and the
+    existing edge is returned (recording the same session twice is a no-op).
+    """
+    bind_vars = {
+        "session": session_data,
+        "score": session_data["score"],
+        "exercise_key": _key_of(session_data["_to"]),
+        "stats_key": stats_key(session_data["_to"], session_data["_from"]),
+        "resolution": RANK_BUCKETS_PER_POINT,
+        "score_bucket": str(score_bucket(session_data["score"])),
+        "sketches": [
+            {"key": sketch_key(session_data["_to"], version), "model_version": version or ALL_MODELS}
+            for version in {None, session_data.get("model_version")}
+        ]
+    }
+    for attempt in range(RECORD_SESSION_RETRIES):
+        # Checked on every attempt: a concurrent insert of the same key fails with 1210
+        if "_key" in session_data:
+            existing = db.collection("Session").get(session_data["_key"])
+            if existing:
+                return {"_id": existing["_id"], "_key": existing["_key"]}
+        try:
+            return next(db.aql.execute(RECORD_SESSION_AQL, bind_vars=bind_vars))
+        except AQLQueryExecuteError as e:
+            # 1200: write-write conflict, 1210: concurrent UPSERT inserted the same key
+            if e.error_code not in (1200, 1210) or attempt == RECORD_SESSION_RETRIES - 1:
+                raise
+            time.sleep(0.05 * (attempt + 1))
+
+def rank_from_histogram(rank_doc: Optional[Dict[str, Any]], avg: float) -> Dict[str, Any]:
+    """
+    Rank (1 = best) and percentile (share of other users with a lower average) of `avg`.
+    """
+    if not rank_doc or not rank_doc.get("users"):
+        return {"rank": None, "percentile": None}
+    mine = rank_bucket(avg)
+    above = below = 0
+    for bucket, count in rank_doc["buckets"].items():
+        bucket = int(bucket)
+        if bucket > mine:
+            above += count
+        elif bucket < mine:
+            below += count
+    others = rank_doc["users"] - 1
+    return {
+        "rank": above + 1,
+        "percentile": round(100.0 * below / others, 1) if others > 0 else 100.0
+    }
+
+def get_user_exercise_stats(db, exercise_id: str, user_id: str) -> Dict[str, Any]:
+    """
+    O(1) stats read: one ExerciseUserStats and one ExerciseRank document.
+    """
+    exercise_key = _key_of(exercise_id)
+    try:
+        user_stats = db.collection("ExerciseUserStats").get(stats_key(exercise_id, user_id))
+        rank_doc = db.collection("ExerciseRank").get(exercise_key)
+    except Exception:
+        user_stats, rank_doc = None, None
+    return user_exercise_stats_from(exercise_key, user_stats, rank_doc)
+
+def user_exercise_stats_from(exercise_key: str, user_stats: Optional[Dict[str, Any]], rank_doc: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The stats response built from an ExerciseUserStats and an ExerciseRank document (either may be None).
+    """
+    total_users = rank_doc["users"] if rank_doc else 0
+    result = {
+        "personal_avg": user_stats["avg"] if user_stats else 0,
+        "session_count": user_stats["count"] if user_stats else 0,
+        "best_score": user_stats["best"] if user_stats else None,
+        "last_score": user_stats["last"] if user_stats else None,
+        "global_avg": rank_doc["avg_sum"] / total_users if total_users else 0,
+        "total_participants": total_users,
+        "exercise_id": exercise_key,
+        "rank": None,
+        "percentile": None
+    }
+    if user_stats:
+        result.update(rank_from_histogram(rank_doc, user_stats["avg"]))
+    return result
+
+def get_leaderboard(db, exercise_id: str, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Top users of an exercise by average score (served by the [exercise_id, avg] index).
+    """
+    aql = """
+    FOR st IN ExerciseUserStats
+        FILTER st.exercise_id == @exercise_key
+        SORT st.avg DESC
+        LIMIT @limit
+        LET user = DOCUMENT(st.user_id)
+        RETURN {
+            "username": user.username,
+            "avg_score": st.avg,
+            "best_score": st.best,
+            "session_count": st.count
+        }
+    """
+    leaders = list(db.aql.execute(aql, bind_vars={"exercise_key": _key_of(exercise_id), "limit": limit}))
+    for position, row in enumerate(leaders, start=1):
+        row["rank"] = position
+    return leaders
+
+def rebuild_aggregates(db, exercise_id: Optional[str] = None):
+    """
+    Recomputes ExerciseUserStats and ExerciseRank from the Session edges
+    (backfill for sessions recorded before the aggregates existed, or repair).
+    """
+    exercise_key = _key_of(exercise_id) if exercise_id else None
+    stats_aql = """
+    FOR s IN Session
+        LET ex_key = LAST(SPLIT(s._to, "/"))
+        FILTER @exercise_key == null OR ex_key == @exercise_key
+        COLLECT exercise_key = ex_key, user_id = s._from INTO group = s
+        LET scores = group[*].score
+        LET last_session = FIRST(FOR g IN group SORT g.timestamp DESC LIMIT 1 RETURN g)
+        LET total = SUM(scores)
+        UPSERT { _key: CONCAT(exercise_key, "_", LAST(SPLIT(user_id, "/"))) }
+        INSERT {
+            _key: CONCAT(exercise_key, "_", LAST(SPLIT(user_id, "/"))), exercise_id: exercise_key, user_id: user_id,
+            sum: total, count: LENGTH(scores), best: MAX(scores), last: last_session.score,
+            last_at: last_session.timestamp, avg: total / LENGTH(scores)
+        }
+        UPDATE {
+            sum: total, count: LENGTH(scores), best: MAX(scores), last: last_session.score,
+            last_at: last_session.timestamp, avg: total / LENGTH(scores)
+        }
+        IN ExerciseUserStats
+    """
+    db.aql.execute(stats_aql, bind_vars={"exercise_key": exercise_key})
+
+    rank_aql = """
+    FOR st IN ExerciseUserStats
+        FILTER @exercise_key == null OR st.exercise_id == @exercise_key
+        COLLECT exercise_key = st.exercise_id, bucket = TO_STRING(FLOOR(st.avg * @resolution))
+            AGGREGATE users = COUNT(1), avg_sum = SUM(st.avg)
+        COLLECT ex = exercise_key INTO per_bucket = { bucket, users, avg_sum }
+        UPSERT { _key: ex }
+        INSERT { _key: ex, exercise_id: ex, users: SUM(per_bucket[*].users), avg_sum: SUM(per_bucket[*].avg_sum),
+                 buckets: ZIP(per_bucket[*].bucket, per_bucket[*].users) }
+        UPDATE { users: SUM(per_bucket[*].users), avg_sum: SUM(per_bucket[*].avg_sum),
+                 buckets: ZIP(per_bucket[*].bucket, per_bucket[*].users) }
+        IN ExerciseRank OPTIONS { mergeObjects: false }
+    """
+    db.aql.execute(rank_aql, bind_vars={"exercise_key": exercise_key, "resolution": RANK_BUCKETS_PER_POINT})
+
+def rebuild_score_sketches(db, exercise_id: Optional[str] = None):
+    """
+    Recomputes ScoreSketch documents from the Session edges.
+    Sessions recorded before model_version was stored only count towards the "all" sketch.
+    """
+    aql = """
+    FOR s IN Session
+        LET ex_key = LAST(SPLIT(s._to, "/"))
+        FILTER @exercise_key == null OR ex_key == @exercise_key
+        LET bucket = TO_STRING(FLOOR(MIN([MAX([s.score, 0]), 100]) * @resolution))
+        FOR version IN UNIQUE([@all, NOT_NULL(s.model_version, @all)])
+            COLLECT exercise_key = ex_key, model_version = version, b = bucket AGGREGATE n = COUNT(1), total = SUM(s.score)
+            COLLECT ek = exercise_key, mv = model_version INTO per_bucket = { b, n, total }
+            LET key = CONCAT(ek, "_", mv)
+            UPSERT { _key: key }
+            INSERT { _key: key, exercise_id: ek, model_version: mv, count: SUM(per_bucket[*].n),
+                     sum: SUM(per_bucket[*].total), buckets: ZIP(per_bucket[*].b, per_bucket[*].n) }
+            UPDATE { count: SUM(per_bucket[*].n), sum: SUM(per_bucket[*].total), buckets: ZIP(per_bucket[*].b, per_bucket[*].n) }
+            IN ScoreSketch OPTIONS { mergeObjects: false }
+    """
+    db.aql.execute(aql, bind_vars={
+        "exercise_key": exercise_id.split("/")[-1] if exercise_id else None,
+        "resolution": SCORE_SKETCH_RESOLUTION,
+        "all": ALL_MODELS
+    })
+
+def get_daily_activity(db, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Daily activity rows for dates in [start, end] (inclusive, "YYYY-MM-DD"; open-ended if None).
+    """
+    aql = """
+    FOR a IN DailyActivity
+        FILTER (@start == null OR a.date >= @start) AND (@end == null OR a.date <= @end)
+        SORT a.date DESC, a.username ASC
+        RETURN {
+            "username": a.username,
+            "exercise": a.exercise_name,
+            "date": a.date,
+            "count": a.count
+        }
+    """
+    return list(db.aql.execute(aql, bind_vars={"start": start, "end": end}))
+
+def backfill_daily_activity(start: Optional[str] = None, end: Optional[str] = None):
+    """
+    Rebuilds DailyActivity rows from Session edges for dates in [start, end].
+    Runs as the "backfill_daily_activity" job; existing rows in the range are overwritten.
+    """
+    db = ArangoDBConnection().get_db()
+    aql = """
+    FOR s IN Session
+        LET day = SUBSTRING(s.timestamp, 0, 10)
+        FILTER (@start == null OR day >= @start) AND (@end == null OR day <= @end)
+        COLLECT user_id = s._from, exercise_handle = s._to, date = day WITH COUNT INTO count
+        LET exercise_key = LAST(SPLIT(exercise_handle, "/"))
+        LET activity_key = CONCAT(date, "_", LAST(SPLIT(user_id, "/")), "_", exercise_key)
+        UPSERT { _key: activity_key }
+        INSERT {
+            _key: activity_key, date: date, user_id: user_id, exercise_id: exercise_key,
+            username: DOCUMENT(user_id).username, exercise_name: DOCUMENT(exercise_handle).name, count: count
+        }
+        UPDATE { count: count }
+        IN DailyActivity
+        COLLECT WITH COUNT INTO rows
+        RETURN rows
+    """
+    rows = next(db.aql.execute(aql, bind_vars={"start": start, "end": end}), 0)
+    print(f"[Aggregates] Backfilled {rows} DailyActivity rows ({start or 'beginning'} .. {end or 'now'}).")
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild ExerciseUserStats / ExerciseRank / ScoreSketch / DailyActivity from Session edges.")
+    parser.add_argument("--exercise-id", default=None, help="Only rebuild this exercise's stats")
+    parser.add_argument("--activity-only", action="store_true", help="Only backfill DailyActivity")
+    args = parser.parse_args()
+    if not args.activity_only:
+        rebuild_aggregates(ArangoDBConnection().get_db(), args.exercise_id)
+        rebuild_score_sketches(ArangoDBConnection().get_db(), args.exercise_id)
+    backfill_daily_activity()
+    print("Aggregates rebuilt.")
@@ -13,19 +13,19 @@ def calculate_similarity(user_seq: List[List[float]], ref_seq: List[List[float]]
     3. Score Normalization: Exponential Decay.
     
     Args:
-        user_seq: List of N embedding vectors (each 128-dim).
-        ref_seq: List of M embedding vectors (each 128-dim).
+        user_seq: N embedding vectors (each 128-dim), as a list or (N, 128) array.
+        ref_seq: M embedding vectors (each 128-dim), as a list or (M, 128) array.
         
     Returns:
         float: A normalized score between 0 and 100.
     """
-    if not user_seq or not ref_seq:
+    if len(user_seq) == 0 or len(ref_seq) == 0:
         return 0.0
 
     # Convert to numpy arrays
     # Shape: (N, D) and (M, D)
-    u_mat = np.array(user_seq, dtype=np.float32)
-    r_mat = np.array(ref_seq, dtype=np.float32)
+    u_mat = np.asarray(user_seq, dtype=np.float32)
+    r_mat = np.asarray(ref_seq, dtype=np.float32)
     
     # 1. Compute Distance Matrix (Cosine Distance)
     # Cosine Distance = 1 - Cosine Similarity
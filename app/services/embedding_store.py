@@ -0,0 +1,54 @@
+import os
+import re
+import base64
+import datetime
+from typing import Optional
+
+import numpy as np
+
+from app.services.frame_blocks import EMBEDDING_DIM
+
+# One VideoEmbedding document per (video, model): the whole non-null embedding sequence
+# as a single packed little-endian float32 (M, 128) matrix, keyed "<video_id>_<model_version>".
+# Scoring fetches it with a primary-key read instead of an AQL scan over the video's frames.
+
+def model_version_for(model_path: str) -> str:
+    """
+    Derives a document-key-safe model version tag from a model file path.
+    """
+    version = os.path.splitext(os.path.basename(model_path))[0]
+    return re.sub(r"[^A-Za-z0-9_\-]", "_", version)
+
+def embedding_key(video_id: str, model_path: str) -> str:
+    return f"{video_id}_{model_version_for(model_path)}"
+
+def save_video_embeddings(db, video_id: str, model_path: str, embeddings: np.ndarray):
+    """
+    Stores the (M, 128) embedding matrix of a video for `model_path`, replacing any previous one.
+    """
+    matrix = np.ascontiguousarray(embeddings, dtype="<f4").reshape(-1, EMBEDDING_DIM)
+    doc = {
+        "_key": embedding_key(video_id, model_path),
+        "video_id": video_id,
+        "model_version": model_version_for(model_path),
+        "model_path": model_path,
+        "count": int(matrix.shape[0]),
+        "dim": EMBEDDING_DIM,
+        "dtype": "float32",
+        "data": base64.b64encode(matrix.tobytes()).decode("ascii"),
+        "created_at": datetime.datetime.utcnow().isoformat()
+    }
+    db.collection("VideoEmbedding").insert(doc, overwrite=True)
+
+def get_embedding_matrix(db, video_id: str, model_path: str) -> Optional[np.ndarray]:
+    """
+    Returns the stored (M, 128) float32 matrix for (video_id, model), or None if absent.
+    The array is a read-only view over the decoded bytes (np.frombuffer, no element copy).
+    """
+    try:
+        doc = db.collection("VideoEmbedding").get(embedding_key(video_id, model_path))
+    except Exception:
+        return None
+    if not doc or not doc.get("count"):
+        return None
+    return np.frombuffer(base64.b64decode(doc["data"]), dtype="<f4").reshape(doc["count"], doc["dim"])
@@ -0,0 +1,428 @@
+import os
+import time
+import base64
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+from app.db.bulk_writer import bulk_import, BULK_CHUNK_SIZE
+from app.services.replication import append_change
+
+# Frame storage format for newly ingested videos:
+#   "frame" - one Frame document per frame (pose_landmark as 33 JSON objects) + FrameEdge chain
+#   "block" - FrameBlock documents holding N consecutive frames as packed little-endian arrays
+# Readers handle both; the format used is recorded on the Video document as `frame_storage`.
+# "frame" stays the default: code outside frame_blocks that reads Frame or walks FrameEdge
+# sees no rows for block videos, so "block" is opt-in.
+# Videos moved to the cold tier by the retention job (Video.storage_tier == "cold") have no
+# Frame / FrameBlock rows left; their frames live in one zstd-compressed FrameArchive document
+# and are decompressed on read (format "archive" below).
+FRAME_STORAGE_FORMAT = os.getenv("FRAME_STORAGE_FORMAT", "frame")
+FRAME_BLOCK_SIZE = int(os.getenv("FRAME_BLOCK_SIZE", "256"))
+FRAME_BLOCK_DTYPE = os.getenv("FRAME_BLOCK_DTYPE", "float32") # or "float16"
+# Frame format only: "materialize" writes a FrameEdge per frame; "derive" writes none and the
+# chain is read from the (video_id, frame_number) index (see frame_chain.py).
+# Recorded on the Video document as `frame_edges` ("materialized" / "derived").
+FRAME_EDGE_MODE = os.getenv("FRAME_EDGE_MODE", "materialize")
+
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = ("x", "y", "z", "visibility")
+EMBEDDING_DIM = 128
+
+# --- Encode / Decode Helpers ---
+
+def encode_array(arr: np.ndarray, dtype: str) -> str:
+    """
+    Packs an array as base64 of its little-endian bytes in `dtype`.
+    """
+    packed = np.ascontiguousarray(arr, dtype=np.dtype(dtype).newbyteorder("<"))
+    return base64.b64encode(packed.tobytes()).decode("ascii")
+
+def decode_array(data: str, dtype: str, shape) -> np.ndarray:
+    """
+    Inverse of encode_array. Returns a read-only view over the decoded bytes.
+    """
+    return np.frombuffer(base64.b64decode(data), dtype=np.dtype(dtype).newbyteorder("<")).reshape(shape)
+
+def landmarks_to_array(landmarks_list: List[List[Dict[str, float]]]) -> np.ndarray:
+    """
+    Converts per-frame landmark dict lists to a (N, 33, 4) float32 array.
+    Frames without a detected pose become NaN rows.
+    """
+    arr = np.full((len(landmarks_list), NUM_LANDMARKS, len(LANDMARK_FIELDS)), np.nan, dtype=np.float32)
+    for t, landmarks in enumerate(landmarks_list):
+        for i, lm in enumerate(landmarks[:NUM_LANDMARKS]):
+            arr[t, i] = (lm["x"], lm["y"], lm["z"], lm["visibility"])
+    return arr
+
+def array_to_landmarks(arr: np.ndarray) -> List[List[Dict[str, float]]]:
+    """
+    Converts a (N, 33, 4) array back to the Frame document landmark format.
+    """
+    frames = []
+    for row in arr:
+        if np.isnan(row[0, 0]):
+            frames.append([])
+            continue
+        frames.append([
+            {"id": i, "x": float(lm[0]), "y": float(lm[1]), "z": float(lm[2]), "visibility": float(lm[3])}
+            for i, lm in enumerate(row)
+        ])
+    return frames
+
+def embeddings_to_array(embeddings: List[Optional[List[float]]]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Converts per-frame embeddings (None where no window ended) to a (N, 128) array and a (N,) mask.
+    """
+    arr = np.zeros((len(embeddings), EMBEDDING_DIM), dtype=np.float32)
+    mask = np.zeros(len(embeddings), dtype=np.uint8)
+    for t, emb in enumerate(embeddings):
+        if emb is not None:
+            arr[t] = emb
+            mask[t] = 1
+    return arr, mask
+
+def build_frame_block(video_id: str, block_index: int, start_frame: int, fps: float,
+                      landmarks_list: List[List[Dict[str, float]]],
+                      embeddings: Optional[List[Optional[List[float]]]] = None,
+                      dtype: str = None) -> Dict[str, Any]:
+    """
+    Builds a FrameBlock document for frames [start_frame, start_frame + N).
+    """
+    dtype = dtype or FRAME_BLOCK_DTYPE
+    n = len(landmarks_list)
+    doc = {
+        "_key": f"{video_id}_b{block_index}",
+        "video_id": video_id,
+        "block_index": block_index,
+        "start_frame": start_frame,
+        "frame_count": n,
+        "fps": fps,
+        "dtype": dtype,
+        "landmarks": encode_array(landmarks_to_array(landmarks_list), dtype),
+        "embeddings": None,
+        "embedding_mask": None
+    }
+    if embeddings is not None:
+        set_block_embeddings(doc, embeddings)
+    return doc
+
+def set_block_embeddings(doc: Dict[str, Any], embeddings: List[Optional[List[float]]]):
+    """
+    (Re)packs the embeddings of a FrameBlock document in place.
+    """
+    emb_arr, mask = embeddings_to_array(embeddings)
+    doc["embeddings"] = encode_array(emb_arr, doc["dtype"])
+    doc["embedding_mask"] = base64.b64encode(mask.tobytes()).decode("ascii")
+
+def decode_frame_block(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decodes a FrameBlock document into float32 arrays:
+    landmarks (N, 33, 4), embeddings (N, 128) or None, embedding_mask (N,) bool or None.
+    """
+    n = doc["frame_count"]
+    dtype = doc.get("dtype", "float32")
+    block = {
+        "start_frame": doc["start_frame"],
+        "frame_count": n,
+        "landmarks": decode_array(doc["landmarks"], dtype, (n, NUM_LANDMARKS, len(LANDMARK_FIELDS))).astype(np.float32),
+        "embeddings": None,
+        "embedding_mask": None
+    }
+    if doc.get("embeddings"):
+        block["embeddings"] = decode_array(doc["embeddings"], dtype, (n, EMBEDDING_DIM)).astype(np.float32)
+        block["embedding_mask"] = np.frombuffer(base64.b64decode(doc["embedding_mask"]), dtype=np.uint8).astype(bool)
+    return block
+
+# --- Cold Tier (FrameArchive) ---
+
+ARCHIVE_ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+
+def _zstd():
+    # Optional dependency: only needed once videos are archived
+    try:
+        import zstandard
+    except ImportError:
+        raise RuntimeError("The 'zstandard' package is required to read or write archived (cold tier) videos.")
+    return zstandard
+
+def _compress(arr: np.ndarray, dtype: str, level: int) -> str:
+    packed = np.ascontiguousarray(arr, dtype=np.dtype(dtype).newbyteorder("<"))
+    return base64.b64encode(_zstd().ZstdCompressor(level=level).compress(packed.tobytes())).decode("ascii")
+
+def _decompress(data: str, dtype: str, shape) -> np.ndarray:
+    raw = _zstd().ZstdDecompressor().decompress(base64.b64decode(data))
+    return np.frombuffer(raw, dtype=np.dtype(dtype).newbyteorder("<")).reshape(shape)
+
+def build_frame_archive(video_id: str, fps: float, landmarks: np.ndarray, embeddings: Optional[np.ndarray],
+                        embedding_mask: Optional[np.ndarray], dtype: str = "float32", level: int = None) -> Dict[str, Any]:
+    """
+    Packs all frames of a video ((T, 33, 4) landmarks, (T, 128) embeddings + (T,) mask) into one
+    FrameArchive document with zstd-compressed arrays.
+    """
+    level = level or ARCHIVE_ZSTD_LEVEL
+    n = len(landmarks)
+    doc = {
+        "_key": video_id,
+        "video_id": video_id,
+        "frame_count": n,
+        "fps": fps,
+        "dtype": dtype,
+        "codec": "zstd",
+        "level": level,
+        "landmarks": _compress(landmarks, dtype, level),
+        "embeddings": None,
+        "embedding_mask": None,
+        "raw_bytes": int(landmarks.size * np.dtype(dtype).itemsize)
+    }
+    if embeddings is not None and embedding_mask is not None and embedding_mask.any():
+        doc["embeddings"] = _compress(embeddings, dtype, level)
+        doc["embedding_mask"] = _compress(embedding_mask.astype(np.uint8), "uint8", level)
+        doc["raw_bytes"] += int(embeddings.size * np.dtype(dtype).itemsize + n)
+    doc["compressed_bytes"] = sum(len(doc[f]) * 3 // 4 for f in ("landmarks", "embeddings", "embedding_mask") if doc[f])
+    return doc
+
+def decode_frame_archive(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Decodes a FrameArchive document into the same structure as decode_frame_block (one block of all frames).
+    """
+    n = doc["frame_count"]
+    dtype = doc.get("dtype", "float32")
+    block = {
+        "start_frame": 0,
+        "frame_count": n,
+        "landmarks": _decompress(doc["landmarks"], dtype, (n, NUM_LANDMARKS, len(LANDMARK_FIELDS))).astype(np.float32),
+        "embeddings": None,
+        "embedding_mask": None
+    }
+    if doc.get("embeddings"):
+        block["embeddings"] = _decompress(doc["embeddings"], dtype, (n, EMBEDDING_DIM)).astype(np.float32)
+        block["embedding_mask"] = _decompress(doc["embedding_mask"], "uint8", (n,)).astype(bool)
+    return block
+
+def load_frame_archive(db, video_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        doc = db.collection("FrameArchive").get(video_id)
+    except Exception:
+        doc = None
+    return decode_frame_archive(doc) if doc else None
+
+# --- Storage-Agnostic Readers / Writers ---
+
+def video_storage_format(db, video_id: str) -> str:
+    """
+    "frame", "block" or "archive" (cold tier).
+    """
+    try:
+        video = db.collection("Video").get(video_id)
+    except Exception:
+        video = None
+    video = video or {}
+    if video.get("storage_tier") == "cold":
+        return "archive"
+    return video.get("frame_storage", "frame")
+
+def iter_frame_blocks(db, video_id: str):
+    aql = """
+    FOR b IN FrameBlock
+        FILTER b.video_id == @video_id
+        SORT b.block_index ASC
+        RETURN b
+    """
+    for doc in db.aql.execute(aql, bind_vars={"video_id": video_id}):
+        yield doc
+
+def iter_decoded_blocks(db, video_id: str, storage_format: str):
+    """
+    Yields decoded blocks (see decode_frame_block) of a block-format or archived video.
+    """
+    if storage_format == "archive":
+        archive = load_frame_archive(db, video_id)
+        if archive is not None:
+            yield archive
+        return
+    for doc in iter_frame_blocks(db, video_id):
+        yield decode_frame_block(doc)
+
+def load_embeddings(db, video_id: str) -> np.ndarray:
+    """
+    Returns the (M, 128) float32 matrix of a video's non-null embeddings in frame order.
+    """
+    storage_format = video_storage_format(db, video_id)
+    if storage_format in ("block", "archive"):
+        parts = []
+        for block in iter_decoded_blocks(db, video_id, storage_format):
+            if block["embeddings"] is not None:
+                parts.append(block["embeddings"][block["embedding_mask"]])
+        if not parts:
+            return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        return np.concatenate(parts)
+
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @video_id
+        SORT f.frame_number ASC
+        RETURN f.embeded_vector
+    """
+    cursor = db.aql.execute(aql, bind_vars={"video_id": video_id})
+    embeddings = [emb for emb in cursor if emb is not None]
+    if not embeddings:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def load_landmark_array(db, video_id: str) -> np.ndarray:
+    """
+    Returns a video's landmarks as a (T, 33, 4) float32 array (NaN rows where no pose was found).
+    """
+    storage_format = video_storage_format(db, video_id)
+    if storage_format in ("block", "archive"):
+        parts = [block["landmarks"] for block in iter_decoded_blocks(db, video_id, storage_format)]
+        if not parts:
+            return np.zeros((0, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+        return np.concatenate(parts)
+
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @vid
+        SORT f.frame_number ASC
+        RETURN f.pose_landmark
+    """
+    return landmarks_to_array([lms or [] for lms in db.aql.execute(aql, bind_vars={"vid": video_id})])
+
+def update_embeddings(db, video_id: str, embeddings: List[Optional[List[float]]]) -> int:
+    """
+    Replaces the stored embeddings of a video (one entry per frame, None allowed).
+    Returns the number of documents updated. Like the other write paths, the changed
+    documents are recorded in the replication outbox.
+    """
+    # Touch the Video so its _rev (and the ETag of frame range responses) changes
+    db.collection("Video").update({"_key": video_id, "embeddings_updated_at": time.time()})
+    append_change(db, "Video", [video_id])
+    storage_format = video_storage_format(db, video_id)
+    if storage_format == "archive":
+        doc = db.collection("FrameArchive").get(video_id)
+        if not doc:
+            return 0
+        n = doc["frame_count"]
+        emb_arr, mask = embeddings_to_array((list(embeddings) + [None] * n)[:n])
+        level = doc.get("level") or ARCHIVE_ZSTD_LEVEL
+        db.collection("FrameArchive").update({
+            "_key": video_id,
+            "embeddings": _compress(emb_arr, doc.get("dtype", "float32"), level) if mask.any() else None,
+            "embedding_mask": _compress(mask, "uint8", level) if mask.any() else None
+        })
+        return 1
+
+    if storage_format == "block":
+        update_docs = []
+        for doc in iter_frame_blocks(db, video_id):
+            start, n = doc["start_frame"], doc["frame_count"]
+            set_block_embeddings(doc, embeddings[start:start + n])
+            update_docs.append({
+                "_key": doc["_key"],
+                "embeddings": doc["embeddings"],
+                "embedding_mask": doc["embedding_mask"]
+            })
+        if update_docs:
+            bulk_import(db.collection("FrameBlock"), update_docs, on_duplicate="update")
+            append_change(db, "FrameBlock", [d["_key"] for d in update_docs])
+        return len(update_docs)
+
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @vid
+        SORT f.frame_number ASC
+        RETURN f._key
+    """
+    keys = list(db.aql.execute(aql, bind_vars={"vid": video_id}))
+    # None clears a stored embedding, like the block / archive formats and the memory backend
+    update_docs = [
+        {"_key": key, "embeded_vector": emb}
+        for key, emb in zip(keys, embeddings)
+    ]
+    if update_docs:
+        bulk_import(db.collection("Frame"), update_docs, on_duplicate="update")
+        for i in range(0, len(keys), BULK_CHUNK_SIZE):
+            append_change(db, "Frame", keys[i:i + BULK_CHUNK_SIZE])
+    return len(update_docs)
+
+# Fields of load_frame_range and where they live in the frame format
+FRAME_RANGE_FIELDS = {"landmarks": "pose_landmark", "embedding": "embeded_vector"}
+
+def load_frame_range(db, video_id: str, start: int, end: int, fields: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Reads frames [start, end) of a video with an index range scan, decoding only `fields`.
+    Returns {"frame_number": (T,) int32, "landmarks": (T, 33, 4) float32, "embedding": (T, 128) float32}
+    (requested fields only). Frames without a pose / embedding are NaN rows.
+    Archived videos are decompressed as a whole and sliced.
+    """
+    storage_format = video_storage_format(db, video_id)
+    if storage_format == "archive":
+        archive = load_frame_archive(db, video_id)
+        n = archive["frame_count"] if archive else 0
+        lo, hi = min(start, n), min(end, n)
+        result = {"frame_number": np.arange(lo, hi, dtype=np.int32)}
+        if "landmarks" in fields:
+            result["landmarks"] = archive["landmarks"][lo:hi] if archive else np.zeros((0, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+        if "embedding" in fields:
+            emb = np.full((hi - lo, EMBEDDING_DIM), np.nan, dtype=np.float32)
+            if archive and archive["embeddings"] is not None:
+                mask = archive["embedding_mask"][lo:hi]
+                emb[mask] = archive["embeddings"][lo:hi][mask]
+            result["embedding"] = emb
+        return result
+
+    if storage_format == "block":
+        aql = """
+        FOR b IN FrameBlock
+            FILTER b.video_id == @video_id AND b.start_frame < @end AND b.start_frame + b.frame_count > @start
+            SORT b.block_index ASC
+            RETURN KEEP(b, @keep)
+        """
+        keep = ["start_frame", "frame_count", "dtype"]
+        if "landmarks" in fields:
+            keep.append("landmarks")
+        if "embedding" in fields:
+            keep += ["embeddings", "embedding_mask"]
+        numbers, landmarks, embeddings = [], [], []
+        for doc in db.aql.execute(aql, bind_vars={"video_id": video_id, "start": start, "end": end, "keep": keep}):
+            n, dtype = doc["frame_count"], doc.get("dtype", "float32")
+            lo = max(start - doc["start_frame"], 0)
+            hi = min(end - doc["start_frame"], n)
+            numbers.append(np.arange(doc["start_frame"] + lo, doc["start_frame"] + hi, dtype=np.int32))
+            if "landmarks" in fields:
+                arr = decode_array(doc["landmarks"], dtype, (n, NUM_LANDMARKS, len(LANDMARK_FIELDS)))
+                landmarks.append(arr[lo:hi].astype(np.float32))
+            if "embedding" in fields:
+                emb = np.full((hi - lo, EMBEDDING_DIM), np.nan, dtype=np.float32)
+                if doc.get("embeddings"):
+                    arr = decode_array(doc["embeddings"], dtype, (n, EMBEDDING_DIM))[lo:hi]
+                    mask = np.frombuffer(base64.b64decode(doc["embedding_mask"]), dtype=np.uint8)[lo:hi].astype(bool)
+                    emb[mask] = arr[mask]
+                embeddings.append(emb)
+        result = {"frame_number": np.concatenate(numbers) if numbers else np.zeros(0, dtype=np.int32)}
+        if "landmarks" in fields:
+            result["landmarks"] = np.concatenate(landmarks) if landmarks else np.zeros((0, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+        if "embedding" in fields:
+            result["embedding"] = np.concatenate(embeddings) if embeddings else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+        return result
+
+    # Frame format: range scan on the [video_id, frame_number] index, projecting only what is needed
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @video_id AND f.frame_number >= @start AND f.frame_number < @end
+        SORT f.frame_number ASC
+        RETURN KEEP(f, @keep)
+    """
+    keep = ["frame_number"] + [FRAME_RANGE_FIELDS[f] for f in fields]
+    docs = list(db.aql.execute(aql, bind_vars={"video_id": video_id, "start": start, "end": end, "keep": keep}))
+    result = {"frame_number": np.asarray([d["frame_number"] for d in docs], dtype=np.int32)}
+    if "landmarks" in fields:
+        result["landmarks"] = landmarks_to_array([d.get("pose_landmark") or [] for d in docs])
+    if "embedding" in fields:
+        emb = np.full((len(docs), EMBEDDING_DIM), np.nan, dtype=np.float32)
+        for t, d in enumerate(docs):
+            if d.get("embeded_vector") is not None:
+                emb[t] = d["embeded_vector"]
+        result["embedding"] = emb
+    return result
@@ -0,0 +1,80 @@
+from typing import Dict, Any, Optional, List, Iterator
+
+# Frame chain traversal without FrameEdge documents.
+#
+# A frame's successor is the frame of the same video with the next frame_number, so
+# "OUTBOUND Video/x FrameEdge" walks are equivalent to range scans on the persistent
+# [video_id, frame_number] index of Frame. These helpers work whether or not the video's
+# edges were materialized (Video.frame_edges), so readers need not branch on it.
+
+def frame_key(video_id: str, frame_number: int) -> str:
+    # Deterministic key written by ingestion
+    return f"{video_id}_{frame_number}"
+
+def first_frame(db, video_id: str) -> Optional[Dict[str, Any]]:
+    """
+    The frame the "first" edge of a video points at.
+    """
+    following = next_frames(db, video_id, -1, 1)
+    return following[0] if following else None
+
+def next_frames(db, video_id: str, frame_number: int, count: int = 1) -> List[Dict[str, Any]]:
+    """
+    The `count` frames following `frame_number`, in order (one index range scan).
+    """
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @video_id AND f.frame_number > @frame_number
+        SORT f.frame_number ASC
+        LIMIT @count
+        RETURN f
+    """
+    return list(db.aql.execute(aql, bind_vars={"video_id": video_id, "frame_number": frame_number, "count": count}))
+
+def next_frame(db, frame: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Successor of a frame document (the target of its "next" edge), or None at the end of the video.
+    """
+    following = next_frames(db, frame["video_id"], frame["frame_number"], 1)
+    return following[0] if following else None
+
+def frame_at_depth(db, video_id: str, depth: int, start_frame: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Equivalent of `FOR v IN depth..depth OUTBOUND <start> FrameEdge`: the frame `depth` steps after
+    `start_frame`, or after the Video vertex when `start_frame` is None (depth 1 = first frame).
+    """
+    if depth < 1:
+        raise ValueError("depth must be >= 1")
+    aql = """
+    FOR f IN Frame
+        FILTER f.video_id == @video_id AND f.frame_number > @after
+        SORT f.frame_number ASC
+        LIMIT @offset, 1
+        RETURN f
+    """
+    after = -1 if start_frame is None else start_frame
+    rows = list(db.aql.execute(aql, bind_vars={"video_id": video_id, "after": after, "offset": depth - 1}))
+    return rows[0] if rows else None
+
+def iter_chain(db, video_id: str, start_frame: int = 0, fields: Optional[List[str]] = None,
+               batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+    """
+    Yields the frames of a video in chain order from `start_frame`, streaming from the index.
+    `fields` restricts the returned attributes (frame_number is always included).
+    """
+    projection = "f" if not fields else "KEEP(f, @fields)"
+    aql = f"""
+    FOR f IN Frame
+        FILTER f.video_id == @video_id AND f.frame_number >= @start
+        SORT f.frame_number ASC
+        RETURN {projection}
+    """
+    bind_vars = {"video_id": video_id, "start": start_frame}
+    if fields:
+        bind_vars["fields"] = list(dict.fromkeys(["frame_number"] + list(fields)))
+    cursor = db.aql.execute(aql, bind_vars=bind_vars, batch_size=batch_size, stream=True)
+    try:
+        for frame in cursor:
+            yield frame
+    finally:
+        cursor.close(ignore_missing=True)
@@ -0,0 +1,245 @@
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Number of preallocated frame slots per worker. A slot is only reused once a
+# pose worker has released it, so this bounds the decoded frames in flight.
+SLOTS_PER_WORKER = 4
+# How often a blocked decoder checks that its pose workers are still alive (seconds).
+WORKER_POLL_INTERVAL = 1.0
+
+
+class PoseWorkerError(RuntimeError):
+    """
+    Raised by SharedMemoryPoseExtractor when a pose worker process died (OOM kill,
+    MediaPipe crash), so the frames it held will never come back.
+    """
+
+
+class FrameRingBuffer:
+    """
+    A fixed-size ring of preallocated BGR frame slots backed by
+    multiprocessing.shared_memory. Processes exchange slot indices only;
+    pixel data never goes through a pipe.
+    """
+
+    def __init__(self, num_slots: int, frame_shape: Tuple[int, int, int], name: Optional[str] = None):
+        self.num_slots = num_slots
+        self.frame_shape = tuple(frame_shape)
+        self.slot_bytes = int(np.prod(self.frame_shape))
+        self._owner = name is None
+
+        if self._owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=self.slot_bytes * num_slots)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        self.frames = np.ndarray((num_slots, *self.frame_shape), dtype=np.uint8, buffer=self.shm.buf)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def slot(self, index: int) -> np.ndarray:
+        """
+        Returns a writable view onto slot `index` (no copy).
+        """
+        return self.frames[index]
+
+    def close(self):
+        # Drop the ndarray view first, otherwise SharedMemory.close() refuses
+        # to release the exported buffer.
+        self.frames = None
+        self.shm.close()
+        if self._owner:
+            self.shm.unlink()
+
+
+def landmarks_to_dicts(pose_landmarks) -> List[Dict[str, float]]:
+    """
+    Converts a MediaPipe pose_landmarks result into the list-of-dicts format
+    stored on Frame documents.
+    """
+    landmarks_data = []
+    if pose_landmarks:
+        for i, landmark in enumerate(pose_landmarks.landmark):
+            landmarks_data.append({
+                "id": i,
+                "x": landmark.x,
+                "y": landmark.y,
+                "z": landmark.z,
+                "visibility": landmark.visibility
+            })
+    return landmarks_data
+
+
+def pose_worker(shm_name: str, num_slots: int, frame_shape, pose_options: Dict[str, Any],
+                task_queue, free_queue, result_queue):
+    """
+    Worker process entry point.
+    Reads (slot_index, frame_idx) messages, runs MediaPipe on the shared slot,
+    releases the slot and posts (frame_idx, landmarks) back to the decoder.
+    """
+    # Imported here so the spawned interpreter only pays for what it uses
+    import cv2
+    import mediapipe as mp
+
+    ring = FrameRingBuffer(num_slots, frame_shape, name=shm_name)
+    pose = mp.solutions.pose.Pose(**pose_options)
+
+    try:
+        while True:
+            msg = task_queue.get()
+            if msg is None:
+                break
+            slot_idx, frame_idx = msg
+
+            # cvtColor writes into a process-local RGB buffer; the shared slot
+            # can be handed back to the decoder as soon as that is done.
+            image_rgb = cv2.cvtColor(ring.slot(slot_idx), cv2.COLOR_BGR2RGB)
+            free_queue.put(slot_idx)
+
+            results = pose.process(image_rgb)
+            result_queue.put((frame_idx, landmarks_to_dicts(results.pose_landmarks)))
+    finally:
+        pose.close()
+        ring.close()
+
+
+def _get_from_workers(q, workers) -> Any:
+    """
+    queue.get() that gives up once a worker has died instead of blocking forever.
+    Workers exit with code 0 only after their shutdown message, so any other exit code
+    (or every worker gone with the queue still empty) means lost frames.
+    """
+    while True:
+        try:
+            return q.get(timeout=WORKER_POLL_INTERVAL)
+        except queue.Empty:
+            pass
+        dead = [w for w in workers if w.exitcode not in (None, 0)]
+        if dead:
+            raise PoseWorkerError(f"Pose worker pid {dead[0].pid} died with exit code {dead[0].exitcode}")
+        if not any(w.is_alive() for w in workers):
+            raise PoseWorkerError("All pose workers exited before returning every frame")
+
+
+def pose_options_for_workers(pose_options: Dict[str, Any], num_workers: int) -> Dict[str, Any]:
+    """
+    The MediaPipe options pose workers actually run with.
+    With more than one worker each tracker would only see every N-th frame, so tracking
+    (static_image_mode=False) is replaced by per-frame detection; the landmarks then do
+    not depend on the number of workers.
+    """
+    if num_workers > 1:
+        return dict(pose_options, static_image_mode=True)
+    return dict(pose_options)
+
+
+class SharedMemoryPoseExtractor:
+    """
+    Decodes a video into a shared-memory ring and fans frames out to a pool of
+    pose worker processes. Iterating yields (frame_idx, landmarks) in frame order.
+
+    Frames are dealt to whichever worker is free, so with several workers MediaPipe
+    runs in static image mode (see pose_options_for_workers).
+    """
+
+    def __init__(self, cap, num_workers: int, pose_options: Dict[str, Any], slots_per_worker: int = SLOTS_PER_WORKER):
+        self.cap = cap
+        self.num_workers = max(1, num_workers)
+        self.pose_options = pose_options_for_workers(pose_options, self.num_workers)
+        self.num_slots = self.num_workers * slots_per_worker
+
+        width = int(cap.get(3))   # cv2.CAP_PROP_FRAME_WIDTH
+        height = int(cap.get(4))  # cv2.CAP_PROP_FRAME_HEIGHT
+        self.frame_shape = (height, width, 3)
+
+        self.stats = {
+            "frames": 0,
+            "frame_bytes": height * width * 3,
+            "bytes_not_copied": 0,  # Pixel bytes that were never pickled between processes
+            "decoder_copies": 0,    # Frames VideoCapture could not decode in-place
+            "workers": self.num_workers,
+            "slots": self.num_slots
+        }
+
+    def __iter__(self) -> Iterator[Tuple[int, List[Dict[str, float]]]]:
+        # Spawn (not fork) so workers never inherit the parent's MediaPipe threads
+        ctx = multiprocessing.get_context("spawn")
+        ring = FrameRingBuffer(self.num_slots, self.frame_shape)
+        task_queue = ctx.Queue()
+        free_queue = ctx.Queue()
+        result_queue = ctx.Queue()
+
+        for i in range(self.num_slots):
+            free_queue.put(i)
+
+        workers = [
+            ctx.Process(
+                target=pose_worker,
+                args=(ring.name, self.num_slots, self.frame_shape, self.pose_options,
+                      task_queue, free_queue, result_queue),
+                daemon=True
+            )
+            for _ in range(self.num_workers)
+        ]
+        for w in workers:
+            w.start()
+
+        pending = {}
+        next_to_yield = 0
+        frame_idx = 0
+
+        try:
+            while True:
+                slot_idx = _get_from_workers(free_queue, workers)
+                slot = ring.slot(slot_idx)
+
+                # Decode straight into the shared slot
+                success, image = self.cap.read(slot)
+                if not success:
+                    break
+                if not np.shares_memory(image, slot):
+                    # Stream geometry differs from the header; fall back to a copy
+                    np.copyto(slot, image[:self.frame_shape[0], :self.frame_shape[1]])
+                    self.stats["decoder_copies"] += 1
+
+                task_queue.put((slot_idx, frame_idx))
+                frame_idx += 1
+                self.stats["frames"] += 1
+                self.stats["bytes_not_copied"] += self.stats["frame_bytes"]
+
+                # Collect whatever is ready without stalling the decoder
+                while True:
+                    try:
+                        idx, landmarks = result_queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    pending[idx] = landmarks
+
+                while next_to_yield in pending:
+                    yield next_to_yield, pending.pop(next_to_yield)
+                    next_to_yield += 1
+
+            for _ in workers:
+                task_queue.put(None)
+
+            while next_to_yield < frame_idx:
+                if next_to_yield not in pending:
+                    idx, landmarks = _get_from_workers(result_queue, workers)
+                    pending[idx] = landmarks
+                    continue
+                yield next_to_yield, pending.pop(next_to_yield)
+                next_to_yield += 1
+
+            for w in workers:
+                w.join()
+        finally:
+            for w in workers:
+                if w.is_alive():
+                    w.terminate()
+            ring.close()
@@ -1,7 +1,8 @@
 
 import torch
 import numpy as np
-from typing import List, Dict, Any
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
 import os
 
 from app.ml.stgcn import STGCN_Encoder
@@ -45,6 +46,13 @@ def map_mp_to_25(landmarks: List[Dict[str, float]]) -> np.ndarray:
             data[2, i] = lm['z']
     return data
 
+def map_array_to_25(landmarks: np.ndarray) -> np.ndarray:
+    """
+    Vectorised map_mp_to_25 for a (T, 33, 4) landmark array.
+    Output shape: (3, T, 25). Missing poses (NaN rows) become zeros, as in map_mp_to_25.
+    """
+    return np.nan_to_num(landmarks[:, :25, :3]).transpose(2, 0, 1).astype(np.float32)
+
 class InferenceService:
     def __init__(self):
         self.model = STGCN_Encoder().to(DEVICE)
@@ -170,6 +178,81 @@ class InferenceService:
         for i, idx in enumerate(indices):
             embeddings_map[idx] = embeddings[i]
 
+class StreamingEmbedder:
+    """
+    Incremental counterpart of InferenceService.generate_embeddings.
+    
+    Frames are pushed one at a time and (frame_idx, embedding) pairs are emitted as
+    soon as the window starting at that frame is complete, so only about
+    WINDOW_SIZE + batch frames are held in memory regardless of video length.
+    The emitted embeddings match generate_embeddings() for the same sequence.
+    """
+    def __init__(self, service: InferenceService, model_path: str = None, batch_size: int = 32):
+        if model_path:
+            service.load_model(model_path)
+        self.service = service
+        self.batch_size = batch_size
+        
+        self.skeletons = deque() # (3, 25) arrays for frames [base, base + len)
+        self.base = 0
+        self.num_frames = 0
+        
+        self.windows = []
+        self.indices = []
+
+    def push(self, frame_landmarks: List[Dict[str, float]]) -> List[Tuple[int, Optional[List[float]]]]:
+        """
+        Adds one frame. Returns the (frame_idx, embedding) pairs that became available.
+        """
+        self.skeletons.append(map_mp_to_25(frame_landmarks))
+        self.num_frames += 1
+        
+        emitted = []
+        while len(self.skeletons) >= WINDOW_SIZE:
+            window = np.stack([self.skeletons[i] for i in range(WINDOW_SIZE)], axis=1) # (3, 32, 25)
+            self.windows.append(torch.from_numpy(window).to(DEVICE))
+            self.indices.append(self.base)
+            
+            self.skeletons.popleft()
+            self.base += 1
+            
+            if len(self.windows) >= self.batch_size:
+                emitted.extend(self._flush())
+        return emitted
+
+    def finish(self) -> List[Tuple[int, Optional[List[float]]]]:
+        """
+        Flushes pending windows. Frames without a full window get None,
+        except short videos which (like generate_embeddings) get one padded window at frame 0.
+        """
+        emitted = self._flush()
+        if self.num_frames == 0:
+            return emitted
+            
+        if self.num_frames < WINDOW_SIZE:
+            # Pad with the last frame's data up to a full window
+            padded = list(self.skeletons) + [self.skeletons[-1]] * (WINDOW_SIZE - self.num_frames)
+            window = np.stack(padded, axis=1)
+            self.windows.append(torch.from_numpy(window).to(DEVICE))
+            self.indices.append(0)
+            emitted.extend(self._flush())
+            emitted.extend((i, None) for i in range(1, self.num_frames))
+        else:
+            emitted.extend((i, None) for i in range(self.base, self.num_frames))
+            
+        self.skeletons.clear()
+        return emitted
+
+    def _flush(self) -> List[Tuple[int, Optional[List[float]]]]:
+        if not self.windows:
+            return []
+        embeddings_map = {}
+        self.service._process_batch(self.windows, self.indices, embeddings_map)
+        emitted = [(idx, embeddings_map[idx]) for idx in self.indices]
+        self.windows = []
+        self.indices = []
+        return emitted
+
 # Global Instance
 inference_service = InferenceService()
 
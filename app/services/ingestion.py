@@ -5,25 +5,107 @@ import uuid
 import datetime
 import os
 import json
+import numpy as np
 from typing import List, Dict, Any, Optional
 
-from app.db.database import ArangoDBConnection
-from app.db.orientdb_client import OrientDBClient
-from app.services.inference import generate_embeddings_for_video_data
+from app.db.repositories import Storage, get_storage
+from app.services.inference import StreamingEmbedder, inference_service
+from app.services.frame_ring import SharedMemoryPoseExtractor, landmarks_to_dicts, pose_options_for_workers
+from app.services import landmark_cache
+from app.services.progress import StageTracker, publish_progress
+from app.services.frame_blocks import FRAME_STORAGE_FORMAT, FRAME_BLOCK_SIZE, FRAME_EDGE_MODE
+
+# Number of pose worker processes. 0/1 keeps pose estimation in-process;
+# higher values decode into a shared-memory ring consumed by worker processes
+# (MediaPipe then detects every frame independently, see pose_options_for_workers).
+POSE_WORKERS = int(os.getenv("POSE_WORKERS", "0"))
+
+POSE_OPTIONS = {
+    "static_image_mode": False,
+    "model_complexity": 1,
+    "smooth_landmarks": True,
+    "min_detection_confidence": 0.5,
+    "min_tracking_confidence": 0.5
+}
+
+# Frames are written to the frame repository every INGESTION_CHUNK_SIZE frames instead of at
+# the end (ArangoDB: through the shared bulk writer, app/db/bulk_writer.py).
+# In "block" storage format a chunk is exactly one FrameBlock of FRAME_BLOCK_SIZE frames.
+INGESTION_CHUNK_SIZE = int(os.getenv("INGESTION_CHUNK_SIZE", "256"))
 
 # Initialize MediaPipe Pose
 mp_pose = mp.solutions.pose
-pose = mp_pose.Pose(
-    static_image_mode=False,
-    model_complexity=1,
-    smooth_landmarks=True,
-    min_detection_confidence=0.5,
-    min_tracking_confidence=0.5
-)
-
-def process_video(video_path: str, user_id: str, exercise_id: str, is_reference: bool = False, model_path: Optional[str] = None, video_id: Optional[str] = None):
+pose = mp_pose.Pose(**POSE_OPTIONS)
+
+def iter_landmarks_inline(cap):
+    """
+    Yields (frame_idx, landmarks) by running MediaPipe in the current process.
+    """
+    frame_idx = 0
+    while cap.isOpened():
+        success, image = cap.read()
+        if not success:
+            break
+            
+        # Convert BGR to RGB
+        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        
+        # Process with MediaPipe
+        results = pose.process(image_rgb)
+        
+        yield frame_idx, landmarks_to_dicts(results.pose_landmarks)
+        frame_idx += 1
+
+def pose_cache_config() -> Dict[str, Any]:
+    """
+    Everything that changes the extracted landmarks; part of the landmark cache key.
     """
-    Processes a video file to extract pose landmarks and ingests them into ArangoDB as a graph.
+    return dict(pose_options_for_workers(POSE_OPTIONS, POSE_WORKERS), mediapipe=getattr(mp, "__version__", "unknown"))
+
+def timed_stream(stream, tracker: StageTracker, stage_name: str):
+    """
+    Wraps an iterator and accounts the time spent producing each item to `stage_name`.
+    """
+    while True:
+        with tracker.stage(stage_name):
+            item = next(stream, None)
+        if item is None:
+            return
+        tracker.add_frames(stage_name, 1)
+        yield item
+
+def set_video_status(storage: Storage, video_uuid: str, status: str, **fields):
+    """
+    Moves the Video document through processing -> embedded -> complete (or failed).
+    """
+    fields["status"] = status
+    storage.videos.update(video_uuid, fields)
+
+def flush_chunk(storage: Storage, video_uuid: str, chunk: List[tuple], fps: float, block_size: int,
+                tracker: Optional[StageTracker] = None):
+    """
+    Writes a chunk of (frame_doc, edge_doc) pairs in FRAME_STORAGE_FORMAT
+    (one FrameBlock per chunk in block format; Frame documents + FrameEdges otherwise).
+    """
+    tracker = tracker or StageTracker()
+    with tracker.stage("db_write", frames=len(chunk)):
+        storage.frames.write_chunk(video_uuid, chunk, FRAME_STORAGE_FORMAT, fps, block_size)
+
+def process_video(video_path: str, user_id: str, exercise_id: str, is_reference: bool = False, model_path: Optional[str] = None, video_id: Optional[str] = None, content_hash: Optional[str] = None,
+                  storage: Optional[Storage] = None):
+    """
+    Processes a video file to extract pose landmarks and ingests them into the storage backend
+    (ArangoDB as a graph by default).
+    
+    Frames are streamed to the database in chunks of INGESTION_CHUNK_SIZE as soon as their
+    embeddings are available, so memory use does not grow with video length. The Video
+    document's `status` moves through processing -> embedded -> complete, and per-stage
+    wall time, fps and peak memory are published to `progress` / `processing_stats` on it.
+    An embedding error does not fail ingestion: the video completes without embeddings
+    and the error is kept in `embedding_error`.
+    
+    When `content_hash` (sha256 of the file) is given, landmarks are looked up in the
+    content-addressed landmark cache and decode + pose estimation are skipped on a hit.
     
     Args:
         video_path: Path to the uploaded video file.
@@ -32,23 +114,41 @@ def process_video(video_path: str, user_id: str, exercise_id: str, is_reference:
         is_reference: Boolean flag indicating if this is a reference video.
         model_path: Path to the model file for embedding generation.
         video_id: Specific UUID for the video (optional). If None, one is generated.
+        content_hash: sha256 hex digest of the video file (optional), enables the landmark cache.
+        storage: Storage backend (optional), defaults to the process-wide one (STORAGE_BACKEND).
+        
+    Returns:
+        "complete", or "invalid" if the file is missing or cannot be opened as a video
+        (retrying cannot help). Any error after that (database writes, timeouts, pose
+        estimation) marks the Video "failed" and is raised, so the job queue can retry it.
     """
     print(f"[Ingestion] Starting processing for video: {video_path}")
     
     if not os.path.exists(video_path):
         print(f"[Ingestion] Error: Video file not found at {video_path}")
-        return
+        return "invalid"
 
-    # 1. Open Video
-    cap = cv2.VideoCapture(video_path)
-    if not cap.isOpened():
-        print(f"[Ingestion] Error: Could not open video file.")
-        return
+    # 0. Landmark Cache Lookup
+    cache_entry_key = None
+    cache_hit = None
+    if content_hash:
+        cache_entry_key = landmark_cache.cache_key(content_hash, pose_cache_config())
+        cache_hit = landmark_cache.lookup(cache_entry_key)
 
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    # 1. Open Video (not needed when the landmarks are cached)
+    cap = None
+    if cache_hit:
+        fps = cache_hit["fps"]
+        total_frames = cache_hit["frames"]
+        print(f"[Ingestion] Landmark cache hit ({cache_entry_key}). Skipping decode and pose estimation.")
+    else:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"[Ingestion] Error: Could not open video file.")
+            return "invalid"
+
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
     
     # 2. Prepare Video Node Data
     if not video_id:
@@ -67,168 +167,235 @@ def process_video(video_path: str, user_id: str, exercise_id: str, is_reference:
         "fps": fps,
         "frame_count": total_frames,
         "embedding_dimension": 128, # Default as per requirements
-        "is_reference": is_reference
+        "is_reference": is_reference,
+        "status": "processing",
+        "frame_storage": FRAME_STORAGE_FORMAT
     }
     
-    # 3. Process Frames & Extract Landmarks
-    frames_buffer = []
-    edges_buffer = []
+    # Chunk size: one FrameBlock per chunk in block format
+    chunk_size = FRAME_BLOCK_SIZE if FRAME_STORAGE_FORMAT == "block" else INGESTION_CHUNK_SIZE
+    if FRAME_STORAGE_FORMAT == "block":
+        video_doc["frame_block_size"] = chunk_size
+    else:
+        video_doc["frame_edges"] = "derived" if FRAME_EDGE_MODE == "derive" else "materialized"
     
-    frame_idx = 0
-    previous_frame_id = None
+    # The Video node is written first so partial progress is visible and resumable
+    try:
+        storage = storage or get_storage()
+        storage.videos.save(video_doc)
+        print(f"[Ingestion] Video node created: {video_uuid}")
+    except Exception as e:
+        print(f"[Ingestion] Database Error: {e}")
+        if cap:
+            cap.release()
+        # Transient by nature; the job queue retries the attempt
+        raise
+        
+    # 3. Process Frames, Embed & Flush in Chunks
+    tracker = StageTracker()
+    publish_progress(storage.videos, video_uuid, "ingesting", frames_decoded=0, frames_written=0, total_frames=total_frames)
+    
+    embedder = None
+    embedding_error = None
+    if model_path:
+        print(f"[Ingestion] Model path provided: {model_path}. Embeddings will be generated while streaming.")
+        try:
+            embedder = StreamingEmbedder(inference_service, model_path=model_path)
+        except Exception as e:
+            print(f"[Ingestion] Error generating embeddings: {e}")
+            embedding_error = str(e)
+    else:
+        print("[Ingestion] No model path provided. Skipping embedding generation (deferred).")
+    
+    awaiting_embedding = [] # (frame_doc, edge_doc) whose embedding window is not complete yet
+    ready = []              # (frame_doc, edge_doc) ready to be written
+    head = 0                # frame_number of awaiting_embedding[0]
+    frame_count = 0
+    frames_written = 0
+    count_embeddings = 0
+    embedding_rows = []     # Non-null embeddings as float32 rows, saved as one VideoEmbedding matrix
+    
+    def take_embeddings(emitted):
+        nonlocal head, count_embeddings
+        for idx, emb in emitted:
+            # Embeddings are emitted in frame order
+            frame_doc, edge_doc = awaiting_embedding[idx - head]
+            frame_doc["embeded_vector"] = emb
+            if emb is not None:
+                count_embeddings += 1
+                embedding_rows.append(np.asarray(emb, dtype=np.float32))
+        # Move the completed prefix to the ready list
+        done = emitted[-1][0] - head + 1 if emitted else 0
+        ready.extend(awaiting_embedding[:done])
+        del awaiting_embedding[:done]
+        head += done
+    
+    def stop_embedding(e: Exception):
+        # Like a failed model load: the video is still ingested, just without embeddings
+        nonlocal embedder, embedding_error
+        print(f"[Ingestion] Error generating embeddings: {e}. Continuing without embeddings.")
+        embedder = None
+        embedding_error = str(e)
+        for frame_doc, _ in ready + awaiting_embedding:
+            frame_doc["embeded_vector"] = None
+        ready.extend(awaiting_embedding)
+        del awaiting_embedding[:]
+        embedding_rows.clear()
     
     print(f"[Ingestion] Processing {total_frames} frames...")
+
+    extractor = None
+    cache_writer = None
+    if cache_hit:
+        landmark_stream = landmark_cache.iter_cached_landmarks(cache_entry_key, cache_hit)
+    elif POSE_WORKERS > 1:
+        extractor = SharedMemoryPoseExtractor(cap, POSE_WORKERS, POSE_OPTIONS)
+        landmark_stream = iter(extractor)
+    else:
+        landmark_stream = iter_landmarks_inline(cap)
+        
+    if cache_entry_key and not cache_hit:
+        cache_writer = landmark_cache.LandmarkCacheWriter(cache_entry_key)
     
-    while cap.isOpened():
-        success, image = cap.read()
-        if not success:
-            break
+    landmark_stage = "landmark_cache_read" if cache_hit else "decode_pose"
+    
+    def flush_ready(final: bool = False):
+        nonlocal frames_written
+        while ready and (final or len(ready) >= chunk_size):
+            chunk = ready[:chunk_size]
+            del ready[:chunk_size]
+            flush_chunk(storage, video_uuid, chunk, fps, chunk_size, tracker)
+            frames_written += len(chunk)
+        publish_progress(storage.videos, video_uuid, "ingesting", tracker, frames_decoded=frame_count,
+                         frames_written=frames_written, total_frames=total_frames)
+    
+    try:
+        for frame_idx, landmarks_data in timed_stream(iter(landmark_stream), tracker, landmark_stage):
+            if not cache_hit:
+                # Same precision as a cache hit, so scores do not depend on the cache
+                landmarks_data = landmark_cache.round_landmarks(landmarks_data)
+            if cache_writer:
+                cache_writer.append(landmarks_data)
+                
+            # Calculate timestamp (ms)
+            timestamp_ms = (frame_idx / fps) * 1000
             
-        # Convert BGR to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Process with MediaPipe
-        results = pose.process(image_rgb)
-        
-        landmarks_data = []
-        if results.pose_landmarks:
-            for i, landmark in enumerate(results.pose_landmarks.landmark):
-                landmarks_data.append({
-                    "id": i,
-                    "x": landmark.x,
-                    "y": landmark.y,
-                    "z": landmark.z,
-                    "visibility": landmark.visibility
-                })
-        
-        # Calculate timestamp (ms)
-        timestamp_ms = (frame_idx / fps) * 1000
-        
-        # Create Frame Document
-        # We use a deterministic key for frames: video_id + frame_idx
-        # This makes edge creation easier without querying.
-        frame_key = f"{video_uuid}_{frame_idx}"
-        frame_id = f"Frame/{frame_key}"
-        
-        frame_doc = {
-            "_key": frame_key,
-            "video_id": video_uuid,
-            "frame_number": frame_idx,
-            "timestamp": timestamp_ms,
-            "pose_landmark": landmarks_data,
-            "embeded_vector": None # Placeholder, will be updated shortly
-        }
-        frames_buffer.append(frame_doc)
-        
-        # Create Edges
-        if frame_idx == 0:
-            # STARTS Edge: Video -> First Frame
-            edge_doc = {
-                "_from": f"Video/{video_uuid}",
-                "_to": frame_id,
-                "edge_type": "first"
+            # Create Frame Document
+            # We use a deterministic key for frames: video_id + frame_idx
+            # This makes edge creation easier without querying.
+            frame_key = f"{video_uuid}_{frame_idx}"
+            frame_id = f"Frame/{frame_key}"
+            
+            frame_doc = {
+                "_key": frame_key,
+                "video_id": video_uuid,
+                "frame_number": frame_idx,
+                "timestamp": timestamp_ms,
+                "pose_landmark": landmarks_data,
+                "embeded_vector": None # Placeholder, filled in once the window is complete
             }
-            edges_buffer.append(edge_doc)
-        else:
-            # NEXT Edge: Previous Frame -> Current Frame
-            if previous_frame_id:
+            
+            # Create Edges (the block format and FRAME_EDGE_MODE=derive do not store them)
+            if FRAME_STORAGE_FORMAT == "block" or FRAME_EDGE_MODE == "derive":
+                edge_doc = None
+            elif frame_idx == 0:
+                # STARTS Edge: Video -> First Frame
+                edge_doc = {
+                    "_from": f"Video/{video_uuid}",
+                    "_to": frame_id,
+                    "edge_type": "first"
+                }
+            else:
+                # NEXT Edge: Previous Frame -> Current Frame
                 edge_doc = {
-                    "_from": previous_frame_id,
+                    "_from": f"Frame/{video_uuid}_{frame_idx - 1}",
                     "_to": frame_id,
                     "edge_type": "next"
                 }
-                edges_buffer.append(edge_doc)
-        
-        previous_frame_id = frame_id
-        frame_idx += 1
-        
-        if frame_idx % 100 == 0:
-            print(f"[Ingestion] Processed {frame_idx}/{total_frames} frames")
-
-    cap.release()
-    print("[Ingestion] Video processing complete. Generating Embeddings...")
-
-    # 3.5 Generate Embeddings
-    if model_path:
-        print(f"[Ingestion] Model path provided: {model_path}. Generating embeddings...")
-        try:
-            # Generate Embeddings using the specific model path
-            # The inference service now handles loading/caching safely.
             
-            # Extract just list of landmarks from buffer
-            all_landmarks = [f["pose_landmark"] for f in frames_buffer]
-            embeddings = generate_embeddings_for_video_data(all_landmarks, model_path=model_path)
+            frame_count = frame_idx + 1
             
-            # Assign back to frames
-            count_embeddings = 0
-            for i, emb in enumerate(embeddings):
-                if emb is not None:
-                    frames_buffer[i]["embeded_vector"] = emb
-                    count_embeddings += 1
-                    
-            print(f"[Ingestion] Generated {count_embeddings} embeddings using model {model_path}.")
-
-        except Exception as e:
-            print(f"[Ingestion] Error generating embeddings: {e}")
-    else:
-        print("[Ingestion] No model path provided. Skipping embedding generation (deferred).")
-
-    print("[Ingestion] Storing to Graph DB...")
+            if embedder:
+                awaiting_embedding.append((frame_doc, edge_doc))
+                try:
+                    with tracker.stage("embedding", frames=1):
+                        take_embeddings(embedder.push(landmarks_data))
+                except Exception as e:
+                    stop_embedding(e)
+            else:
+                ready.append((frame_doc, edge_doc))
+            
+            if len(ready) >= chunk_size:
+                flush_ready()
+                
+            if frame_count % 100 == 0:
+                print(f"[Ingestion] Processed {frame_count}/{total_frames} frames")
 
-    # 4. Ingest into ArangoDB (Bulk Import)
-    try:
-        db_conn = ArangoDBConnection()
-        db = db_conn.get_db()
+        if cap:
+            cap.release()
         
-        # Insert Video Node
-        # We insert single document for Video
-        db.collection("Video").insert(video_doc)
-        print(f"[Ingestion] Video node created: {video_uuid}")
+        if embedder:
+            try:
+                with tracker.stage("embedding"):
+                    take_embeddings(embedder.finish())
+            except Exception as e:
+                stop_embedding(e)
+        ready.extend(awaiting_embedding)
+        del awaiting_embedding[:]
+        if ready:
+            flush_ready(final=True)
+        print(f"[Ingestion] Imported {frame_count} frames.")
         
-        # Bulk Insert Frames
-        if frames_buffer:
-            db.collection("Frame").import_bulk(frames_buffer, on_duplicate="update")
-            print(f"[Ingestion] Imported {len(frames_buffer)} frames.")
-            
-        # Bulk Insert Edges
-        if edges_buffer:
-            db.collection("FrameEdge").import_bulk(edges_buffer, on_duplicate="update")
-            print(f"[Ingestion] Imported {len(edges_buffer)} frame edges.")
-            
-        print("[Ingestion] Data ingestion successful.")
+        # "embedded": every frame and the packed embedding matrix are persisted
+        if embedder:
+            print(f"[Ingestion] Generated {count_embeddings} embeddings using model {model_path}.")
+            with tracker.stage("db_write"):
+                storage.frames.save_embedding_matrix(video_uuid, model_path, np.stack(embedding_rows) if embedding_rows else [])
+            set_video_status(storage, video_uuid, "embedded", frame_count=frame_count)
+        elif embedding_error and count_embeddings:
+            # Frames flushed before the embedder failed carry embeddings; drop them so the
+            # video is not scored on a partial sequence
+            with tracker.stage("db_write"):
+                storage.frames.update_embeddings(video_uuid, [None] * frame_count)
         
-        # --- Dual Write to OrientDB ---
-        try:
-            print("[Ingestion] Syncing to OrientDB...")
-            orient = OrientDBClient()
+        landmark_seconds = tracker.stages.get(landmark_stage, {}).get("seconds", 0.0)
+        cache_report = None
+        if cache_writer:
+            cache_writer.commit(fps, landmark_seconds)
+            cache_report = {"hit": False, "extraction_seconds": round(landmark_seconds, 3)}
+        elif cache_hit:
+            saved = cache_hit["extraction_seconds"] - landmark_seconds
+            landmark_cache.record_saved(saved)
+            cache_report = {"hit": True, "saved_seconds": round(max(0.0, saved), 3)}
+            stats = landmark_cache.get_cache_stats()
+            print(f"[Ingestion] Landmark cache saved {saved:.2f}s "
+                  f"(hit rate {stats['hit_rate']:.0%}, {stats['saved_seconds']:.1f}s saved in this process).")
             
-            # 1. Sync Video
-            orient.create_vertex("Video", video_doc)
+        if extractor:
+            stats = extractor.stats
+            print(f"[Ingestion] Shared-memory transport: {stats['frames']} frames via {stats['workers']} workers, "
+                  f"{stats['bytes_not_copied'] / (1024 * 1024):.1f} MB not copied between processes "
+                  f"({stats['decoder_copies']} decoder fallbacks).")
             
-            # 2. Sync Frames (Looping)
-            # This might be slow for large videos, consider optimizing or running in thread
-            for frame in frames_buffer:
-                orient.create_vertex("Frame", frame)
-                
-            # 3. Sync Edges
-            for edge in edges_buffer:
-                # Edge format: _from: "Class/Key", _to: "Class/Key"
-                # distinct logic to parse
-                from_parts = edge["_from"].split('/')
-                to_parts = edge["_to"].split('/')
-                
-                # frame edges
-                orient.create_edge(
-                    "FrameEdge", 
-                    from_parts[0], from_parts[1], # From Class, From Key
-                    to_parts[0], to_parts[1],     # To Class, To Key
-                    edge
-                )
-            
-            print("[Ingestion] OrientDB sync complete.")
-        except Exception as e:
-            print(f"[Warning] OrientDB Sync Failed: {e}")
+        set_video_status(storage, video_uuid, "complete", frame_count=frame_count, landmark_cache=cache_report,
+                         embedding_error=embedding_error)
+        publish_progress(storage.videos, video_uuid, "ingested", tracker, frames_decoded=frame_count,
+                         frames_written=frames_written, total_frames=frame_count)
+        for name, st in tracker.report()["stages"].items():
+            print(f"[Ingestion] Stage {name}: {st['wall_seconds']:.2f}s, {st['fps']} fps, peak {st['peak_rss_mb']} MB")
+        print("[Ingestion] Data ingestion successful.")
+        return "complete"
         
     except Exception as e:
-        print(f"[Ingestion] Database Error: {e}")
-        # In a real system, we might want to clean up partial data or retry
+        print(f"[Ingestion] Error during ingestion: {e}")
+        if cap:
+            cap.release()
+        if cache_writer:
+            cache_writer.abort()
+        try:
+            set_video_status(storage, video_uuid, "failed", error=str(e), frame_count=frame_count)
+            publish_progress(storage.videos, video_uuid, "failed", tracker, frames_decoded=frame_count,
+                             frames_written=frames_written, total_frames=total_frames)
+        except Exception:
+            pass
+        raise
@@ -0,0 +1,423 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import datetime
+import importlib
+import threading
+import traceback
+import multiprocessing
+from typing import Dict, Any, List, Optional
+
+# Durable local job queue (SQLite) consumed by a pool of worker processes.
+# Heavy ingestion work runs here instead of inside the API process.
+JOB_DB_PATH = os.getenv("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))           # 0 disables the in-API worker pool
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "50"))      # Queued + running jobs before uploads get 503
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BACKOFF = float(os.getenv("JOB_RETRY_BACKOFF", "15"))  # Seconds, doubled per attempt
+JOB_POLL_INTERVAL = 1.0
+# Running jobs refresh heartbeat_at this often; a job whose heartbeat is older than the
+# lease belongs to a dead worker and is requeued. Several pools may share one queue DB.
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# Job type -> "module:function". Payloads are passed as keyword arguments.
+JOB_TYPES = {
+    "process_and_evaluate": "app.routers.video:process_and_evaluate",
+    "process_and_update_ref": "app.routers.reference:process_and_update_ref",
+    "backfill_daily_activity": "app.services.aggregates:backfill_daily_activity",
+    "reconcile_orientdb": "app.services.reconcile:reconcile",
+    "apply_retention": "app.services.retention:apply_retention",
+}
+
+# Caches used by job handlers: name -> "module:function" returning the process's counters.
+# Workers snapshot them into the queue DB after every job (see worker_cache_stats).
+WORKER_CACHE_STATS = {
+    "landmark_cache": "app.services.landmark_cache:get_cache_stats",
+    "reference_embeddings": "app.services.scoring:get_reference_cache_stats",
+}
+_CACHE_COUNTERS = ("lookups", "hits", "misses", "evictions", "invalidations", "saved_seconds")
+
+class PermanentJobError(Exception):
+    """
+    Raised by a job handler when running it again cannot succeed (unreadable input,
+    missing reference data). The job fails at once instead of being retried.
+    """
+
+# Failures that are not retried. Handlers raise ValueError for invalid or missing data.
+NON_RETRYABLE_ERRORS = (PermanentJobError, ValueError)
+
+class QueueFullError(Exception):
+    """
+    Raised when the queue is at JOB_QUEUE_MAX. `retry_after` is a hint in seconds.
+    """
+    def __init__(self, retry_after: int):
+        super().__init__(f"Job queue is full. Retry after {retry_after}s.")
+        self.retry_after = retry_after
+
+def _now() -> float:
+    return time.time()
+
+def _iso(ts: Optional[float]) -> Optional[str]:
+    return datetime.datetime.utcfromtimestamp(ts).isoformat() if ts else None
+
+def _connect() -> sqlite3.Connection:
+    # Autocommit mode; transactions are opened explicitly with BEGIN IMMEDIATE
+    conn = sqlite3.connect(JOB_DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
+
+def init_queue():
+    """
+    Creates the jobs table and requeues jobs whose worker stopped heartbeating.
+    """
+    conn = _connect()
+    try:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                job_type TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                owner TEXT,
+                ref TEXT,
+                status TEXT NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL,
+                error TEXT,
+                worker TEXT,
+                run_after REAL NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                heartbeat_at REAL,
+                finished_at REAL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_run_after ON jobs (status, run_after)")
+        # Queue databases created before jobs had ref / heartbeat_at columns
+        columns = {r["name"] for r in conn.execute("PRAGMA table_info(jobs)")}
+        if "ref" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN ref TEXT")
+        if "heartbeat_at" not in columns:
+            conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ref ON jobs (ref)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS worker_cache_stats (
+                process TEXT NOT NULL,
+                cache TEXT NOT NULL,
+                stats TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (process, cache)
+            )
+        """)
+        _requeue_expired(conn)
+    finally:
+        conn.close()
+
+def _requeue_expired(conn: sqlite3.Connection) -> int:
+    # Running jobs whose lease ran out: their worker died (crash, OOM kill, terminate()).
+    # Jobs of live workers in this or another pool keep heartbeating and are left alone.
+    # The lost run already counted as an attempt.
+    now = _now()
+    cur = conn.execute(
+        "UPDATE jobs SET "
+        "status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+        "error = 'Worker lost (heartbeat expired)', worker = NULL, run_after = ?, "
+        "finished_at = CASE WHEN attempts >= max_attempts THEN ? ELSE NULL END "
+        "WHERE status = 'running' AND (heartbeat_at IS NULL OR heartbeat_at < ?)",
+        (now, now, now - JOB_LEASE_SECONDS)
+    )
+    if cur.rowcount:
+        print(f"[Jobs] Requeued {cur.rowcount} jobs with an expired lease.")
+    return cur.rowcount
+
+def _retry_after_hint(conn: sqlite3.Connection, backlog: int) -> int:
+    row = conn.execute("""
+        SELECT AVG(finished_at - started_at) AS avg_runtime FROM (
+            SELECT finished_at, started_at FROM jobs
+            WHERE status = 'done' ORDER BY finished_at DESC LIMIT 20
+        )
+    """).fetchone()
+    avg_runtime = row["avg_runtime"] or 30.0
+    workers = max(1, JOB_WORKERS)
+    return max(5, int(avg_runtime * backlog / workers))
+
+def _backlog(conn: sqlite3.Connection) -> int:
+    return conn.execute("SELECT COUNT(*) FROM jobs WHERE status IN ('queued', 'running')").fetchone()[0]
+
+def check_capacity():
+    """
+    Raises QueueFullError if a new job would be rejected. Cheap pre-check for upload handlers.
+    """
+    conn = _connect()
+    try:
+        backlog = _backlog(conn)
+        if backlog >= JOB_QUEUE_MAX:
+            raise QueueFullError(_retry_after_hint(conn, backlog))
+    finally:
+        conn.close()
+
+def enqueue(job_type: str, payload: Dict[str, Any], owner: Optional[str] = None, ref: Optional[str] = None, max_attempts: Optional[int] = None) -> str:
+    """
+    Persists a job and returns its id. Raises QueueFullError when the queue is full.
+    `ref` is an optional lookup handle (e.g. the video_id the job produces).
+    """
+    if job_type not in JOB_TYPES:
+        raise ValueError(f"Unknown job type: {job_type}")
+
+    job_id = str(uuid.uuid4())
+    conn = _connect()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        backlog = _backlog(conn)
+        if backlog >= JOB_QUEUE_MAX:
+            conn.execute("ROLLBACK")
+            raise QueueFullError(_retry_after_hint(conn, backlog))
+        now = _now()
+        conn.execute(
+            "INSERT INTO jobs (id, job_type, payload, owner, ref, status, max_attempts, run_after, created_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', ?, ?, ?)",
+            (job_id, job_type, json.dumps(payload), owner, ref, max_attempts or JOB_MAX_ATTEMPTS, now, now)
+        )
+        conn.execute("COMMIT")
+    finally:
+        conn.close()
+    print(f"[Jobs] Enqueued {job_type} job {job_id}")
+    return job_id
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the public view of a job (payload omitted), or None.
+    """
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        conn.close()
+    return _public_view(row) if row is not None else None
+
+def get_job_by_ref(ref: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the most recent job created for `ref`, or None.
+    """
+    conn = _connect()
+    try:
+        row = conn.execute("SELECT * FROM jobs WHERE ref = ? ORDER BY created_at DESC LIMIT 1", (ref,)).fetchone()
+    finally:
+        conn.close()
+    return _public_view(row) if row is not None else None
+
+def _public_view(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "job_id": row["id"],
+        "job_type": row["job_type"],
+        "owner": row["owner"],
+        "ref": row["ref"],
+        "status": row["status"],
+        "attempts": row["attempts"],
+        "max_attempts": row["max_attempts"],
+        "error": row["error"],
+        "created_at": _iso(row["created_at"]),
+        "started_at": _iso(row["started_at"]),
+        "finished_at": _iso(row["finished_at"]),
+        "next_attempt_at": _iso(row["run_after"]) if row["status"] == "queued" else None
+    }
+
+def queue_stats() -> Dict[str, Any]:
+    conn = _connect()
+    try:
+        counts = {r["status"]: r["n"] for r in conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status")}
+    finally:
+        conn.close()
+    return {"counts": counts, "max_queued": JOB_QUEUE_MAX, "workers": JOB_WORKERS}
+
+def _claim_next(conn: sqlite3.Connection, worker_id: str) -> Optional[sqlite3.Row]:
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        _requeue_expired(conn)
+        row = conn.execute(
+            "SELECT * FROM jobs WHERE status = 'queued' AND run_after <= ? ORDER BY created_at LIMIT 1",
+            (_now(),)
+        ).fetchone()
+        if row is None:
+            conn.execute("COMMIT")
+            return None
+        now = _now()
+        conn.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, started_at = ?, heartbeat_at = ?, "
+            "error = NULL WHERE id = ?",
+            (worker_id, now, now, row["id"])
+        )
+        conn.execute("COMMIT")
+        return row
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+def _finish(conn: sqlite3.Connection, row: sqlite3.Row, error: Optional[str], retry: bool = True):
+    attempts = row["attempts"] + 1
+    now = _now()
+    if error is None:
+        conn.execute("UPDATE jobs SET status = 'done', finished_at = ? WHERE id = ?", (now, row["id"]))
+    elif retry and attempts < row["max_attempts"]:
+        run_after = now + JOB_RETRY_BACKOFF * (2 ** (attempts - 1))
+        conn.execute(
+            "UPDATE jobs SET status = 'queued', error = ?, run_after = ?, worker = NULL WHERE id = ?",
+            (error, run_after, row["id"])
+        )
+    else:
+        conn.execute(
+            "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ?",
+            (error, now, row["id"])
+        )
+
+def _heartbeat(job_id: str, done: threading.Event):
+    # Own connection: sqlite3 connections must not be shared between threads
+    conn = _connect()
+    try:
+        while not done.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                conn.execute(
+                    "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND status = 'running'",
+                    (_now(), job_id)
+                )
+            except sqlite3.Error as e:
+                print(f"[Jobs] Could not refresh heartbeat of job {job_id}: {e}")
+    finally:
+        conn.close()
+
+def _resolve(job_type: str):
+    module_name, func_name = JOB_TYPES[job_type].split(":")
+    return getattr(importlib.import_module(module_name), func_name)
+
+def _publish_cache_stats(conn: sqlite3.Connection, process: str):
+    # Only caches whose module a job has loaded; the others are still at zero
+    now = _now()
+    for name, target in WORKER_CACHE_STATS.items():
+        module_name, func_name = target.split(":")
+        module = sys.modules.get(module_name)
+        if module is None:
+            continue
+        conn.execute(
+            "INSERT OR REPLACE INTO worker_cache_stats (process, cache, stats, updated_at) VALUES (?, ?, ?, ?)",
+            (process, name, json.dumps(getattr(module, func_name)(), default=str), now)
+        )
+
+def _add_counters(total: Dict[str, Any], stats: Dict[str, Any]):
+    for name, value in stats.items():
+        if isinstance(value, dict):
+            _add_counters(total.setdefault(name, {}), value)
+        elif name in _CACHE_COUNTERS and isinstance(value, (int, float)):
+            total[name] = total.get(name, 0) + value
+
+def _set_hit_rates(total: Dict[str, Any]):
+    for value in total.values():
+        if isinstance(value, dict):
+            _set_hit_rates(value)
+    if "hits" in total:
+        lookups = total.get("lookups", total["hits"] + total.get("misses", 0))
+        total["hit_rate"] = total["hits"] / lookups if lookups else 0.0
+
+def worker_cache_stats() -> Dict[str, Any]:
+    """
+    Counters of the WORKER_CACHE_STATS caches summed over all worker processes
+    (including earlier worker processes, so totals survive restarts).
+    """
+    conn = _connect()
+    try:
+        rows = conn.execute("SELECT cache, stats FROM worker_cache_stats").fetchall()
+    finally:
+        conn.close()
+    totals = {name: {"processes": 0} for name in WORKER_CACHE_STATS}
+    for row in rows:
+        total = totals.setdefault(row["cache"], {"processes": 0})
+        total["processes"] += 1
+        _add_counters(total, json.loads(row["stats"]))
+    for total in totals.values():
+        _set_hit_rates(total)
+    return totals
+
+def run_worker(worker_id: str, stop_event=None):
+    """
+    Worker loop: claims queued jobs one at a time until stop_event is set.
+    """
+    print(f"[Jobs] Worker {worker_id} started (pid {os.getpid()})")
+    process = f"{worker_id}:{os.getpid()}"
+    conn = _connect()
+    try:
+        while stop_event is None or not stop_event.is_set():
+            row = _claim_next(conn, worker_id)
+            if row is None:
+                time.sleep(JOB_POLL_INTERVAL)
+                continue
+
+            print(f"[Jobs] {worker_id} running {row['job_type']} job {row['id']} (attempt {row['attempts'] + 1})")
+            error = None
+            retry = True
+            done = threading.Event()
+            heartbeat = threading.Thread(target=_heartbeat, args=(row["id"], done), daemon=True)
+            heartbeat.start()
+            try:
+                _resolve(row["job_type"])(**json.loads(row["payload"]))
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                retry = not isinstance(e, NON_RETRYABLE_ERRORS)
+                traceback.print_exc()
+            finally:
+                done.set()
+                heartbeat.join()
+            _finish(conn, row, error, retry)
+            try:
+                _publish_cache_stats(conn, process)
+            except sqlite3.Error as e:
+                print(f"[Jobs] Could not publish cache stats: {e}")
+            print(f"[Jobs] {worker_id} finished job {row['id']}: {'ok' if error is None else error}")
+    finally:
+        conn.close()
+
+class WorkerPool:
+    """
+    A fixed pool of worker processes draining the job queue.
+    Workers are not daemonic, so jobs may start their own processes (e.g. pose workers).
+    """
+    def __init__(self, size: int = JOB_WORKERS):
+        self.size = size
+        self.processes = []
+        self._ctx = multiprocessing.get_context("spawn")
+        self._stop = self._ctx.Event()
+
+    def start(self):
+        if self.size <= 0 or self.processes:
+            return
+        init_queue()
+        for i in range(self.size):
+            p = self._ctx.Process(target=run_worker, args=(f"worker-{i}", self._stop), name=f"job-worker-{i}")
+            p.start()
+            self.processes.append(p)
+        print(f"[Jobs] Started {self.size} workers.")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        for p in self.processes:
+            p.join(timeout)
+            if p.is_alive():
+                # The job is requeued once its heartbeat lease expires
+                p.terminate()
+        self.processes = []
+
+job_pool = WorkerPool()
+
+if __name__ == "__main__":
+    # Standalone pool: python -m app.services.jobs (use JOB_WORKERS=0 on the API side)
+    from dotenv import load_dotenv
+    load_dotenv()
+    pool = WorkerPool(max(1, JOB_WORKERS))
+    pool.start()
+    try:
+        for p in pool.processes:
+            p.join()
+    except KeyboardInterrupt:
+        pool.stop()
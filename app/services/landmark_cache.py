@@ -0,0 +1,149 @@
+import os
+import json
+import uuid
+import hashlib
+import datetime
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Content-addressed store of extracted pose landmarks.
+# Entries are keyed by (sha256 of the uploaded file, pose configuration) and hold a raw
+# little-endian float32 (T, 33, 4) array [x, y, z, visibility] plus a small JSON sidecar.
+# Frames where MediaPipe found no pose are stored as NaN rows.
+LANDMARK_CACHE_DIR = os.getenv("LANDMARK_CACHE_DIR", "landmark_cache")
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = ("x", "y", "z", "visibility")
+
+# Per-process counters, reported by get_cache_stats()
+cache_stats = {
+    "lookups": 0,
+    "hits": 0,
+    "misses": 0,
+    "saved_seconds": 0.0
+}
+
+
+def pose_config_digest(pose_config: Dict[str, Any]) -> str:
+    """
+    Stable short digest of everything that influences the extracted landmarks.
+    """
+    canonical = json.dumps(pose_config, sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()[:12]
+
+
+def cache_key(content_hash: str, pose_config: Dict[str, Any]) -> str:
+    return f"{content_hash}_{pose_config_digest(pose_config)}"
+
+
+def _paths(key: str) -> Tuple[str, str]:
+    base = os.path.join(LANDMARK_CACHE_DIR, key)
+    return f"{base}.f32", f"{base}.json"
+
+
+def lookup(key: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cache entry metadata for `key`, or None on a miss.
+    """
+    cache_stats["lookups"] += 1
+    data_path, meta_path = _paths(key)
+    if not (os.path.exists(data_path) and os.path.exists(meta_path)):
+        cache_stats["misses"] += 1
+        return None
+    try:
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        cache_stats["misses"] += 1
+        return None
+    cache_stats["hits"] += 1
+    return meta
+
+
+def iter_cached_landmarks(key: str, meta: Dict[str, Any]) -> Iterator[Tuple[int, List[Dict[str, float]]]]:
+    """
+    Yields (frame_idx, landmarks) from a cache entry in the same format as live extraction.
+    The array is memory-mapped, so long videos are not loaded at once.
+    """
+    data_path, _ = _paths(key)
+    frames = meta["frames"]
+    if frames == 0:
+        return
+    data = np.memmap(data_path, dtype="<f4", mode="r", shape=(frames, NUM_LANDMARKS, len(LANDMARK_FIELDS)))
+    for frame_idx in range(frames):
+        row = data[frame_idx]
+        if np.isnan(row[0, 0]):
+            yield frame_idx, []
+            continue
+        yield frame_idx, [
+            {"id": i, "x": float(lm[0]), "y": float(lm[1]), "z": float(lm[2]), "visibility": float(lm[3])}
+            for i, lm in enumerate(row)
+        ]
+
+
+def round_landmarks(landmarks: List[Dict[str, float]]) -> List[Dict[str, float]]:
+    """
+    Rounds freshly extracted landmarks to the float32 values a cache entry stores, so a
+    video produces the same frames (and embeddings) whether or not the cache was hit.
+    """
+    if not landmarks:
+        return landmarks
+    arr = np.array([[lm[f] for f in LANDMARK_FIELDS] for lm in landmarks[:NUM_LANDMARKS]], dtype="<f4")
+    return [
+        {"id": i, "x": float(lm[0]), "y": float(lm[1]), "z": float(lm[2]), "visibility": float(lm[3])}
+        for i, lm in enumerate(arr)
+    ]
+
+
+def record_saved(seconds: float):
+    cache_stats["saved_seconds"] += max(0.0, seconds)
+
+
+def get_cache_stats() -> Dict[str, Any]:
+    stats = dict(cache_stats)
+    stats["hit_rate"] = (stats["hits"] / stats["lookups"]) if stats["lookups"] else 0.0
+    return stats
+
+
+class LandmarkCacheWriter:
+    """
+    Streams landmarks for a new cache entry into a temporary file and publishes
+    it atomically on commit(), so readers never see a partial entry.
+    """
+
+    def __init__(self, key: str):
+        os.makedirs(LANDMARK_CACHE_DIR, exist_ok=True)
+        self.key = key
+        self.frames = 0
+        self.data_path, self.meta_path = _paths(key)
+        self.tmp_path = f"{self.data_path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self.tmp_path, "wb")
+        self._row = np.empty((NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype="<f4")
+
+    def append(self, landmarks: List[Dict[str, float]]):
+        if landmarks:
+            for i, lm in enumerate(landmarks[:NUM_LANDMARKS]):
+                self._row[i] = (lm["x"], lm["y"], lm["z"], lm["visibility"])
+        else:
+            self._row.fill(np.nan)
+        self._file.write(self._row.tobytes())
+        self.frames += 1
+
+    def commit(self, fps: float, extraction_seconds: float):
+        self._file.close()
+        os.replace(self.tmp_path, self.data_path)
+        meta = {
+            "frames": self.frames,
+            "fps": fps,
+            "extraction_seconds": extraction_seconds,
+            "created_at": datetime.datetime.utcnow().isoformat()
+        }
+        tmp_meta = f"{self.meta_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_meta, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_meta, self.meta_path)
+
+    def abort(self):
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
@@ -0,0 +1,61 @@
+import os
+from typing import Dict, Any, Optional
+
+from app.utils.cache import LRUCache, InvalidationEpoch
+
+# Read-through cache for the metadata resolved on every upload:
+#   exercise name -> Exercise document, exercise_id -> latest Model document.
+# Entries expire after METADATA_CACHE_TTL seconds and are invalidated explicitly
+# (in every process) when an exercise is created or a model is trained.
+# Misses (unknown exercise, no model yet) are not cached.
+METADATA_CACHE_TTL = float(os.getenv("METADATA_CACHE_TTL", "60"))
+
+exercise_cache = LRUCache("exercise_by_name", max_entries=1024, ttl=METADATA_CACHE_TTL,
+                          epoch=InvalidationEpoch("exercises"))
+latest_model_cache = LRUCache("latest_model", max_entries=1024, ttl=METADATA_CACHE_TTL,
+                              epoch=InvalidationEpoch("models"))
+
+def _load_exercise(db, name: str) -> Optional[Dict[str, Any]]:
+    cursor = db.aql.execute("FOR e IN Exercise FILTER e.name == @name RETURN e", bind_vars={"name": name})
+    return None if cursor.empty() else cursor.next()
+
+def _load_latest_model(db, exercise_id: str) -> Optional[Dict[str, Any]]:
+    aql = """
+    FOR m IN Model
+        FILTER m.exercise_id == @eid
+        SORT m.created_at DESC
+        LIMIT 1
+        RETURN m
+    """
+    cursor = db.aql.execute(aql, bind_vars={"eid": exercise_id})
+    return None if cursor.empty() else cursor.next()
+
+def get_exercise_by_name(db, name: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the Exercise document named `name`, or None.
+    """
+    return exercise_cache.get_or_load(name, lambda: _load_exercise(db, name))
+
+def get_latest_model(db, exercise_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the most recently created Model document of an exercise, or None.
+    """
+    return latest_model_cache.get_or_load(exercise_id, lambda: _load_latest_model(db, exercise_id))
+
+def invalidate_exercises():
+    """
+    Call after an Exercise is created, renamed or deleted.
+    """
+    exercise_cache.invalidate_everywhere()
+
+def invalidate_models():
+    """
+    Call after a Model document is inserted.
+    """
+    latest_model_cache.invalidate_everywhere()
+
+def get_metadata_cache_stats() -> Dict[str, Any]:
+    return {
+        "exercises": exercise_cache.get_stats(),
+        "latest_models": latest_model_cache.get_stats()
+    }
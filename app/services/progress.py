@@ -0,0 +1,84 @@
+import time
+import resource
+import datetime
+from contextlib import contextmanager
+from typing import Dict, Any, Optional
+
+# Minimum seconds between RSS samples of the same stage (stages are entered per frame)
+RSS_SAMPLE_INTERVAL = 0.5
+
+def current_rss_mb() -> float:
+    """
+    Resident set size of this process in MB (Linux /proc), falling back to the peak RSS.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * resource.getpagesize() / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return peak_rss_mb()
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+class StageTracker:
+    """
+    Accumulates wall time, frame counts and sampled peak memory per pipeline stage.
+    Stages may be entered many times (e.g. once per frame); totals are summed.
+    """
+    def __init__(self):
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str, frames: int = 0):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            s = self.stages.get(name)
+            if s is None:
+                s = self.stages[name] = {"seconds": 0.0, "frames": 0, "calls": 0, "peak_rss_mb": 0.0, "_sampled": 0.0}
+            s["seconds"] += now - start
+            s["frames"] += frames
+            s["calls"] += 1
+            if s["calls"] == 1 or now - s["_sampled"] >= RSS_SAMPLE_INTERVAL:
+                s["peak_rss_mb"] = max(s["peak_rss_mb"], current_rss_mb())
+                s["_sampled"] = now
+
+    def add_frames(self, name: str, frames: int):
+        if name in self.stages:
+            self.stages[name]["frames"] += frames
+
+    def report(self) -> Dict[str, Any]:
+        stages = {}
+        for name, s in self.stages.items():
+            stages[name] = {
+                "wall_seconds": round(s["seconds"], 4),
+                "frames": s["frames"],
+                "fps": round(s["frames"] / s["seconds"], 2) if s["frames"] and s["seconds"] > 0 else None,
+                "peak_rss_mb": round(s["peak_rss_mb"], 1)
+            }
+        return {
+            "stages": stages,
+            "total_seconds": round(time.perf_counter() - self.started, 4),
+            "process_peak_rss_mb": round(peak_rss_mb(), 1)
+        }
+
+def publish_progress(videos, video_id: str, stage: str, tracker: Optional[StageTracker] = None, stats_key: str = "ingestion", **counters):
+    """
+    Writes live progress (and optionally the stage report) onto the Video document
+    through the video repository (`storage.videos`).
+    Updates merge, so ingestion and scoring stats live side by side.
+    """
+    progress = {"stage": stage, "updated_at": datetime.datetime.utcnow().isoformat()}
+    progress.update(counters)
+    update = {"progress": progress}
+    if tracker is not None:
+        update["processing_stats"] = {stats_key: tracker.report()}
+    try:
+        videos.update(video_id, update, replicate=False)
+    except Exception as e:
+        print(f"[Progress] Failed to publish progress for {video_id}: {e}")
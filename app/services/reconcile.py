@@ -0,0 +1,260 @@
+import sys
+import os
+import json
+import math
+import time
+import hashlib
+import argparse
+from typing import Dict, Any, Optional, List, Tuple
+
+# Ensure the project root is in the python path when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import ArangoDBConnection
+from app.db.orientdb_client import OrientDBClient
+from app.services.replication import append_change
+
+# Arango -> OrientDB consistency check and repair.
+#
+# 1. Bucket digests: each side aggregates its records per bucket (video_id for frame data,
+#    a 2-character _key prefix otherwise) into {count, sums of numeric fields, non-null counts,
+#    total string lengths}. The aggregation runs inside each database; only one small row per
+#    bucket crosses the wire.
+# 2. Drill-down: only buckets whose digests differ are fetched from both sides (paged by _key)
+#    and compared per key by a fingerprint of the document body.
+# 3. Repair: differing, missing and extra keys are appended to the replication outbox in
+#    batches; the replicator upserts them from ArangoDB (or deletes the vertex if the document
+#    no longer exists).
+#
+# Transfer and repair work scale with drift, not with data size. A bucket digest is a cheap
+# filter, not a proof: two drifts that cancel out in every aggregate go unnoticed; `deep=True`
+# drills into every bucket. Frame edges are not compared; they are re-synced with their target frame.
+RECONCILE_PAGE_SIZE = int(os.getenv("RECONCILE_PAGE_SIZE", "1000"))
+RECONCILE_REPAIR_BATCH = int(os.getenv("RECONCILE_REPAIR_BATCH", "500"))
+KEY_PREFIX_LENGTH = 2
+
+# Arango collection -> bucket field (None = _key prefix) and digest fields.
+# sums: numeric fields summed; nonnull: fields whose non-null values are counted;
+# lengths: string fields whose lengths are summed (catches status changes and the like).
+RECONCILE_COLLECTIONS = {
+    "Frame": {"bucket": "video_id", "sums": ["frame_number", "timestamp"], "nonnull": ["embeded_vector"], "lengths": []},
+    "FrameBlock": {"bucket": "video_id", "sums": ["block_index", "frame_count"], "nonnull": ["embeddings"], "lengths": ["landmarks"]},
+    "Video": {"bucket": None, "sums": ["frame_count"], "nonnull": [], "lengths": ["status"]},
+    "User": {"bucket": None, "sums": [], "nonnull": ["google_id"], "lengths": ["email", "hashed_password"]},
+}
+
+# Fields that exist on one side only
+_IGNORED_FIELDS = {"_id", "_rev"}
+_IGNORED_PREFIXES = ("@", "in_", "out_")
+
+def _digest_columns(config: Dict[str, Any]) -> List[Tuple[str, str, str]]:
+    """
+    (name, AQL aggregate expression over `d`, OrientDB SQL aggregate expression).
+    """
+    columns = [("n", "COUNT(1)", "count(*)")]
+    for f in config["sums"]:
+        columns.append((f"sum_{f}", f"SUM(d.{f})", f"sum({f})"))
+    for f in config["nonnull"]:
+        columns.append((f"nonnull_{f}", f"SUM(d.{f} != null ? 1 : 0)", f"count({f})"))
+    for f in config["lengths"]:
+        columns.append((f"len_{f}", f"SUM(LENGTH(d.{f}))", f"sum({f}.length())"))
+    return columns
+
+def _aql_bucket(config: Dict[str, Any]) -> str:
+    return f"d.{config['bucket']}" if config["bucket"] else f"LEFT(d._key, {KEY_PREFIX_LENGTH})"
+
+def _sql_bucket(config: Dict[str, Any]) -> str:
+    return config["bucket"] if config["bucket"] else f"_key.left({KEY_PREFIX_LENGTH})"
+
+def arango_digests(db, collection: str, bucket: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    config = RECONCILE_COLLECTIONS[collection]
+    columns = _digest_columns(config)
+    aggregates = ", ".join(f"{name} = {aql}" for name, aql, _ in columns)
+    bucket_filter = f"FILTER {_aql_bucket(config)} == @bucket" if bucket is not None else ""
+    aql = f"""
+    FOR d IN @@col
+        {bucket_filter}
+        COLLECT bucket = {_aql_bucket(config)} AGGREGATE {aggregates}
+        RETURN {{ bucket, {", ".join(name for name, _, _ in columns)} }}
+    """
+    bind_vars = {"@col": collection}
+    if bucket is not None:
+        bind_vars["bucket"] = bucket
+    return {row.pop("bucket"): row for row in db.aql.execute(aql, bind_vars=bind_vars)}
+
+def orient_digests(orient: OrientDBClient, collection: str, bucket: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+    config = RECONCILE_COLLECTIONS[collection]
+    columns = _digest_columns(config)
+    expr = _sql_bucket(config)
+    projections = ", ".join(f"{sql} AS {name}" for name, _, sql in columns)
+    where = f"WHERE {expr} = :bucket" if bucket is not None else ""
+    result = orient.command(
+        f"SELECT {expr} AS bucket, {projections} FROM {collection} {where} GROUP BY {expr} LIMIT -1",
+        {"bucket": bucket} if bucket is not None else None,
+        idempotent=True
+    )
+    if result is None:
+        raise RuntimeError(f"OrientDB digest query on {collection} failed")
+    digests = {}
+    for row in result.get("result", []):
+        b = row.get("bucket")
+        digests[b] = {name: row.get(name) or 0 for name, _, _ in columns}
+    return digests
+
+def _same_digest(a: Optional[Dict[str, float]], b: Optional[Dict[str, float]]) -> bool:
+    if a is None or b is None:
+        return a is b
+    for name in set(a) | set(b):
+        x, y = a.get(name) or 0, b.get(name) or 0
+        # Float sums may differ in the last bits depending on summation order
+        if not math.isclose(float(x), float(y), rel_tol=1e-9, abs_tol=1e-6):
+            return False
+    return True
+
+def _normalize(value):
+    if isinstance(value, bool) or value is None or isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return round(float(value), 6)
+    if isinstance(value, list):
+        return [_normalize(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _normalize(v) for k, v in value.items()}
+    return value
+
+def fingerprint(doc: Dict[str, Any]) -> str:
+    """
+    Hash of a record's body, comparable between an Arango document and its OrientDB vertex.
+    """
+    body = {
+        k: _normalize(v) for k, v in doc.items()
+        if k not in _IGNORED_FIELDS and not k.startswith(_IGNORED_PREFIXES)
+    }
+    return hashlib.md5(json.dumps(body, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _bucket_range(prefix: str) -> Tuple[str, str]:
+    # All keys starting with `prefix` sort in [prefix, prefix + U+FFFF)
+    return prefix, prefix + "\uffff"
+
+def arango_fingerprints(db, collection: str, bucket: str) -> Dict[str, str]:
+    config = RECONCILE_COLLECTIONS[collection]
+    if config["bucket"]:
+        bucket_filter = f"FILTER d.{config['bucket']} == @bucket"
+        bind = {"bucket": bucket}
+    else:
+        bucket_filter = "FILTER d._key >= @lo AND d._key < @hi"
+        lo, hi = _bucket_range(bucket)
+        bind = {"lo": lo, "hi": hi}
+    aql = f"""
+    FOR d IN @@col
+        {bucket_filter}
+        FILTER @after == null OR d._key > @after
+        SORT d._key
+        LIMIT @limit
+        RETURN d
+    """
+    prints = {}
+    after = None
+    while True:
+        page = list(db.aql.execute(aql, bind_vars=dict(bind, **{"@col": collection, "after": after, "limit": RECONCILE_PAGE_SIZE})))
+        for doc in page:
+            prints[doc["_key"]] = fingerprint(doc)
+        if len(page) < RECONCILE_PAGE_SIZE:
+            return prints
+        after = page[-1]["_key"]
+
+def orient_fingerprints(orient: OrientDBClient, collection: str, bucket: str) -> Dict[str, str]:
+    config = RECONCILE_COLLECTIONS[collection]
+    if config["bucket"]:
+        where = f"{config['bucket']} = :bucket"
+        params = {"bucket": bucket}
+    else:
+        where = "_key >= :lo AND _key < :hi"
+        lo, hi = _bucket_range(bucket)
+        params = {"lo": lo, "hi": hi}
+    prints = {}
+    after = ""
+    while True:
+        result = orient.command(
+            f"SELECT FROM {collection} WHERE {where} AND _key > :after ORDER BY _key LIMIT :limit",
+            dict(params, after=after, limit=RECONCILE_PAGE_SIZE),
+            idempotent=True
+        )
+        if result is None:
+            raise RuntimeError(f"OrientDB fetch of {collection} bucket {bucket} failed")
+        page = result.get("result", [])
+        for doc in page:
+            if doc.get("_key") is not None:
+                prints[doc["_key"]] = fingerprint(doc)
+        if len(page) < RECONCILE_PAGE_SIZE:
+            return prints
+        after = page[-1]["_key"]
+
+def diff_bucket(db, orient: OrientDBClient, collection: str, bucket: str) -> Dict[str, List[str]]:
+    """
+    Per-key comparison of one bucket: keys missing in OrientDB, extra in OrientDB, and changed.
+    """
+    ours = arango_fingerprints(db, collection, bucket)
+    theirs = orient_fingerprints(orient, collection, bucket)
+    return {
+        "missing": [k for k in ours if k not in theirs],
+        "extra": [k for k in theirs if k not in ours],
+        "changed": [k for k, fp in ours.items() if k in theirs and theirs[k] != fp]
+    }
+
+def ensure_bucket_indexes(orient: OrientDBClient):
+    # Drill-down fetches one bucket at a time; without an index each fetch scans the class
+    for collection, config in RECONCILE_COLLECTIONS.items():
+        if config["bucket"]:
+            orient.command(
+                f"CREATE INDEX {collection}.{config['bucket']} IF NOT EXISTS ON {collection} ({config['bucket']}) NOTUNIQUE",
+                idempotent=True
+            )
+
+def reconcile_collection(db, orient: OrientDBClient, collection: str, bucket: Optional[str] = None,
+                         deep: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    start = time.perf_counter()
+    ours = arango_digests(db, collection, bucket)
+    theirs = orient_digests(orient, collection, bucket)
+    buckets = set(ours) | set(theirs)
+    differing = sorted(b for b in buckets if b is not None and (deep or not _same_digest(ours.get(b), theirs.get(b))))
+
+    report = {"buckets": len(buckets), "differing_buckets": len(differing), "missing": 0, "extra": 0, "changed": 0, "queued": 0}
+    pending = []
+    for b in differing:
+        diff = diff_bucket(db, orient, collection, b)
+        for kind, keys in diff.items():
+            report[kind] += len(keys)
+            pending.extend(keys)
+        if len(pending) >= RECONCILE_REPAIR_BATCH or b == differing[-1]:
+            if not dry_run:
+                for i in range(0, len(pending), RECONCILE_REPAIR_BATCH):
+                    append_change(db, collection, pending[i:i + RECONCILE_REPAIR_BATCH])
+                report["queued"] += len(pending)
+            pending = []
+    report["seconds"] = round(time.perf_counter() - start, 2)
+    return report
+
+def reconcile(collections: Optional[List[str]] = None, bucket: Optional[str] = None,
+              deep: bool = False, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Job: compares OrientDB with ArangoDB and queues repairs for every difference found.
+    `bucket` restricts the check to one bucket (e.g. a video_id for frame collections).
+    """
+    db = ArangoDBConnection().get_db()
+    orient = OrientDBClient()
+    ensure_bucket_indexes(orient)
+    report = {}
+    for collection in collections or list(RECONCILE_COLLECTIONS):
+        report[collection] = reconcile_collection(db, orient, collection, bucket, deep, dry_run)
+        print(f"[Reconcile] {collection}: {report[collection]}")
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare OrientDB with ArangoDB by bucket digests and queue repairs.")
+    parser.add_argument("--collection", action="append", choices=list(RECONCILE_COLLECTIONS), help="Repeatable; default: all")
+    parser.add_argument("--bucket", default=None, help="Only this bucket (video_id, or key prefix for Video/User)")
+    parser.add_argument("--deep", action="store_true", help="Compare every bucket key by key")
+    parser.add_argument("--dry-run", action="store_true", help="Report differences without queueing repairs")
+    args = parser.parse_args()
+    print(json.dumps(reconcile(args.collection, args.bucket, args.deep, args.dry_run), indent=2))
@@ -0,0 +1,275 @@
+import os
+import time
+import uuid
+import threading
+import traceback
+from typing import Dict, Any, List, Optional, Iterable
+
+from app.db.database import ArangoDBConnection
+from app.db.orientdb_client import OrientDBClient
+
+# Outbox for the OrientDB replica.
+#
+# Writers append a change record to ReplicationOutbox right after their ArangoDB write instead
+# of writing to OrientDB inline. This is best effort, not transactional: the record is written
+# separately from the data, and append_change swallows its own errors, so a crash or a failed
+# insert between the two loses the record. The reconciler (app/services/reconcile.py) finds
+# and re-queues such drift.
+#
+# Records only reference documents ({collection, keys}); the replicator reads their *current*
+# state from ArangoDB and upserts it into OrientDB by _key (or deletes the vertex if the
+# document is gone). Replaying a record is therefore harmless, and records for the same key
+# may be applied in any order.
+#
+# A background thread drains the outbox in batches. Records are claimed with a lease, so
+# several API processes can run replicators side by side. Failed records are retried with
+# exponential backoff and parked as "dead" after REPLICATION_MAX_ATTEMPTS.
+OUTBOX_COLLECTION = "ReplicationOutbox"
+REPLICATION_ENABLED = os.getenv("REPLICATION_ENABLED", "1") == "1"
+REPLICATION_BATCH_SIZE = int(os.getenv("REPLICATION_BATCH_SIZE", "200"))      # Outbox records per claim
+REPLICATION_POLL_INTERVAL = float(os.getenv("REPLICATION_POLL_INTERVAL", "1.0"))
+REPLICATION_MAX_ATTEMPTS = int(os.getenv("REPLICATION_MAX_ATTEMPTS", "10"))
+REPLICATION_RETRY_BACKOFF = float(os.getenv("REPLICATION_RETRY_BACKOFF", "2"))  # Seconds, doubled per attempt
+REPLICATION_MAX_BACKOFF = 300.0
+REPLICATION_LEASE = 60.0  # Seconds a claimed batch is hidden from other replicators
+
+# Arango collection -> how it is mirrored. Frame records also carry the FrameEdge edges into the frames.
+REPLICATED_COLLECTIONS = {
+    "User": {"vertex_class": "User"},
+    "Video": {"vertex_class": "Video"},
+    "Frame": {"vertex_class": "Frame", "edge_collection": "FrameEdge"},
+    "FrameBlock": {"vertex_class": "FrameBlock"},
+}
+
+def append_change(db, collection: str, keys: Iterable[str]):
+    """
+    Records that documents of `collection` changed (inserted, updated or deleted).
+    Call right after the ArangoDB write. Never raises: a lost record is repaired by the reconciler.
+    """
+    keys = list(keys)
+    if not keys or collection not in REPLICATED_COLLECTIONS:
+        return
+    now = time.time()
+    try:
+        db.collection(OUTBOX_COLLECTION).insert({
+            "collection": collection,
+            "keys": keys,
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+            "seq": time.time_ns(),
+            "created_at": now,
+            "next_attempt_at": now
+        }, silent=True)
+    except Exception as e:
+        print(f"[Replication] Failed to append outbox record for {collection} ({len(keys)} keys): {e}")
+
+def _strip_arango_fields(doc: Dict[str, Any]) -> Dict[str, Any]:
+    # _key stays: OrientDB records are matched by it
+    return {k: v for k, v in doc.items() if k not in ("_id", "_rev")}
+
+def _claim(db, owner: str, limit: int) -> List[Dict[str, Any]]:
+    now = time.time()
+    aql = """
+    FOR r IN ReplicationOutbox
+        FILTER r.status == "pending" AND r.next_attempt_at <= @now
+        SORT r.next_attempt_at, r.seq
+        LIMIT @limit
+        UPDATE r WITH { next_attempt_at: @lease_until, claimed_by: @owner } IN ReplicationOutbox
+        RETURN NEW
+    """
+    return list(db.aql.execute(aql, bind_vars={
+        "now": now, "lease_until": now + REPLICATION_LEASE, "owner": owner, "limit": limit
+    }))
+
+def replicate_keys(db, collection: str, keys: List[str], orient: Optional[OrientDBClient] = None) -> Dict[str, int]:
+    """
+    Makes OrientDB match ArangoDB for the given keys: upserts existing documents
+    (and, for frames, their incoming edges) and deletes vertices whose document is gone.
+    Raises on failure so the caller can retry.
+    """
+    config = REPLICATED_COLLECTIONS[collection]
+    orient = orient or OrientDBClient()
+    docs = list(db.aql.execute(
+        "FOR d IN DOCUMENT(@@col, @keys) RETURN d",
+        bind_vars={"@col": collection, "keys": keys}
+    ))
+    found = {d["_key"] for d in docs}
+    missing = [k for k in keys if k not in found]
+
+    edges = []
+    if docs and config.get("edge_collection"):
+        edges = list(db.aql.execute(
+            "FOR e IN @@edges FILTER e._to IN @ids RETURN e",
+            bind_vars={"@edges": config["edge_collection"], "ids": [d["_id"] for d in docs]}
+        ))
+
+    if docs:
+        orient.sync_graph(
+            config["vertex_class"], [_strip_arango_fields(d) for d in docs],
+            config.get("edge_collection"), [_strip_arango_fields(e) for e in edges]
+        )
+    if missing:
+        orient.delete_vertices(config["vertex_class"], missing)
+    return {"upserted": len(docs), "deleted": len(missing), "edges": len(edges)}
+
+def _finish(db, records: List[Dict[str, Any]], error: Optional[str]):
+    outbox = db.collection(OUTBOX_COLLECTION)
+    if error is None:
+        outbox.delete_many([{"_key": r["_key"]} for r in records], silent=True)
+        return
+    now = time.time()
+    updates = []
+    for r in records:
+        attempts = r.get("attempts", 0) + 1
+        backoff = min(REPLICATION_MAX_BACKOFF, REPLICATION_RETRY_BACKOFF * (2 ** (attempts - 1)))
+        updates.append({
+            "_key": r["_key"],
+            "attempts": attempts,
+            "error": error,
+            "status": "pending" if attempts < REPLICATION_MAX_ATTEMPTS else "dead",
+            "next_attempt_at": now + backoff,
+            "claimed_by": None
+        })
+    outbox.update_many(updates, silent=True)
+
+class OutboxReplicator:
+    """
+    Background thread draining ReplicationOutbox into OrientDB.
+    """
+    def __init__(self, batch_size: int = REPLICATION_BATCH_SIZE, poll_interval: float = REPLICATION_POLL_INTERVAL):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {"records": 0, "documents": 0, "deleted": 0, "edges": 0, "failed_records": 0}
+        self.last_success_at = None
+        self.last_error = None
+
+    def start(self):
+        if not REPLICATION_ENABLED or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, name="orient-replicator", daemon=True)
+        self._thread.start()
+        print(f"[Replication] Replicator {self.owner} started.")
+
+    def stop(self, timeout: float = 10.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def run(self):
+        try:
+            # Edge endpoints and upserts are matched by _key; make sure those lookups are indexed
+            OrientDBClient().ensure_key_indexes()
+        except Exception as e:
+            print(f"[Replication] Could not ensure OrientDB _key indexes: {e}")
+        while not self._stop.is_set():
+            try:
+                drained = self.drain_once()
+            except Exception as e:
+                # ArangoDB unavailable etc.; keep the thread alive
+                print(f"[Replication] Replicator loop error: {e}")
+                drained = 0
+            if drained < self.batch_size:
+                self._stop.wait(self.poll_interval)
+
+    def drain_once(self, db=None) -> int:
+        """
+        Claims and applies one batch of outbox records. Returns the number of records claimed.
+        Records are grouped per collection, so one OrientDB call covers many changes.
+        """
+        db = db or ArangoDBConnection().get_db()
+        records = _claim(db, self.owner, self.batch_size)
+        if not records:
+            return 0
+
+        by_collection = {}
+        for r in records:
+            by_collection.setdefault(r["collection"], []).append(r)
+
+        orient = OrientDBClient()
+        for collection, group in by_collection.items():
+            # Several records may name the same key; it is replicated once
+            keys = list(dict.fromkeys(k for r in group for k in r["keys"]))
+            error = None
+            try:
+                result = replicate_keys(db, collection, keys, orient)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                traceback.print_exc()
+            _finish(db, group, error)
+
+            with self._lock:
+                if error is None:
+                    self.counters["records"] += len(group)
+                    self.counters["documents"] += result["upserted"]
+                    self.counters["deleted"] += result["deleted"]
+                    self.counters["edges"] += result["edges"]
+                    self.last_success_at = time.time()
+                else:
+                    self.counters["failed_records"] += len(group)
+                    self.last_error = error
+        return len(records)
+
+    def get_stats(self, db=None) -> Dict[str, Any]:
+        """
+        Backlog and lag of the outbox (all processes) plus this replicator's counters.
+        Lag is the age of the oldest pending record.
+        """
+        db = db or ArangoDBConnection().get_db()
+        aql = """
+        FOR r IN ReplicationOutbox
+            COLLECT status = r.status AGGREGATE n = COUNT(1), oldest = MIN(r.created_at), keys = SUM(LENGTH(r.keys))
+            RETURN { status, n, oldest, keys }
+        """
+        by_status = {row["status"]: row for row in db.aql.execute(aql)}
+        pending = by_status.get("pending", {})
+        now = time.time()
+        with self._lock:
+            counters = dict(self.counters)
+            last_success_at = self.last_success_at
+            last_error = self.last_error
+        return {
+            "enabled": REPLICATION_ENABLED,
+            "running": bool(self._thread and self._thread.is_alive()),
+            "backlog_records": pending.get("n", 0),
+            "backlog_keys": pending.get("keys", 0),
+            "lag_seconds": round(now - pending["oldest"], 1) if pending.get("oldest") else 0.0,
+            "dead_records": by_status.get("dead", {}).get("n", 0),
+            "replicated": counters,
+            "last_success_seconds_ago": round(now - last_success_at, 1) if last_success_at else None,
+            "last_error": last_error,
+            "pid": os.getpid()
+        }
+
+def retry_dead_records(db=None) -> int:
+    """
+    Puts records parked as "dead" back into the queue (e.g. after an OrientDB outage).
+    """
+    db = db or ArangoDBConnection().get_db()
+    aql = """
+    FOR r IN ReplicationOutbox
+        FILTER r.status == "dead"
+        UPDATE r WITH { status: "pending", attempts: 0, next_attempt_at: @now } IN ReplicationOutbox
+        COLLECT WITH COUNT INTO n
+        RETURN n
+    """
+    return next(iter(db.aql.execute(aql, bind_vars={"now": time.time()})), 0)
+
+replicator = OutboxReplicator()
+
+if __name__ == "__main__":
+    # Standalone replicator: python -m app.services.replication (use REPLICATION_ENABLED=0 on the API side)
+    from dotenv import load_dotenv
+    load_dotenv()
+    standalone = OutboxReplicator()
+    print(f"[Replication] Replicator {standalone.owner} running (Ctrl+C to stop).")
+    try:
+        standalone.run()
+    except KeyboardInterrupt:
+        standalone.stop()
@@ -0,0 +1,162 @@
+import sys
+import os
+import json
+import datetime
+import argparse
+from typing import Dict, Any, Optional, List
+
+import numpy as np
+
+# Ensure the project root is in the python path when run as a script
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.database import ArangoDBConnection
+from app.services.frame_blocks import (
+    load_frame_range, build_frame_archive, video_storage_format, ARCHIVE_ZSTD_LEVEL
+)
+from app.services.replication import append_change
+
+# Tiered retention for raw pose data.
+#
+# Completed user videos older than RETENTION_DAYS are moved to the cold tier: all their frames
+# are packed into one zstd-compressed FrameArchive document (key = video_id), the Video is
+# marked storage_tier "cold", and the hot Frame / FrameEdge / FrameBlock rows are deleted.
+# Readers in frame_blocks.py decompress the archive transparently (storage format "archive").
+#
+# The steps are ordered so a crash never loses data: the archive is written before the Video
+# is switched to cold, and rows are only purged after the switch. Videos left cold with
+# hot_rows_purged == false are picked up again by the next run. Reference videos stay hot.
+RETENTION_DAYS = int(os.getenv("RETENTION_DAYS", "90"))
+RETENTION_BATCH = int(os.getenv("RETENTION_BATCH", "50"))           # Videos per run
+RETENTION_DELETE_BATCH = int(os.getenv("RETENTION_DELETE_BATCH", "1000"))  # Rows removed per AQL query
+# Upper bound for "all frames" reads
+_ALL_FRAMES = 2 ** 31 - 1
+
+def find_candidates(db, cutoff: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Videos due for archiving plus cold videos whose hot rows were not purged yet.
+    """
+    aql = """
+    FOR v IN Video
+        FILTER (v.storage_tier != "cold" AND v.status == "complete" AND v.upload_time < @cutoff)
+            OR (v.storage_tier == "cold" AND v.hot_rows_purged != true)
+        FILTER v.is_reference != true
+        LIMIT @limit
+        RETURN KEEP(v, "_key", "fps", "frame_storage", "storage_tier", "upload_time")
+    """
+    return list(db.aql.execute(aql, bind_vars={"cutoff": cutoff, "limit": limit}))
+
+def archive_video(db, video: Dict[str, Any], level: int = ARCHIVE_ZSTD_LEVEL) -> Dict[str, Any]:
+    """
+    Writes the FrameArchive document of a hot video and switches it to the cold tier.
+    Raises ValueError if the stored frames are not a dense 0..T-1 sequence.
+    """
+    video_id = video["_key"]
+    frames = load_frame_range(db, video_id, 0, _ALL_FRAMES, ["landmarks", "embedding"])
+    numbers = frames["frame_number"]
+    if not np.array_equal(numbers, np.arange(len(numbers))):
+        raise ValueError(f"Frames of video {video_id} are not contiguous; not archived")
+
+    embeddings = frames["embedding"]
+    mask = ~np.isnan(embeddings).all(axis=1)
+    doc = build_frame_archive(video_id, video.get("fps") or 0.0, frames["landmarks"], embeddings, mask, level=level)
+    doc["archived_at"] = datetime.datetime.utcnow().isoformat()
+    db.collection("FrameArchive").insert(doc, overwrite=True, silent=True)
+
+    db.collection("Video").update({"_key": video_id, "storage_tier": "cold", "hot_rows_purged": False})
+    append_change(db, "Video", [video_id])
+    return {"frames": doc["frame_count"], "raw_bytes": doc["raw_bytes"], "compressed_bytes": doc["compressed_bytes"]}
+
+def _remove_batches(db, aql: str, bind_vars: Dict[str, Any], collection: Optional[str]) -> int:
+    # Runs a "REMOVE ... LIMIT @batch RETURN OLD._key" query until nothing is left, queueing
+    # the removed keys for the OrientDB mirror
+    removed = 0
+    while True:
+        keys = list(db.aql.execute(aql, bind_vars={**bind_vars, "batch": RETENTION_DELETE_BATCH}))
+        if not keys:
+            return removed
+        if collection:
+            append_change(db, collection, keys)
+        removed += len(keys)
+
+def purge_hot_rows(db, video_id: str) -> Dict[str, int]:
+    """
+    Deletes the Frame, FrameEdge and FrameBlock rows of an archived video in batches.
+    """
+    # Edges first: they are found through the frames they point at
+    edges = _remove_batches(db, """
+    FOR f IN Frame
+        FILTER f.video_id == @vid
+        FOR e IN FrameEdge
+            FILTER e._to == f._id
+            LIMIT @batch
+            REMOVE e IN FrameEdge
+            RETURN OLD._key
+    """, {"vid": video_id}, None)
+    frames = _remove_batches(db, """
+    FOR f IN Frame
+        FILTER f.video_id == @vid
+        LIMIT @batch
+        REMOVE f IN Frame
+        RETURN OLD._key
+    """, {"vid": video_id}, "Frame")
+    blocks = _remove_batches(db, """
+    FOR b IN FrameBlock
+        FILTER b.video_id == @vid
+        LIMIT @batch
+        REMOVE b IN FrameBlock
+        RETURN OLD._key
+    """, {"vid": video_id}, "FrameBlock")
+
+    db.collection("Video").update({"_key": video_id, "hot_rows_purged": True})
+    append_change(db, "Video", [video_id])
+    return {"frames": frames, "edges": edges, "blocks": blocks}
+
+def apply_retention(days: Optional[int] = None, limit: Optional[int] = None, video_id: Optional[str] = None,
+                    dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Job: archives up to `limit` videos uploaded more than `days` ago and purges their hot rows.
+    `video_id` archives that video regardless of age.
+    """
+    db = ArangoDBConnection().get_db()
+    days = RETENTION_DAYS if days is None else days
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).isoformat()
+
+    if video_id:
+        video = db.collection("Video").get(video_id)
+        if not video:
+            raise ValueError(f"Video {video_id} not found")
+        candidates = [video]
+    else:
+        candidates = find_candidates(db, cutoff, limit or RETENTION_BATCH)
+
+    report = {"cutoff": cutoff, "archived": 0, "purged": 0, "failed": 0, "raw_bytes": 0, "compressed_bytes": 0, "videos": []}
+    for video in candidates:
+        vid = video["_key"]
+        if dry_run:
+            report["videos"].append({"video_id": vid, "storage_tier": video.get("storage_tier", "hot")})
+            continue
+        try:
+            entry = {"video_id": vid}
+            if video_storage_format(db, vid) != "archive":
+                entry.update(archive_video(db, video))
+                report["archived"] += 1
+                report["raw_bytes"] += entry["raw_bytes"]
+                report["compressed_bytes"] += entry["compressed_bytes"]
+            entry["removed"] = purge_hot_rows(db, vid)
+            report["purged"] += 1
+        except Exception as e:
+            entry["error"] = f"{type(e).__name__}: {e}"
+            report["failed"] += 1
+        print(f"[Retention] {entry}")
+        report["videos"].append(entry)
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old videos' raw frames into compressed FrameArchive documents.")
+    parser.add_argument("--days", type=int, default=None, help=f"Archive videos older than this (default {RETENTION_DAYS})")
+    parser.add_argument("--limit", type=int, default=None, help=f"Videos per run (default {RETENTION_BATCH})")
+    parser.add_argument("--video-id", default=None, help="Archive this video regardless of age")
+    parser.add_argument("--dry-run", action="store_true", help="List candidates without archiving")
+    args = parser.parse_args()
+    print(json.dumps(apply_retention(args.days, args.limit, args.video_id, args.dry_run), indent=2))
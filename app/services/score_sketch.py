@@ -0,0 +1,86 @@
+from typing import Dict, Any, Optional, List
+
+# Score distribution sketches, one per exercise ("<exercise_key>_all") and one per
+# exercise and model version ("<exercise_key>_<model_version>"), stored in ScoreSketch.
+#
+# Scores live in the bounded domain [0, 100], so the sketch is a fixed-resolution sparse
+# histogram {"<floor(score * 10)>": count} rather than a t-digest/KLL: at most 1001 buckets,
+# quantiles exact to 0.1 points, and merging two sketches is adding their counts.
+# Sketches are updated in the Session insert transaction (see aggregates.record_session).
+SCORE_SKETCH_RESOLUTION = 10
+ALL_MODELS = "all"
+
+def sketch_key(exercise_id: str, model_version: Optional[str] = None) -> str:
+    return f"{exercise_id.split('/')[-1]}_{model_version or ALL_MODELS}"
+
+def score_bucket(score: float) -> int:
+    return int(min(max(score, 0.0), 100.0) * SCORE_SKETCH_RESOLUTION)
+
+def merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combines two sketches (e.g. several model versions of one exercise).
+    """
+    buckets = dict(a.get("buckets", {}))
+    for bucket, count in b.get("buckets", {}).items():
+        buckets[bucket] = buckets.get(bucket, 0) + count
+    return {
+        "count": a.get("count", 0) + b.get("count", 0),
+        "sum": a.get("sum", 0.0) + b.get("sum", 0.0),
+        "buckets": buckets
+    }
+
+def _sorted_buckets(sketch: Dict[str, Any]) -> List[tuple]:
+    return sorted((int(bucket), count) for bucket, count in sketch.get("buckets", {}).items() if count)
+
+def quantile(sketch: Dict[str, Any], q: float) -> Optional[float]:
+    """
+    Score at quantile q (0-1), the midpoint of the bucket holding it.
+    """
+    total = sketch.get("count", 0)
+    if not total:
+        return None
+    target = q * total
+    cumulative = 0
+    buckets = _sorted_buckets(sketch)
+    for bucket, count in buckets:
+        cumulative += count
+        if cumulative >= target:
+            return min(100.0, (bucket + 0.5) / SCORE_SKETCH_RESOLUTION)
+    return min(100.0, (buckets[-1][0] + 0.5) / SCORE_SKETCH_RESOLUTION)
+
+def percentile_of(sketch: Dict[str, Any], score: float) -> Optional[float]:
+    """
+    Percentage of recorded scores below `score` (ties in its bucket count half).
+    """
+    total = sketch.get("count", 0)
+    if not total:
+        return None
+    mine = score_bucket(score)
+    below = same = 0
+    for bucket, count in _sorted_buckets(sketch):
+        if bucket < mine:
+            below += count
+        elif bucket == mine:
+            same += count
+    return round(100.0 * (below + 0.5 * same) / total, 1)
+
+def summarize(sketch: Optional[Dict[str, Any]], score: Optional[float] = None) -> Dict[str, Any]:
+    sketch = sketch or {}
+    count = sketch.get("count", 0)
+    summary = {
+        "count": count,
+        "mean": round(sketch["sum"] / count, 2) if count else None,
+        "p10": quantile(sketch, 0.10),
+        "p50": quantile(sketch, 0.50),
+        "p90": quantile(sketch, 0.90)
+    }
+    if score is not None:
+        summary["score"] = score
+        summary["percentile"] = percentile_of(sketch, score)
+    return summary
+
+def get_sketch(db, exercise_id: str, model_version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    try:
+        return db.collection("ScoreSketch").get(sketch_key(exercise_id, model_version))
+    except Exception:
+        return None
@@ -1,27 +1,94 @@
 
+import os
 import datetime
-from typing import List, Optional, Dict
-from app.db.database import ArangoDBConnection
+import numpy as np
+from typing import List, Optional, Dict, Tuple
+from app.db.repositories import Storage, get_storage
 from app.services.dtw_analysis import calculate_similarity
+from app.services.progress import StageTracker, publish_progress
+from app.services.embedding_store import model_version_for
+from app.utils.cache import LRUCache, InvalidationEpoch
 
-def get_video_embeddings(db, video_id: str) -> List[List[float]]:
+# Reference videos only change on a reference upload or a retrain, so their resolution and
+# decoded embedding matrices are cached per process. Invalidation is broadcast to all
+# processes (API + job workers) through a shared epoch file.
+REF_CACHE_MAX_ENTRIES = int(os.getenv("REF_CACHE_MAX_ENTRIES", "32"))
+REF_CACHE_MAX_MB = int(os.getenv("REF_CACHE_MAX_MB", "256"))
+REF_RESOLUTION_TTL = float(os.getenv("REF_RESOLUTION_TTL", "300"))
+
+_reference_epoch = InvalidationEpoch("reference_embeddings")
+reference_matrix_cache = LRUCache(
+    "reference_embeddings",
+    max_entries=REF_CACHE_MAX_ENTRIES,
+    max_bytes=REF_CACHE_MAX_MB * 1024 * 1024,
+    sizeof=lambda matrix: matrix.nbytes,
+    epoch=_reference_epoch
+)
+reference_video_cache = LRUCache("reference_video_ids", max_entries=1024, ttl=REF_RESOLUTION_TTL, epoch=_reference_epoch)
+
+def get_video_embeddings(storage: Storage, video_id: str, model_path: Optional[str] = None) -> np.ndarray:
+    """
+    Fetches the sequence of embeddings for a given video ID as an (M, 128) float32 matrix.
+    With `model_path`, the packed VideoEmbedding document for that model is read by key.
+    Otherwise (or if it does not exist) the FrameBlock / Frame documents are read.
+    """
+    if model_path:
+        matrix = storage.frames.get_embedding_matrix(video_id, model_path)
+        if matrix is not None:
+            return matrix
+    return storage.frames.load_embeddings(video_id)
+
+def _exercise_key(exercise_id: str) -> str:
+    return exercise_id.split("/")[-1] if "/" in exercise_id else exercise_id
+
+def _lookup_reference_video(storage: Storage, exercise_id: str) -> Optional[str]:
+    # Try finding explicit reference field first
+    exercise_doc = storage.exercises.get(exercise_id)
+    if exercise_doc and exercise_doc.get("ref_video_id"):
+        return exercise_doc["ref_video_id"]
+    
+    # Fallback: Search for any reference video for this exercise
+    return storage.videos.find_reference(exercise_id)
+
+def resolve_reference_video(storage: Storage, exercise_id: str) -> Optional[str]:
     """
-    Fetches the sequence of embeddings for a given video ID.
-    Access based on keys usually needs frame iteration or AQL query.
-    Using AQL to fetch all frame embeddings sorted by frame_number.
+    Returns the reference video ID of an exercise (Exercise.ref_video_id, else any reference Video).
     """
-    # Assuming video_id is the UUID
-    aql = """
-    FOR f IN Frame
-        FILTER f.video_id == @video_id
-        SORT f.frame_number ASC
-        RETURN f.embeded_vector
+    return reference_video_cache.get_or_load(_exercise_key(exercise_id), lambda: _lookup_reference_video(storage, exercise_id))
+
+def get_reference_embeddings(storage: Storage, exercise_id: str, ref_video_id: str, model_path: Optional[str] = None) -> Tuple[np.ndarray, bool]:
     """
-    cursor = db.aql.execute(aql, bind_vars={"video_id": video_id})
-    embeddings = [emb for emb in cursor if emb is not None]
-    return embeddings
+    Returns (embedding matrix, cache_hit) for a reference video. The cached matrix is shared
+    between calls and marked read-only.
+    """
+    key = (_exercise_key(exercise_id), ref_video_id, model_path)
+    matrix = reference_matrix_cache.get(key)
+    if matrix is not None:
+        return matrix, True
+    matrix = get_video_embeddings(storage, ref_video_id, model_path)
+    if len(matrix) > 0:
+        matrix.flags.writeable = False
+        reference_matrix_cache.put(key, matrix)
+    return matrix, False
 
-def evaluate_session(user_video_id: str, exercise_id: str) -> Dict[str, any]:
+def invalidate_reference_cache(exercise_id: Optional[str] = None):
+    """
+    Drops cached reference resolutions and matrices in every process.
+    Call whenever an exercise's reference video or the embedding model changes.
+    """
+    reference_video_cache.invalidate_everywhere()
+    reference_matrix_cache.invalidate_everywhere()
+    if exercise_id:
+        print(f"[Scoring] Reference cache invalidated for exercise {exercise_id}")
+
+def get_reference_cache_stats() -> Dict[str, any]:
+    return {
+        "matrices": reference_matrix_cache.get_stats(),
+        "resolutions": reference_video_cache.get_stats()
+    }
+
+def evaluate_session(user_video_id: str, exercise_id: str, model_path: Optional[str] = None,
+                     storage: Optional[Storage] = None) -> Dict[str, any]:
     """
     Evaluates a user session by comparing the uploaded video against the exercise's reference video.
     
@@ -32,60 +99,45 @@ def evaluate_session(user_video_id: str, exercise_id: str) -> Dict[str, any]:
     4. Calculate DTW similarity score.
     5. Save Session edge.
     
+    Stage timings are published to the user Video document under processing_stats.scoring.
+    `model_path` is the model the user video was embedded with; both embedding sequences are
+    then fetched as packed matrices by key when available.
+    `storage` defaults to the process-wide backend (STORAGE_BACKEND).
+    
     Returns:
         Dict: {"score": float, "session_id": str}
     """
-    db = ArangoDBConnection().get_db()
+    storage = storage or get_storage()
+    tracker = StageTracker()
+    publish_progress(storage.videos, user_video_id, "scoring")
 
     # 1. Fetch User Embeddings
-    user_embeddings = get_video_embeddings(db, user_video_id)
-    if not user_embeddings:
+    with tracker.stage("fetch_user_embeddings"):
+        user_embeddings = get_video_embeddings(storage, user_video_id, model_path)
+    tracker.add_frames("fetch_user_embeddings", len(user_embeddings))
+    if len(user_embeddings) == 0:
         raise ValueError("User video has no processed embeddings yet.")
 
-    # 2. Identify Reference Video
-    # Query Exercise to get ref_video_id
-    # Assuming Exercise document has 'ref_video_id' field as per summary/plan
-    # Note: If schema is different, we might need to query Video with is_reference=true and exercise_id
-    
-    # Try finding explicit reference field first
-    exercise_key = exercise_id
-    if "/" in exercise_id:
-        exercise_key = exercise_id.split("/")[-1]
-        
-    try:
-        exercise_doc = db.collection("Exercise").get(exercise_key)
-    except:
-        exercise_doc = None
-        
-    ref_video_id = None
-    if exercise_doc and "ref_video_id" in exercise_doc:
-        ref_video_id = exercise_doc["ref_video_id"]
-    
-    # Fallback: Search for any reference video for this exercise
-    if not ref_video_id:
-        aql_ref = """
-        FOR v IN Video
-            FILTER v.exercise_id == @ex_id AND v.is_reference == true
-            LIMIT 1
-            RETURN v.video_id
-        """
-        cursor = db.aql.execute(aql_ref, bind_vars={"ex_id": exercise_id})
-        for v_id in cursor:
-            ref_video_id = v_id
+    # 2. Identify Reference Video (cached; invalidated on reference upload / retrain)
+    with tracker.stage("resolve_reference"):
+        ref_video_id = resolve_reference_video(storage, exercise_id)
             
     if not ref_video_id:
         raise ValueError(f"No reference video found for exercise {exercise_id}")
 
-    # 3. Fetch Reference Embeddings
-    ref_embeddings = get_video_embeddings(db, ref_video_id)
-    if not ref_embeddings:
+    # 3. Fetch Reference Embeddings (decoded matrix cached in-process)
+    with tracker.stage("fetch_reference_embeddings"):
+        ref_embeddings, ref_cache_hit = get_reference_embeddings(storage, exercise_id, ref_video_id, model_path)
+    tracker.add_frames("fetch_reference_embeddings", len(ref_embeddings))
+    if len(ref_embeddings) == 0:
         raise ValueError(f"Reference video {ref_video_id} has no embeddings.")
 
     print(f"[Scoring] User Video ID: {user_video_id} (Frames: {len(user_embeddings)})")
     print(f"[Scoring] Ref Video ID:  {ref_video_id} (Frames: {len(ref_embeddings)})")
 
     # 4. Calculate Score
-    score = calculate_similarity(user_embeddings, ref_embeddings)
+    with tracker.stage("dtw", frames=len(user_embeddings)):
+        score = calculate_similarity(user_embeddings, ref_embeddings)
     print(f"[Scoring] Calculated Score: {score}")
     
     # 5. Record Session
@@ -93,7 +145,7 @@ def evaluate_session(user_video_id: str, exercise_id: str) -> Dict[str, any]:
     # Prompt says: "Create a Session edge in ArangoDB: User -> Exercise"
     
     # Need user_id from the user_video
-    video_doc = db.collection("Video").get(user_video_id)
+    video_doc = storage.videos.get(user_video_id)
     if not video_doc:
         raise ValueError("User video not found in DB.")
         
@@ -104,14 +156,18 @@ def evaluate_session(user_video_id: str, exercise_id: str) -> Dict[str, any]:
     from_id = user_id if "/" in user_id else f"User/{user_id}"
     to_id = exercise_id if "/" in exercise_id else f"Exercise/{exercise_id}"
     
+    # Keyed by the video: one Session per scored upload, so recording it again
+    # (e.g. a retried job) is a no-op instead of a second session in the stats
     session_data = {
+        "_key": user_video_id,
         "_from": from_id,
         "_to": to_id,
         "score": score,
         "user_video_id": user_video_id,
         "ref_video_id": ref_video_id,
         "timestamp": datetime.datetime.utcnow().isoformat(),
-        "model_type": "stgcn_simclr" 
+        "model_type": "stgcn_simclr",
+        "model_version": model_version_for(model_path) if model_path else None
     }
     
     # Insert edge
@@ -119,7 +175,12 @@ def evaluate_session(user_video_id: str, exercise_id: str) -> Dict[str, any]:
     # The collection is "Session" per init_db.py
     # NOTE: Session is an edge collection.
     
-    edge_meta = db.collection("Session").insert(session_data)
+    with tracker.stage("record_session"):
+        # Session edge + ExerciseUserStats / ExerciseRank aggregates in one transaction
+        edge_meta = storage.sessions.record(session_data)
+    
+    publish_progress(storage.videos, user_video_id, "done", tracker, stats_key="scoring", session_id=edge_meta["_id"],
+                     reference_cache_hit=ref_cache_hit)
     
     return {
         "score": score,
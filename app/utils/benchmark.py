@@ -5,6 +5,7 @@ import requests
 import base64
 import json
 from app.db.database import ArangoDBConnection
+from app.db.bulk_writer import bulk_import
 from app.db.orientdb_client import OrientDBClient
 
 
@@ -57,7 +58,7 @@ def run_arangodb_benchmark():
     docs = [{"_key": f"bench_{i}", "val": "x"*100} for i in range(NODE_COUNT)]
     
     start_arango = time.time()
-    arango_db.collection("BenchmarkNodes").import_bulk(docs)
+    bulk_import(arango_db.collection("BenchmarkNodes"), docs)
     arango_write_time = time.time() - start_arango
     
     # Wait for system to settle
@@ -113,8 +114,8 @@ def run_arangodb_benchmark():
     chain_docs = [{"_key": f"c_{i}"} for i in range(CHAIN_LEN + 1)]
     chain_edges = [{"_from": f"ChainNodes/c_{i}", "_to": f"ChainNodes/c_{i+1}"} for i in range(CHAIN_LEN)]
     
-    arango_db.collection("ChainNodes").import_bulk(chain_docs)
-    arango_db.collection("ChainEdges").import_bulk(chain_edges)
+    bulk_import(arango_db.collection("ChainNodes"), chain_docs)
+    bulk_import(arango_db.collection("ChainEdges"), chain_edges)
     
     # Setup Orient Chain
     # Batch insert simulation for speed? No, standard loop.
@@ -129,7 +130,7 @@ def run_arangodb_benchmark():
     
     # Optimization: Use a simpler key for lookup
     for i in range(CHAIN_LEN + 1):
-        orient.command(f"INSERT INTO V SET type='chain', idx={i}")
+        orient.command("INSERT INTO V SET type='chain', idx=:idx", {"idx": i})
         
     # Create Edges (0->1, 1->2...)
     # CREATE EDGE E FROM (SELECT FROM V WHERE type='chain' AND idx=0) TO (SELECT FROM V WHERE idx=1)
@@ -139,7 +140,7 @@ def run_arangodb_benchmark():
     
     # Let's do it in chunks or just accept the setup time.
     for i in range(CHAIN_LEN):
-        orient.command(f"CREATE EDGE E FROM (SELECT FROM V WHERE type='chain' AND idx={i}) TO (SELECT FROM V WHERE type='chain' AND idx={i+1})")
+        orient.command("CREATE EDGE E FROM (SELECT FROM V WHERE type='chain' AND idx=:src) TO (SELECT FROM V WHERE type='chain' AND idx=:dst)", {"src": i, "dst": i + 1})
 
     lineData = []
     
@@ -197,14 +198,14 @@ def run_arangodb_benchmark():
     start = time.time()
     for i in range(LATENCY_OPS):
         # Using SQL directly for single insert
-        orient.command(f"INSERT INTO V SET type='lat', benchmark_id='{i}', val='latency_test'")
+        orient.command("INSERT INTO V SET type='lat', benchmark_id=:id, val='latency_test'", {"id": str(i)})
     orient_avg_write = ((time.time() - start) / LATENCY_OPS) * 1000 # ms
     
     # Read
     start = time.time()
     for i in range(LATENCY_OPS):
         # Query by property (since RID is unknown)
-        orient.command(f"SELECT FROM V WHERE type='lat' AND benchmark_id='{i}' LIMIT 1")
+        orient.command("SELECT FROM V WHERE type='lat' AND benchmark_id=:id LIMIT 1", {"id": str(i)}, idempotent=True)
     orient_avg_read = ((time.time() - start) / LATENCY_OPS) * 1000 # ms
     
     # Cleanup Latency Data
@@ -265,3 +266,69 @@ def run_arangodb_benchmark():
         "latencyData": latencyData
     }
 
+
+def run_frame_edge_benchmark(frame_count: int = 5000, batch_size: int = 500):
+    """
+    Compares frame-format write throughput with materialized FrameEdge chains
+    (FRAME_EDGE_MODE=materialize) and without them (derive), and the cost of
+    reading the chain back through edges vs. the [video_id, frame_number] index.
+    Uses scratch collections; the real Frame / FrameEdge collections are not touched.
+    """
+    arango_db = ArangoDBConnection().get_db()
+    for name, edge in (("BenchFrame", False), ("BenchFrameEdge", True)):
+        if arango_db.has_collection(name):
+            arango_db.delete_collection(name)
+        arango_db.create_collection(name, edge=edge)
+    arango_db.collection("BenchFrame").add_index({"type": "persistent", "fields": ["video_id", "frame_number"]})
+
+    landmarks = [{"id": i, "x": random.random(), "y": random.random(), "z": random.random(), "visibility": 1.0} for i in range(33)]
+
+    def write(video_id: str, with_edges: bool) -> float:
+        frames = [{
+            "_key": f"{video_id}_{i}", "video_id": video_id, "frame_number": i,
+            "timestamp": i * 33.3, "pose_landmark": landmarks, "embeded_vector": None
+        } for i in range(frame_count)]
+        edges = [{
+            "_from": f"BenchFrame/{video_id}_{i - 1}", "_to": f"BenchFrame/{video_id}_{i}", "edge_type": "next"
+        } for i in range(1, frame_count)]
+        start = time.time()
+        for lo in range(0, frame_count, batch_size):
+            # One ingestion chunk at a time, like flush_chunk
+            bulk_import(arango_db.collection("BenchFrame"), frames[lo:lo + batch_size], chunk_size=batch_size)
+            if with_edges:
+                bulk_import(arango_db.collection("BenchFrameEdge"), edges[lo:lo + batch_size], chunk_size=batch_size)
+        return time.time() - start
+
+    results = {}
+    for mode, with_edges in (("materialize", True), ("derive", False)):
+        elapsed = write(f"bench_{mode}", with_edges)
+        results[mode] = {"seconds": round(elapsed, 3), "frames_per_second": round(frame_count / elapsed, 1) if elapsed else None}
+
+    # Chain read: edge traversal vs. index range scan
+    start = time.time()
+    list(arango_db.aql.execute(
+        "FOR v IN 1..@n OUTBOUND @start BenchFrameEdge RETURN v.frame_number",
+        bind_vars={"n": frame_count, "start": "BenchFrame/bench_materialize_0"}
+    ))
+    traversal_seconds = time.time() - start
+    start = time.time()
+    list(arango_db.aql.execute(
+        "FOR f IN BenchFrame FILTER f.video_id == @vid AND f.frame_number > 0 SORT f.frame_number RETURN f.frame_number",
+        bind_vars={"vid": "bench_derive"}
+    ))
+    index_seconds = time.time() - start
+
+    edge_bytes = arango_db.collection("BenchFrameEdge").statistics().get("documents_size", 0)
+    arango_db.delete_collection("BenchFrame")
+    arango_db.delete_collection("BenchFrameEdge")
+
+    results["write_speedup"] = round(results["materialize"]["seconds"] / results["derive"]["seconds"], 2) if results["derive"]["seconds"] else None
+    results["chain_read_seconds"] = {"edge_traversal": round(traversal_seconds, 4), "index_scan": round(index_seconds, 4)}
+    results["edge_storage_kb"] = round(edge_bytes / 1024, 1)
+    return results
+
+if __name__ == "__main__":
+    # python -m app.utils.benchmark [frame_count]
+    import sys
+    frames = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    print(json.dumps(run_frame_edge_benchmark(frames), indent=2))
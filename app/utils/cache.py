@@ -0,0 +1,151 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Directory of epoch files used to invalidate caches across processes (API + job workers).
+CACHE_EPOCH_DIR = os.getenv("CACHE_EPOCH_DIR", ".cache_epochs")
+
+_MISSING = object()
+
+class InvalidationEpoch:
+    """
+    A named, file-backed invalidation counter shared by all processes on the host.
+    bump() touches the epoch file; caches compare its mtime and drop their entries when it changed.
+    """
+    def __init__(self, name: str):
+        self.path = os.path.join(CACHE_EPOCH_DIR, f"{name}.epoch")
+
+    def current(self) -> int:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def bump(self):
+        os.makedirs(CACHE_EPOCH_DIR, exist_ok=True)
+        # Strictly increasing, even on filesystems with coarse timestamps
+        stamp = max(time.time_ns(), self.current() + 1)
+        with open(self.path, "w") as f:
+            f.write(str(stamp))
+        os.utime(self.path, ns=(stamp, stamp))
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with optional TTL, byte budget and cross-process epoch.
+
+    Args:
+        name: Name used in stats output.
+        max_entries: Maximum number of entries kept.
+        max_bytes: Optional memory budget; requires `sizeof`.
+        ttl: Optional entry lifetime in seconds.
+        sizeof: Returns the size in bytes of a value (e.g. lambda a: a.nbytes).
+        epoch: Optional InvalidationEpoch; a bump from any process clears this cache.
+    """
+    def __init__(self, name: str, max_entries: int = 128, max_bytes: Optional[int] = None, ttl: Optional[float] = None,
+                 sizeof: Optional[Callable[[Any], int]] = None, epoch: Optional[InvalidationEpoch] = None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self.epoch = epoch
+        self._seen_epoch = epoch.current() if epoch else 0
+        self._data = OrderedDict()  # key -> (value, size, expires_at)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    def _check_epoch(self):
+        if self.epoch is None:
+            return
+        current = self.epoch.current()
+        if current != self._seen_epoch:
+            self._seen_epoch = current
+            if self._data:
+                self.stats["invalidations"] += 1
+            self._data.clear()
+            self._bytes = 0
+
+    def _remove(self, key: Hashable):
+        _, size, _ = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            self._check_epoch()
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING and entry[2] is not None and entry[2] < time.monotonic():
+                self._remove(key)
+                entry = _MISSING
+            if entry is _MISSING:
+                self.stats["misses"] += 1
+                return default
+            self._data.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            return # Never fits; do not flush the whole cache for it
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._check_epoch()
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, expires_at)
+            self._bytes += size
+            while len(self._data) > self.max_entries or (self.max_bytes is not None and self._bytes > self.max_bytes):
+                self._remove(next(iter(self._data)))
+                self.stats["evictions"] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """
+        Read-through helper. `loader` results of None are not cached.
+        """
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def invalidate(self, key: Hashable = None, predicate: Optional[Callable[[Hashable], bool]] = None):
+        """
+        Drops one key, all keys matching `predicate`, or (with neither) everything in this process.
+        """
+        with self._lock:
+            if key is not None:
+                if key in self._data:
+                    self._remove(key)
+            elif predicate is not None:
+                for k in [k for k in self._data if predicate(k)]:
+                    self._remove(k)
+            else:
+                self._data.clear()
+                self._bytes = 0
+            self.stats["invalidations"] += 1
+
+    def invalidate_everywhere(self):
+        """
+        Clears this cache here and, through the epoch file, in every other process.
+        """
+        if self.epoch is not None:
+            self.epoch.bump()
+        self.invalidate()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return dict(
+                self.stats,
+                name=self.name,
+                pid=os.getpid(),
+                entries=len(self._data),
+                bytes=self._bytes,
+                max_entries=self.max_entries,
+                max_bytes=self.max_bytes,
+                hit_rate=(self.stats["hits"] / lookups) if lookups else 0.0
+            )
@@ -0,0 +1,128 @@
+import sys
+import os
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# Ensure the project root is in the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from fastapi import FastAPI
+from app.db.async_db import run_db, DB_POOL_SIZE
+
+# Load test for event-loop blocking.
+#
+# Starts a throwaway API with a slow "query" endpoint in two variants:
+#   /slow/blocking  - calls the DB directly inside `async def` (the old handler pattern)
+#   /slow/offloaded - awaits the same call through app.db.async_db.run_db
+# and a trivial /ping endpoint. While `--slow-clients` clients hammer one of the slow
+# endpoints, `--ping-clients` clients measure /ping latency. With the blocking variant
+# every ping waits for the in-flight slow query; with offloading the loop stays free.
+#
+# Usage:
+#   python app/utils/load_test.py                    # slow query = AQL RETURN SLEEP(s) on ArangoDB
+#   python app/utils/load_test.py --backend sleep    # no database needed (time.sleep)
+
+def make_slow_query(backend: str, seconds: float):
+    if backend == "sleep":
+        return lambda: time.sleep(seconds)
+    from app.db.database import ArangoDBConnection
+    db = ArangoDBConnection().get_db()
+    return lambda: list(db.aql.execute("RETURN SLEEP(@s)", bind_vars={"s": seconds}))
+
+def build_app(slow_query) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    @app.get("/slow/blocking")
+    async def slow_blocking():
+        slow_query()
+        return {"ok": True}
+
+    @app.get("/slow/offloaded")
+    async def slow_offloaded():
+        await run_db(slow_query)
+        return {"ok": True}
+
+    return app
+
+def start_server(app: FastAPI, port: int):
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+    return server, thread
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    idx = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[idx]
+
+def run_scenario(base_url: str, slow_path: str, duration: float, slow_clients: int, ping_clients: int):
+    stop_at = time.perf_counter() + duration
+    ping_latencies = []
+    slow_latencies = []
+    lock = threading.Lock()
+
+    def client(path, sink):
+        session = requests.Session()
+        while time.perf_counter() < stop_at:
+            start = time.perf_counter()
+            session.get(base_url + path, timeout=60)
+            elapsed = (time.perf_counter() - start) * 1000
+            with lock:
+                sink.append(elapsed)
+
+    with ThreadPoolExecutor(max_workers=slow_clients + ping_clients) as pool:
+        futures = [pool.submit(client, slow_path, slow_latencies) for _ in range(slow_clients)]
+        futures += [pool.submit(client, "/ping", ping_latencies) for _ in range(ping_clients)]
+        for f in futures:
+            f.result()
+
+    return {
+        "slow_endpoint": slow_path,
+        "ping_requests": len(ping_latencies),
+        "ping_p50_ms": round(percentile(ping_latencies, 50), 1),
+        "ping_p99_ms": round(percentile(ping_latencies, 99), 1),
+        "slow_requests": len(slow_latencies),
+        "slow_p99_ms": round(percentile(slow_latencies, 99), 1)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare p99 latency with blocking vs offloaded DB calls in async handlers.")
+    parser.add_argument("--backend", choices=["arango", "sleep"], default="arango")
+    parser.add_argument("--query-seconds", type=float, default=0.2, help="Duration of each slow query")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--slow-clients", type=int, default=DB_POOL_SIZE)
+    parser.add_argument("--ping-clients", type=int, default=4)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    app = build_app(make_slow_query(args.backend, args.query_seconds))
+    server, thread = start_server(app, args.port)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    print(f"Backend={args.backend}, query={args.query_seconds}s, slow clients={args.slow_clients}, "
+          f"ping clients={args.ping_clients}, DB_POOL_SIZE={DB_POOL_SIZE}")
+    try:
+        for path in ("/slow/blocking", "/slow/offloaded"):
+            result = run_scenario(base_url, path, args.duration, args.slow_clients, args.ping_clients)
+            print(f"{path:16s} ping p50={result['ping_p50_ms']}ms p99={result['ping_p99_ms']}ms "
+                  f"({result['ping_requests']} pings) | slow p99={result['slow_p99_ms']}ms "
+                  f"({result['slow_requests']} slow requests)")
+    finally:
+        server.should_exit = True
+        thread.join(5)
+
+if __name__ == "__main__":
+    main()
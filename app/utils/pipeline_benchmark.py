@@ -0,0 +1,168 @@
+import sys
+import os
+import time
+import uuid
+import json
+import argparse
+import datetime
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+# Ensure the project root is in the python path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.db.repositories import Storage, create_storage
+from app.services.frame_blocks import FRAME_STORAGE_FORMAT, FRAME_BLOCK_SIZE, NUM_LANDMARKS, EMBEDDING_DIM
+from app.services.progress import StageTracker
+
+# End-to-end throughput of the processing pipeline (frame writes, embedding, DTW scoring,
+# session recording) against a storage backend, without uploads or video decoding.
+#
+# Each synthetic video is a random walk of 33 landmarks. Frames go through the same
+# repository calls as ingestion (chunked write_chunk, packed embedding matrix, status updates)
+# and are then scored with evaluate_session against one reference video.
+# With the default in-memory backend no database is needed, so the numbers isolate the
+# compute pipeline; --backend arango measures the same run against ArangoDB.
+#
+# Embeddings are random unit vectors unless --embed is given, which runs the ST-GCN
+# StreamingEmbedder (needs torch). --video ingests a real file through process_video
+# instead (needs OpenCV / MediaPipe).
+#
+# Usage:
+#   python app/utils/pipeline_benchmark.py                          # 20 videos x 300 frames, in memory
+#   python app/utils/pipeline_benchmark.py --videos 100 --frames 900 --embed
+#   python app/utils/pipeline_benchmark.py --backend arango
+
+BENCH_EXERCISE_KEY = "pipeline_bench"
+# Model tag the synthetic embedding matrices are stored under
+BENCH_MODEL_PATH = "pipeline_bench.pth"
+
+def synthetic_landmarks(frames: int, rng: np.random.Generator) -> List[List[Dict[str, float]]]:
+    # Smooth random walk, so consecutive frames are similar like real poses
+    steps = rng.normal(0.0, 0.01, size=(frames, NUM_LANDMARKS, 3)).cumsum(axis=0) + rng.uniform(0.2, 0.8, size=(NUM_LANDMARKS, 3))
+    return [
+        [{"id": i, "x": float(p[0]), "y": float(p[1]), "z": float(p[2]), "visibility": 1.0} for i, p in enumerate(frame)]
+        for frame in steps
+    ]
+
+def _random_embedding(rng: np.random.Generator) -> List[float]:
+    v = rng.normal(size=EMBEDDING_DIM).astype(np.float32)
+    return (v / np.linalg.norm(v)).tolist()
+
+def ingest_synthetic(storage: Storage, tracker: StageTracker, user_id: str, exercise_id: str, frames: int,
+                     rng: np.random.Generator, embedder=None, is_reference: bool = False, fps: float = 30.0) -> str:
+    """
+    Writes one synthetic video through the repositories like ingestion.process_video does.
+    """
+    video_id = str(uuid.uuid4())
+    storage.videos.save({
+        "_key": video_id, "video_id": video_id, "uploader_user_id": user_id, "exercise_id": exercise_id,
+        "upload_time": datetime.datetime.utcnow().isoformat(), "fps": fps, "frame_count": frames,
+        "embedding_dimension": EMBEDDING_DIM, "is_reference": is_reference, "status": "processing",
+        "frame_storage": FRAME_STORAGE_FORMAT
+    })
+    with tracker.stage("synthesize", frames=frames):
+        landmarks = synthetic_landmarks(frames, rng)
+
+    with tracker.stage("embedding", frames=frames):
+        if embedder is not None:
+            embeddings = [None] * frames
+            for frame_landmarks in landmarks:
+                for idx, emb in embedder.push(frame_landmarks):
+                    embeddings[idx] = emb
+            for idx, emb in embedder.finish():
+                embeddings[idx] = emb
+        else:
+            embeddings = [_random_embedding(rng) for _ in range(frames)]
+
+    chunk_size = FRAME_BLOCK_SIZE
+    for lo in range(0, frames, chunk_size):
+        chunk = [({
+            "_key": f"{video_id}_{i}", "video_id": video_id, "frame_number": i, "timestamp": i / fps * 1000,
+            "pose_landmark": landmarks[i], "embeded_vector": embeddings[i]
+        }, None) for i in range(lo, min(lo + chunk_size, frames))]
+        with tracker.stage("db_write", frames=len(chunk)):
+            storage.frames.write_chunk(video_id, chunk, FRAME_STORAGE_FORMAT, fps, chunk_size)
+
+    rows = [e for e in embeddings if e is not None]
+    with tracker.stage("db_write"):
+        storage.frames.save_embedding_matrix(video_id, BENCH_MODEL_PATH, np.asarray(rows, dtype=np.float32))
+        storage.videos.update(video_id, {"status": "complete", "frame_count": frames})
+    return video_id
+
+def run_pipeline_benchmark(videos: int = 20, frames: int = 300, backend: str = "memory", embed: bool = False,
+                           video_path: Optional[str] = None, seed: int = 0) -> Dict[str, Any]:
+    """
+    Ingests and scores `videos` synthetic videos; returns throughput and per-stage timings.
+    """
+    from app.services.scoring import evaluate_session, invalidate_reference_cache
+
+    storage = create_storage(backend)
+    rng = np.random.default_rng(seed)
+    ingest_tracker = StageTracker()
+    user_id = "User/pipeline_bench"
+    exercise_id = f"Exercise/{BENCH_EXERCISE_KEY}"
+
+    def make_embedder():
+        if not embed:
+            return None
+        from app.services.inference import StreamingEmbedder, inference_service
+        return StreamingEmbedder(inference_service)
+
+    ref_video_id = ingest_synthetic(storage, ingest_tracker, "User/pipeline_bench_ref", exercise_id, frames, rng,
+                                    make_embedder(), is_reference=True)
+    storage.exercises.save({"_key": BENCH_EXERCISE_KEY, "name": "Pipeline Benchmark", "ref_video_id": ref_video_id})
+    invalidate_reference_cache(exercise_id)
+
+    model_path = BENCH_MODEL_PATH
+    if video_path:
+        # process_video embeds with the current model; the synthetic reference falls back to its frames
+        from app.services.inference import MODEL_PATH
+        model_path = MODEL_PATH
+
+    scores = []
+    score_seconds = 0.0
+    started = time.perf_counter()
+    for _ in range(videos):
+        if video_path:
+            from app.services.ingestion import process_video
+            video_id = str(uuid.uuid4())
+            with ingest_tracker.stage("process_video"):
+                process_video(video_path, user_id, exercise_id, model_path=model_path, video_id=video_id, storage=storage)
+        else:
+            video_id = ingest_synthetic(storage, ingest_tracker, user_id, exercise_id, frames, rng, make_embedder())
+        score_start = time.perf_counter()
+        result = evaluate_session(video_id, exercise_id, model_path=model_path, storage=storage)
+        score_seconds += time.perf_counter() - score_start
+        scores.append(result["score"])
+    elapsed = time.perf_counter() - started
+
+    total_frames = videos * frames
+    return {
+        "backend": storage.name,
+        "frame_storage": FRAME_STORAGE_FORMAT,
+        "videos": videos,
+        "frames_per_video": frames,
+        "embeddings": "stgcn" if embed else "random",
+        "seconds": round(elapsed, 3),
+        "videos_per_second": round(videos / elapsed, 2) if elapsed else None,
+        "frames_per_second": round(total_frames / elapsed, 1) if elapsed and not video_path else None,
+        "scoring_ms_per_video": round(1000 * score_seconds / videos, 2) if videos else None,
+        "mean_score": round(float(np.mean(scores)), 2) if scores else None,
+        "ingestion": ingest_tracker.report()
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure end-to-end ingestion + scoring throughput on a storage backend.")
+    parser.add_argument("--backend", choices=["memory", "arango"], default="memory")
+    parser.add_argument("--videos", type=int, default=20, help="Videos ingested and scored")
+    parser.add_argument("--frames", type=int, default=300, help="Frames per synthetic video")
+    parser.add_argument("--embed", action="store_true", help="Run the ST-GCN embedder instead of random embeddings")
+    parser.add_argument("--video", default=None, help="Ingest this video file via process_video instead of synthetic frames")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(json.dumps(run_pipeline_benchmark(args.videos, args.frames, args.backend, args.embed, args.video, args.seed), indent=2))
+
+if __name__ == "__main__":
+    main()
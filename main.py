@@ -7,7 +7,10 @@ import os
 load_dotenv()
 
 # Import Routers
-from app.routers import video, reference, auth, dashboard, admin
+from app.routers import video, reference, auth, dashboard, admin, jobs
+from app.services.jobs import init_queue, job_pool
+from app.services.replication import replicator
+from app.db.orientdb_client import OrientDBClient
 
 app = FastAPI(
     title="Pose Analysis System API",
@@ -16,6 +19,7 @@ app = FastAPI(
 )
 
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.middleware.gzip import GZipMiddleware
 
 # CORS (Allow all for development)
 app.add_middleware(
@@ -24,8 +28,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Frame-Start", "X-Frame-End"], # History pagination, frame ranges
 )
 
+# Compress larger responses (frame ranges, history exports) for clients sending Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
 # Session Middleware (Required for Google OAuth)
 # Ensure SECRET_KEY is set in .env
 app.add_middleware(SessionMiddleware, secret_key=os.getenv("SECRET_KEY", "CHANGE_THIS_IN_PRODUCTION_SECRET"))
@@ -36,6 +44,31 @@ app.include_router(dashboard.router, prefix="/api/v1", tags=["Dashboard"])
 app.include_router(admin.router, prefix="/api/v1/admin", tags=["Admin"])
 app.include_router(video.router, prefix="/api/v1/video", tags=["Video"])
 app.include_router(reference.router, prefix="/api/v1/reference", tags=["Reference"])
+app.include_router(jobs.router, prefix="/api/v1/jobs", tags=["Jobs"])
+
+@app.on_event("startup")
+def start_job_workers():
+    # Ingestion jobs run in a separate worker pool (JOB_WORKERS=0 to run it standalone)
+    init_queue()
+    job_pool.start()
+
+@app.on_event("startup")
+def start_replicator():
+    # Drains the OrientDB outbox (REPLICATION_ENABLED=0 to run it standalone)
+    replicator.start()
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    job_pool.stop()
+
+@app.on_event("shutdown")
+def stop_replicator():
+    replicator.stop()
+
+@app.on_event("shutdown")
+def close_orient_pool():
+    # After stop_replicator: the pool belongs to the sync client's loop thread
+    OrientDBClient().close()
 
 @app.get("/")
 def read_root():
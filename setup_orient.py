@@ -76,6 +76,14 @@ def create_admin_user(username, email, password):
     except Exception as e:
         print(f" - Admin ekleme hatası: {e}")
 
+def ensure_key_index(class_name):
+    # Arango '_key' değerleri üzerinde tekil indeks: kenar oluştururken _key aramaları taramaya dönüşmez
+    command(f"CREATE PROPERTY {class_name}._key IF NOT EXISTS STRING")
+    command(
+        f"CREATE INDEX {class_name}._key IF NOT EXISTS ON {class_name} (_key) UNIQUE_HASH_INDEX "
+        f'METADATA {{"ignoreNullValues": true}}'
+    )
+
 def create_schema():
     print(f" OrientDB'ye bağlanılıyor ({DB_HOST}:{DB_PORT})...")
     
@@ -89,6 +97,7 @@ def create_schema():
         schema = {
             "Exercise": "V",
             "Frame": "V",
+            "FrameBlock": "V",
             "Model": "V",
             "User": "V",
             "Video": "V",
@@ -109,6 +118,14 @@ def create_schema():
             else:
                 print(f"   Zaten var:   {class_name}")
 
+        print("\n _key indeksleri oluşturuluyor...")
+        for class_name in schema:
+            try:
+                ensure_key_index(class_name)
+                print(f"   İndeks hazır: {class_name}._key")
+            except Exception as e:
+                print(f"   İndeks hatası ({class_name}._key): {e}")
+
         print("\n OrientDB şeması başarıyla kuruldu!")
 
         # --- ADMIN PROMPT ---